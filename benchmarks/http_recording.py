@@ -0,0 +1,133 @@
+import os
+import json
+from rdflib import Namespace, URIRef, RDF
+from rdflib.namespace import SKOS
+from utilities.utilities import get_current_path
+from utilities.graph_cache import load_cached_graph
+from utilities.http_cache import HttpCache, request_key
+from modelet_1.scripts.piirrite_creation import OSM_WIKI_URL, _wiki_key_pages_params
+from modelet_1.scripts.piirrite_taginfo import TAGINFO_API_V4, _keys_all_params, _values_page_params
+
+# Construit l'enregistrement des réponses wiki/taginfo rejoué par l'étape de création du banc
+# d'essai (pipeline.py), sans accès au réseau : les réponses sont reconstituées à partir du
+# glossaire du dépôt (GoT.ttl) et des tuic (TBox2.ttl), sous les clés de cache des requêtes
+# qu'envoie piirrite_creation en mode séquentiel. Rejouer l'enregistrement refait donc le
+# glossaire du dépôt, avec le même nombre de pages et de requêtes.
+#
+# Ce ne sont pas des réponses capturées : les nombres d'occurences taginfo sont fictifs (juste
+# au-dessus des seuils, par ordre du glossaire) et les pages wiki ne contiennent que les
+# paramètres lus par piirrite_creation (description, éléments, combinaisons).
+
+piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
+
+GoT_file = get_current_path() + '/../modelet_1/GoT.ttl'
+TBox2_file = get_current_path() + '/../modelet_1/TBox2.ttl'
+HTTP_RECORDING_FILE = get_current_path() + '/fixtures/http_cache.sqlite'
+
+# seuils de piirrite_creation (filter_osm_keys, get_osm_keys_datas) et pages taginfo lues
+MIN_COUNT_ALL_KEYS = 100_000
+MIN_COUNT_ALL_VALUES = 10_000
+KEYS_ALL_RP = 999
+VALUES_RP = 200
+# révision des pages wiki enregistrées
+WIKI_REVISION = '1'
+
+def load_glossary(GoT_file:str = GoT_file, TBox2_file:str = TBox2_file) -> dict[str, dict]:
+    ''' Reads back, for each OSM key of the glossary, what the OSM wiki and taginfo gave for it.
+    Args:
+        GoT_file (str) : The path to the glossary (GoT.ttl).
+        TBox2_file (str) : The path to the tuic properties (TBox2.ttl).
+    Returns:
+        dict[str, dict] : For each key, its description and its values, each with its description and tuic keys.
+    '''
+    GoT_graph = load_cached_graph(GoT_file)
+    TBox2_graph = load_cached_graph(TBox2_file)
+    glossary: dict[str, dict] = {}
+    for scheme in GoT_graph.subjects(RDF.type, SKOS.ConceptScheme):
+        key = GoT_graph.value(scheme, piirrite.osmId)
+        if key is not None:
+            glossary[str(key)] = {'description': str(GoT_graph.value(scheme, SKOS.definition) or ''), 'values': {}}
+    for concept in GoT_graph.subjects(RDF.type, SKOS.Concept):
+        value = GoT_graph.value(concept, piirrite.osmId)
+        scheme = GoT_graph.value(concept, SKOS.inScheme)
+        key = GoT_graph.value(scheme, piirrite.osmId) if scheme is not None else None
+        if value is None or str(key) not in glossary:
+            continue
+        tuics = sorted({str(tuic_key)
+                        for tuic in GoT_graph.objects(concept, piirrite.hasRelatedOsmTag)
+                        for tuic_key in TBox2_graph.objects(URIRef(str(tuic)), piirrite.osmId)})
+        glossary[str(key)]['values'][str(value)] = {'description': str(GoT_graph.value(concept, SKOS.definition) or ''),
+                                                    'tuics': tuics}
+    return {key: glossary[key] for key in sorted(glossary)}
+
+def key_wikitext(key:str, description:str) -> str:
+    return (f'{{{{KeyDescription\n|key={key}\n|description={description}\n'
+            f'|onNode=yes\n|onWay=yes\n|onArea=yes\n}}}}\n')
+
+def value_wikitext(key:str, value:str, description:str, tuics:list[str]) -> str:
+    combination = ''.join(f'* {{{{Tag|{tuic}}}}}\n' for tuic in tuics)
+    return (f'{{{{ValueDescription\n|key={key}\n|value={value}\n|description={description}\n'
+            f'|combination=\n{combination}}}}}\n')
+
+def taginfo_page(data:list[dict], page:int, rp:int) -> dict:
+    return {'total': len(data), 'page': page, 'rp': rp, 'data': data[(page - 1) * rp:page * rp]}
+
+def put_json(http_cache:HttpCache, method:str, url:str, params:dict, body:dict) -> None:
+    http_cache.put(request_key(method, url, params), json.dumps(body).encode('utf-8'))
+
+def put_wikitext(http_cache:HttpCache, title:str, content:str) -> None:
+    # même forme que les pages enregistrées par piirrite_creation (_store_wikitexts)
+    http_cache.put(f'wiki:{title}', json.dumps([title, content]).encode('utf-8'), WIKI_REVISION)
+
+def build_http_recording(path:str = HTTP_RECORDING_FILE,
+                         GoT_file:str = GoT_file,
+                         TBox2_file:str = TBox2_file) -> dict[str, int]:
+    ''' Writes the wiki/taginfo recording replayed by the creation stage of the benchmark.
+    Args:
+        path (str) : The HTTP cache file to write (replaced if it exists).
+        GoT_file (str) : The path to the glossary (GoT.ttl).
+        TBox2_file (str) : The path to the tuic properties (TBox2.ttl).
+    Returns:
+        dict[str, int] : The number of keys, values and cache entries recorded.
+    '''
+    glossary = load_glossary(GoT_file, TBox2_file)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    if os.path.exists(path):
+        os.remove(path)
+    http_cache = HttpCache(path, ttl_s = None)
+    entries = 0
+    try:
+        # liste des pages Key:* du wiki, en une seule page
+        put_json(http_cache, 'GET', OSM_WIKI_URL, _wiki_key_pages_params(),
+                 {'batchcomplete': True, 'query': {'allpages': [{'ns': 0, 'title': f'Key:{key}'} for key in glossary]}})
+        # nombres d'occurences des clés, par ordre décroissant et au-dessus du seuil
+        keys_counts = [{'key': key, 'count_all': MIN_COUNT_ALL_KEYS + len(glossary) - rank}
+                       for rank, key in enumerate(glossary)]
+        for page in range(1, max(1, -(-len(keys_counts) // KEYS_ALL_RP)) + 1):
+            put_json(http_cache, 'GET', f'{TAGINFO_API_V4}/keys/all', _keys_all_params(page, KEYS_ALL_RP),
+                     taginfo_page(keys_counts, page, KEYS_ALL_RP))
+        entries += 1 + max(1, -(-len(keys_counts) // KEYS_ALL_RP))
+
+        for key, key_data in glossary.items():
+            put_wikitext(http_cache, f'Key:{key}', key_wikitext(key, key_data['description']))
+            values = list(key_data['values'])
+            values_counts = [{'value': value, 'count': MIN_COUNT_ALL_VALUES + len(values) - rank}
+                             for rank, value in enumerate(values)]
+            for page in range(1, max(1, -(-len(values_counts) // VALUES_RP)) + 1):
+                put_json(http_cache, 'GET', f'{TAGINFO_API_V4}/key/values', _values_page_params(key, page, VALUES_RP),
+                         taginfo_page(values_counts, page, VALUES_RP))
+                entries += 1
+            for value, value_data in key_data['values'].items():
+                put_wikitext(http_cache, f"Tag:{key}={value.replace('_', ' ')}",
+                             value_wikitext(key, value, value_data['description'], value_data['tuics']))
+            entries += 1 + len(values)
+    finally:
+        http_cache.close()
+
+    return {'keys': len(glossary), 'values': sum(len(key_data['values']) for key_data in glossary.values()),
+            'entries': entries}
+
+if __name__ == '__main__':
+    # enregistrement écrit : celui que rejoue pipeline.py par défaut
+    output_file = HTTP_RECORDING_FILE
+    print(build_http_recording(output_file))
@@ -0,0 +1,338 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import importlib
+import types
+import contextlib
+import multiprocessing
+from typing import Callable, Optional
+import rdflib
+from rdflib import Graph, Namespace, RDF
+from rdflib.namespace import SKOS
+from utilities.utilities import get_current_path
+from utilities.graph_cache import load_cached_graph
+from utilities.compiled_graph import load_compiled_graph
+from utilities.sparql_engine import run_sparql_query_in_graph
+from utilities.rdf_stream import TripleSink
+from utilities.geometry_store import GeometryStore
+from utilities.profiling import peak_rss_mb
+
+# Mesure chaque étape de la construction de PIIRRITE sur des données fixes :
+# chargement des TBox/TBox2/GoT, création rejouée depuis des réponses wiki/taginfo enregistrées,
+# instanciation des modelets 1 et 2, liaison des extrémités, BoT (modèle, données) et chaque SQ/*.sparql.
+#
+# Chaque étape tourne dans son propre processus : le pic de mémoire (RSS) est le sien, et les caches
+# en mémoire (lru_cache, index) ne passent pas d'une étape à l'autre. La préparation d'une étape
+# (ex. charger l'ABox avant une requête) n'est pas chronométrée mais compte dans son pic de mémoire.
+#
+# Les résultats sont comparés à une référence (BASELINE_FILE) : une étape plus lente que la référence
+# au-delà de la tolérance est signalée comme régression.
+
+piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
+osm = Namespace('https://www.openstreetmap.org/')
+
+ROOT_DIR = os.path.normpath(get_current_path() + '/..')
+MODELETS = ('modelet_1', 'modelet_2')
+FIXTURES_DIR = get_current_path() + '/fixtures'
+# réponses wiki/taginfo rejouées : un cache HTTP de piirrite_creation, reconstitué à partir du glossaire
+# par http_recording.py
+HTTP_RECORDING_FILE = FIXTURES_DIR + '/http_cache.sqlite'
+BASELINE_FILE = get_current_path() + '/baseline.json'
+REPORT_FILE = get_current_path() + '/last_run.json'
+
+class StageSkipped(Exception):
+    ''' Raised by the setup of a stage whose fixtures or dependencies are missing.
+    '''
+
+def osm_fixture(config:dict, modelet:str) -> str:
+    # extrait OSM d'un modelet : le sien parmi les fixtures, sinon celui commun aux deux modelets
+    # (ex. produit par synthetic_osm.py), à défaut celui des scripts
+    for fixture in (os.path.join(config['fixtures_dir'], f'{modelet}_osm_data_natif.ttl'),
+                    os.path.join(config['fixtures_dir'], 'osm_data_natif.ttl')):
+        if os.path.exists(fixture):
+            return fixture
+    return os.path.join(ROOT_DIR, modelet, 'scripts', 'osm_data_natif.ttl')
+
+def work_ABox(config:dict, modelet:str) -> str:
+    return os.path.join(config['work_dir'], modelet, 'ABox.ttl')
+
+def queried_ABox(config:dict, modelet:str) -> str:
+    # l'ABox produite par l'étape d'instanciation si elle a tourné, sinon celle du dépôt
+    ABox_file = work_ABox(config, modelet)
+    return ABox_file if os.path.exists(ABox_file) else os.path.join(ROOT_DIR, modelet, 'ABox.ttl')
+
+def require(path:str, what:str) -> str:
+    if not os.path.exists(path):
+        raise StageSkipped(f'{what} introuvable : {path}')
+    return path
+
+###########################
+# Étapes
+#
+# Chaque étape prépare ce dont elle a besoin puis renvoie la fonction chronométrée,
+# qui renvoie elle-même le nombre d'entités traitées (triplets, entités OSM, lignes…).
+
+def setup_loading(config:dict, modelet:str, file_name:str) -> Callable[[], int]:
+    path = require(os.path.join(ROOT_DIR, modelet, file_name), file_name)
+    def run() -> int:
+        return len(Graph().parse(path, format = 'turtle'))
+    return run
+
+def setup_creation(config:dict) -> Callable[[], int]:
+    recording = require(config['http_recording'], 'Enregistrement des réponses wiki/taginfo')
+    # copie : le rejeu ne touche pas à l'enregistrement
+    replayed = os.path.join(config['work_dir'], 'http_cache.sqlite')
+    shutil.copyfile(recording, replayed)
+    from utilities.http_cache import HttpCache
+    creation = importlib.import_module('modelet_1.scripts.piirrite_creation')
+    piirritev_graph = creation.init_piirritev_graph()
+    piirrite2_graph = creation.init_piirrite2_graph()
+    http_cache = HttpCache(replayed, offline = True)
+    def run() -> int:
+        creation.use_osm_wiki_to_fill_in_graphs(piirritev_graph, piirrite2_graph, http_cache, config['crawler'])
+        return len(set(piirritev_graph.subjects(RDF.type, SKOS.Concept)))
+    return run
+
+def instanciation_module(config:dict, modelet:str):
+    # le module d'instanciation, lu et écrit dans le répertoire de travail plutôt que dans le dépôt
+    module = importlib.import_module(f'{modelet}.scripts.piirrite_instanciation')
+    module.raw_data_file = require(osm_fixture(config, modelet), f'Extrait OSM du {modelet}')
+    module.ABox_file = work_ABox(config, modelet)
+    module.ABox_hashes_file = os.path.join(config['work_dir'], modelet, 'ABox.hashes.json')
+    if modelet == 'modelet_2':
+        module.previous_ABox_file = require(work_ABox(config, 'modelet_1'), 'ABox du modelet_1 (étape instanciation/modelet_1)')
+    os.makedirs(os.path.dirname(module.ABox_file), exist_ok = True)
+    return module
+
+def setup_instanciation(config:dict, modelet:str) -> Callable[[], int]:
+    module = instanciation_module(config, modelet)
+    SpatialEntity_type = piirrite.SpatialPoint if modelet == 'modelet_1' else osm.way
+    def run() -> int:
+        module.main(config['workers'], config['streaming'])
+        # graphe compilé écrit par main : compter les entités ne relit pas l'ABox
+        return len(set(load_compiled_graph(module.ABox_file).subjects(RDF.type, SpatialEntity_type)))
+    return run
+
+def setup_linking(config:dict) -> Callable[[], int]:
+    module = instanciation_module(config, 'modelet_2')
+    ABox_graph = load_cached_graph(require(work_ABox(config, 'modelet_2'), 'ABox du modelet_2 (étape instanciation/modelet_2)'))
+    geometry_store = GeometryStore.from_graph(ABox_graph)
+    osm_ways, _ = module.get_osm_entities(osm['way'], streaming = True)
+    SpatialSegments_SpatialPoints = [membership for osm_way, osmd_graph in osm_ways
+                                     for membership in module.get_SpatialSegment_memberships(osm_way, osmd_graph)]
+    sink = TripleSink(Graph())
+    def run() -> int:
+        module.link_SpatialSegments_extremities(SpatialSegments_SpatialPoints, geometry_store, sink)
+        return len(SpatialSegments_SpatialPoints)
+    return run
+
+def install_script_package() -> None:
+    # BoT.py importe les utilitaires sous script.utilities (le dépôt vu comme un paquet script) :
+    # un paquet script dont le chemin est la racine du dépôt les rend importables tels quels
+    if 'script' not in sys.modules:
+        script = types.ModuleType('script')
+        script.__path__ = [ROOT_DIR]
+        sys.modules['script'] = script
+
+def BoT_module(modelet:str):
+    require(os.path.join(ROOT_DIR, modelet, 'BoT.py'), f'BoT du {modelet}')
+    install_script_package()
+    try:
+        return importlib.import_module(f'{modelet}.BoT')
+    except ImportError as e:
+        raise StageSkipped(f'BoT non importable : {e}')
+
+def setup_BoT_model(config:dict, modelet:str) -> Callable[[], int]:
+    BoT = BoT_module(modelet)
+    TBox_graph = load_cached_graph(BoT.TBox_file)
+    GoT_graph = load_cached_graph(BoT.GoT_file)
+    def run() -> int:
+        BoT.model_unit_tests(TBox_graph, GoT_graph, False)
+        return len(TBox_graph) + len(GoT_graph)
+    return run
+
+def setup_BoT_data(config:dict, modelet:str) -> Callable[[], int]:
+    BoT = BoT_module(modelet)
+    graph = load_cached_graph([BoT.TBox_file, require(queried_ABox(config, modelet), f'ABox du {modelet}')])
+    def run() -> int:
+        BoT.data_unit_tests(graph, False)
+        return len(graph)
+    return run
+
+def setup_query(config:dict, modelet:str, SQ_file:str) -> Callable[[], int]:
+    graph = load_cached_graph(require(queried_ABox(config, modelet), f'ABox du {modelet}'))
+    query_path = os.path.join(ROOT_DIR, modelet, 'SQ', SQ_file)
+    def run() -> int:
+        result = run_sparql_query_in_graph(graph, query_path)
+        return len(result) if isinstance(result, list) else 1
+    return run
+
+def get_stages() -> list[tuple[str, Callable[..., Callable[[], int]], tuple]]:
+    # (nom, préparation, arguments de la préparation), dans l'ordre de la construction
+    stages = []
+    for modelet in MODELETS:
+        for file_name in ('TBox.ttl', 'TBox2.ttl', 'GoT.ttl'):
+            stages.append((f'load/{modelet}/{file_name}', setup_loading, (modelet, file_name)))
+    stages.append(('creation/modelet_1', setup_creation, ()))
+    for modelet in MODELETS:
+        stages.append((f'instanciation/{modelet}', setup_instanciation, (modelet,)))
+    stages.append(('linking/modelet_2', setup_linking, ()))
+    for modelet in MODELETS:
+        # seuls les modelets ayant un BoT.py ont des tests unitaires
+        if os.path.exists(os.path.join(ROOT_DIR, modelet, 'BoT.py')):
+            stages.append((f'BoT/{modelet}/model', setup_BoT_model, (modelet,)))
+            stages.append((f'BoT/{modelet}/data', setup_BoT_data, (modelet,)))
+        SQ_dir = os.path.join(ROOT_DIR, modelet, 'SQ')
+        for SQ_file in sorted(os.listdir(SQ_dir)) if os.path.isdir(SQ_dir) else []:
+            if SQ_file.endswith('.sparql'):
+                stages.append((f'query/{modelet}/{SQ_file.removesuffix(".sparql")}', setup_query, (modelet, SQ_file)))
+    return stages
+
+###########################
+# Mesure
+
+def select_stages(stages:Optional[list[str]] = None) -> list[str]:
+    # noms des étapes commençant par l'un des préfixes donnés, toutes par défaut
+    return [name for name, _, _ in get_stages()
+            if stages is None or any(name.startswith(prefix) for prefix in stages)]
+
+def run_stage(name:str, config:dict) -> dict:
+    ''' Runs one stage in the current process (a fresh one, see measure_stage).
+    Args:
+        name (str) : The name of the stage (see get_stages).
+        config (dict) : The run configuration.
+    Returns:
+        dict : The elapsed time, the number of entities, the throughput and the peak RSS,
+            or the reason why the stage was skipped or failed.
+    '''
+    setup, args = next((setup, args) for stage_name, setup, args in get_stages() if stage_name == name)
+    # les messages de progression des scripts ne sont pas affichés
+    with open(os.devnull, 'w', encoding = 'utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            run = setup(config, *args)
+        except StageSkipped as e:
+            return {'skipped': str(e)}
+        except Exception as e:
+            return {'failed': f'{type(e).__name__}: {e}'}
+        start = time.perf_counter()
+        try:
+            entities = run()
+        except Exception as e:
+            return {'failed': f'{type(e).__name__}: {e}'}
+        elapsed_s = time.perf_counter() - start
+    return {
+        'elapsed_s': elapsed_s,
+        'entities': entities,
+        'entities_per_s': entities / elapsed_s if elapsed_s > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def measure_stage(name:str, config:dict, repeats:int) -> dict:
+    # meilleur temps sur plusieurs exécutions, chacune dans un processus neuf
+    context = multiprocessing.get_context('spawn')
+    measures = []
+    for _ in range(repeats):
+        with context.Pool(1) as pool:
+            measure = pool.apply(run_stage, (name, config))
+        if 'skipped' in measure or 'failed' in measure:
+            return measure
+        measures.append(measure)
+    best = min(measures, key = lambda measure: measure['elapsed_s'])
+    rss = [measure['peak_rss_mb'] for measure in measures if measure['peak_rss_mb'] is not None]
+    return dict(best, peak_rss_mb = max(rss) if rss else None)
+
+def compare_to_baseline(results:dict[str, dict], baseline:dict[str, dict]) -> dict[str, float]:
+    ''' Returns the ratio current time / baseline time of every stage measured in both runs.
+    '''
+    ratios = {}
+    for name, result in results.items():
+        reference = baseline.get(name, {})
+        if 'elapsed_s' in result and reference.get('elapsed_s'):
+            ratios[name] = result['elapsed_s'] / reference['elapsed_s']
+    return ratios
+
+def display_results(results:dict[str, dict], ratios:dict[str, float], tolerance:float) -> None:
+    width = max(len(name) for name in results)
+    print(f'\n{"étape":<{width}}  {"temps (s)":>10}  {"entités/s":>12}  {"RSS (Mio)":>10}  {"/ réf.":>7}')
+    for name, result in results.items():
+        if 'skipped' in result:
+            print(f'{name:<{width}}  ignorée : {result["skipped"]}')
+            continue
+        if 'failed' in result:
+            print(f'{name:<{width}}  échec : {result["failed"]}')
+            continue
+        throughput = f'{result["entities_per_s"]:,.0f}' if result['entities_per_s'] is not None else '-'
+        rss = f'{result["peak_rss_mb"]:.0f}' if result['peak_rss_mb'] is not None else '-'
+        ratio = f'×{ratios[name]:.2f}' if name in ratios else '-'
+        flag = '  ⚠️ régression' if ratios.get(name, 0) > tolerance else ''
+        print(f'{name:<{width}}  {result["elapsed_s"]:>10.3f}  {throughput:>12}  {rss:>10}  {ratio:>7}{flag}')
+
+def main(stages:Optional[list[str]] = None,
+         repeats:int = 1,
+         tolerance:float = 1.2,
+         update_baseline:bool = False,
+         workers:int = 1,
+         streaming:bool = False,
+         crawler:bool = False,
+         http_recording:str = HTTP_RECORDING_FILE,
+         fixtures_dir:str = FIXTURES_DIR) -> dict[str, dict]:
+    names = select_stages(stages)
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = {'work_dir': work_dir, 'workers': workers, 'streaming': streaming,
+                  'crawler': crawler, 'http_recording': http_recording, 'fixtures_dir': fixtures_dir}
+        for name in names:
+            print(f'{name}…')
+            results[name] = measure_stage(name, config, repeats)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r', encoding = 'utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    ratios = compare_to_baseline(results, baseline)
+    display_results(results, ratios, tolerance)
+
+    report = {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'platform': platform.platform(),
+        'config': {'repeats': repeats, 'workers': workers, 'streaming': streaming, 'crawler': crawler},
+        'results': results,
+    }
+    with open(REPORT_FILE, 'w', encoding = 'utf-8') as report_file:
+        json.dump(report, report_file, indent = 2)
+    # sans référence, la première mesure en devient une ; une mesure dont des étapes ont été
+    # ignorées ou ont échoué n'en devient jamais une, les régressions de ces étapes passeraient inaperçues
+    incomplete = [name for name, result in results.items() if 'skipped' in result or 'failed' in result]
+    if (update_baseline or not baseline) and incomplete:
+        print(f'\nRéférence non enregistrée : {len(incomplete)} étape(s) ignorée(s) ou en échec.')
+    elif update_baseline or not baseline:
+        with open(BASELINE_FILE, 'w', encoding = 'utf-8') as baseline_file:
+            json.dump(report, baseline_file, indent = 2)
+        print(f'\nRéférence enregistrée : {BASELINE_FILE}')
+    regressions = [name for name, ratio in ratios.items() if ratio > tolerance]
+    if regressions:
+        print(f'\n{len(regressions)} étape(s) plus lente(s) que la référence de plus de {tolerance - 1:.0%}.')
+
+    return results
+
+if __name__ == '__main__':
+    # stages = None : toutes les étapes ; sinon les préfixes des étapes à mesurer (ex. ['instanciation', 'query/modelet_2'])
+    stages = None
+    # nombre d'exécutions par étape, le meilleur temps est retenu
+    repeats = 1
+    # rapport temps mesuré / temps de référence au-delà duquel une étape est signalée
+    tolerance = 1.2
+    # update_baseline = True : la mesure remplace la référence
+    update_baseline = False
+    # options de l'instanciation (voir piirrite_instanciation.py)
+    workers = 1
+    streaming = False
+    # crawler = True : la création est rejouée avec le crawler asyncio (voir piirrite_creation.py)
+    crawler = False
+    main(stages, repeats, tolerance, update_baseline, workers, streaming, crawler)
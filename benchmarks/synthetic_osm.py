@@ -0,0 +1,262 @@
+import os
+import math
+import random
+import tempfile
+from typing import Optional
+from rdflib import Namespace, URIRef, RDF
+from rdflib.namespace import SKOS
+from utilities.utilities import get_current_path
+from utilities.graph_cache import load_cached_graph
+from utilities.rdf_stream import replace_file
+
+# Génère des extraits OSM synthétiques au format d'osm2rdf (osm_data_natif.ttl), de taille voulue,
+# pour mesurer l'instanciation et les requêtes bien au-delà de l'extrait du campus.
+# - les étiquettes des nœuds et des chemins sont tirées parmi les concepts du GoT (clé = osmId du
+#   schéma, valeur = osmId du concept), selon une loi de Zipf comme dans les données réelles,
+#   accompagnées d'une partie de leurs tuic (TBox2)
+# - chaque chemin passe par des nœuds voisins : sa géométrie (LINESTRING ou POLYGON) suit leurs
+#   coordonnées, et ses extrémités sont souvent celles d'un chemin déjà créé
+# Le fichier est écrit au fil de l'eau, sans graphe rdflib : sa taille n'est limitée que par le disque.
+
+piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
+
+GoT_file = get_current_path() + '/../modelet_1/GoT.ttl'
+TBox2_file = get_current_path() + '/../modelet_1/TBox2.ttl'
+FIXTURES_DIR = get_current_path() + '/fixtures'
+
+OSM2RDF_PREFIXES = '''@prefix osmnode: <https://www.openstreetmap.org/node/> .
+@prefix osmway: <https://www.openstreetmap.org/way/> .
+@prefix osmkey: <https://www.openstreetmap.org/wiki/Key:> .
+@prefix osm: <https://www.openstreetmap.org/> .
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix geo: <http://www.opengis.net/ont/geosparql#> .
+@prefix ogc: <http://www.opengis.net/rdf#> .
+@prefix osm2rdfgeom: <https://osm2rdf.cs.uni-freiburg.de/rdf/geom#> .
+'''
+
+# centre de l'extrait du campus (longitude, latitude) et densité de ses nœuds
+CAMPUS_CENTER = (4.8705, 45.7835)
+NODES_PER_KM2 = 4_000
+# schémas de concepts des étiquettes des chemins, linéaires puis surfaciques
+LINE_SCHEMES = ('highway', 'footway', 'railway', 'waterway', 'barrier')
+AREA_SCHEMES = ('building', 'amenity', 'landuse', 'leisure', 'parking')
+# valeurs des tuic et des étiquettes libres
+TUIC_VALUES = ('yes', 'no', '0', '1', '2', '4', '12', '-1', '2.5', 'wood', 'metal', 'red', 'public', 'private')
+
+def load_tag_distribution(GoT_file:str = GoT_file, TBox2_file:str = TBox2_file) -> list[tuple[str, str, tuple[str, ...]]]:
+    ''' Lists the OSM tags known to the glossary, with the keys usable in combination with each one.
+    Args:
+        GoT_file (str) : The path to the glossary (GoT.ttl).
+        TBox2_file (str) : The path to the tuic properties (TBox2.ttl).
+    Returns:
+        list[tuple[str, str, tuple[str, ...]]] : The (key, value, tuic keys) of each concept, sorted.
+    '''
+    GoT_graph = load_cached_graph(GoT_file)
+    TBox2_graph = load_cached_graph(TBox2_file)
+    tags = []
+    for concept in GoT_graph.subjects(RDF.type, SKOS.Concept):
+        value = GoT_graph.value(concept, piirrite.osmId)
+        scheme = GoT_graph.value(concept, SKOS.inScheme)
+        key = GoT_graph.value(scheme, piirrite.osmId) if scheme is not None else None
+        if value is None or key is None:
+            continue
+        tuics = sorted({str(tuic_key)
+                        for tuic in GoT_graph.objects(concept, piirrite.hasRelatedOsmTag)
+                        for tuic_key in TBox2_graph.objects(URIRef(str(tuic)), piirrite.osmId)})
+        tags.append((str(key), str(value), tuple(tuics)))
+    return sorted(tags)
+
+def zipf_weights(n:int, exponent:float = 1.0) -> list[float]:
+    return [1 / (rank + 1) ** exponent for rank in range(n)]
+
+def literal(value:str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def sample_tags(rng:random.Random,
+                tags:list[tuple[str, str, tuple[str, ...]]],
+                weights:list[float],
+                tuic_ratio:float,
+                values_by_key:dict[str, list[str]]) -> dict[str, str]:
+    # une étiquette principale et une partie de ses tuic ; un tuic qui est aussi une clé
+    # du glossaire prend l'une de ses valeurs
+    key, value, tuics = rng.choices(tags, weights)[0]
+    entity_tags = {key: value}
+    for tuic in tuics:
+        if tuic in entity_tags or rng.random() >= tuic_ratio:
+            continue
+        if tuic in values_by_key:
+            entity_tags[tuic] = rng.choice(values_by_key[tuic])
+        elif tuic == 'name':
+            entity_tags[tuic] = f'Synthetic {rng.randrange(10_000)}'
+        else:
+            entity_tags[tuic] = rng.choice(TUIC_VALUES)
+    return entity_tags
+
+def write_entity(file, prefix:str, entity_id:int, rdf_type:str, entity_tags:dict[str, str], wkt:str) -> None:
+    entity = f'{prefix}:{entity_id}'
+    geometry = f'osm2rdfgeom:osm_{prefix.removeprefix("osm")}_{entity_id}'
+    lines = [f'{entity} rdf:type osm:{rdf_type} .\n']
+    lines.extend(f'{entity} osmkey:{key} {literal(value)} .\n' for key, value in sorted(entity_tags.items()))
+    lines.append(f'{entity} geo:hasGeometry {geometry} .\n')
+    lines.append(f'{geometry} geo:asWKT "{wkt}"^^geo:wktLiteral .\n')
+    file.write(''.join(lines))
+
+def write_spatial_relations(file, ways_nodes:list[tuple[int, list[int]]]) -> None:
+    # comme osm2rdf, les relations spatiales forment une section finale, après toutes les entités
+    file.write('\n')
+    for way_id, node_ids in ways_nodes:
+        file.write(''.join(f'osmway:{way_id} ogc:sfContains osmnode:{node_id} .\n' for node_id in node_ids))
+
+def generate_osm_extract(path:str,
+                         n_nodes:int = 3_600,
+                         n_ways:Optional[int] = None,
+                         seed:int = 0,
+                         tagged_ratio:float = 0.5,
+                         tuic_ratio:float = 0.3,
+                         polygon_ratio:float = 0.2,
+                         shared_endpoint_ratio:float = 0.6,
+                         center:tuple[float, float] = CAMPUS_CENTER,
+                         tags:Optional[list[tuple[str, str, tuple[str, ...]]]] = None) -> dict[str, int]:
+    ''' Writes a synthetic osm2rdf-shaped extract: nodes with a POINT geometry, then ways whose
+    LINESTRING or POLYGON goes through the coordinates of the nodes they contain, then, as osm2rdf
+    does, the spatial relations of the ways (ogc:sfContains) in a final section.
+    The nodes are spread over a square around center, as dense as on the campus extract.
+    Args:
+        path (str) : The file to write.
+        n_nodes (int) : The number of nodes.
+        n_ways (int | None) : The number of ways, n_nodes / 25 by default.
+        seed (int) : The seed of the random generator: a seed and a size always give the same file.
+        tagged_ratio (float) : The share of nodes with tags (every way has some).
+        tuic_ratio (float) : The probability of each tuic of a tag to be set.
+        polygon_ratio (float) : The share of closed ways (POLYGON).
+        shared_endpoint_ratio (float) : The share of ways starting at an endpoint of a previous way.
+        center (tuple[float, float]) : The (longitude, latitude) of the center of the extract.
+        tags (list | None) : The tag distribution (see load_tag_distribution), read from the glossary by default.
+    Returns:
+        dict[str, int] : The number of nodes, ways and triples written.
+    '''
+    rng = random.Random(seed)
+    n_ways = n_nodes // 25 if n_ways is None else n_ways
+    tags = load_tag_distribution() if tags is None else tags
+    # les étiquettes fréquentes ne sont pas les premières de l'ordre alphabétique
+    tags = rng.sample(tags, len(tags))
+    weights = zipf_weights(len(tags))
+    line_tags = [tag for tag in tags if tag[0] in LINE_SCHEMES] or tags
+    area_tags = [tag for tag in tags if tag[0] in AREA_SCHEMES] or tags
+    line_weights, area_weights = zipf_weights(len(line_tags)), zipf_weights(len(area_tags))
+    values_by_key: dict[str, list[str]] = {}
+    for key, value, _ in sorted(tags):
+        values_by_key.setdefault(key, []).append(value)
+
+    # emprise carrée de même densité que le campus
+    side_km = math.sqrt(max(n_nodes, 1) / NODES_PER_KM2)
+    half_lat = side_km / 2 / 111.32
+    half_lon = half_lat / math.cos(math.radians(center[1]))
+    coordinates = [(round(center[0] + rng.uniform(-half_lon, half_lon), 6),
+                    round(center[1] + rng.uniform(-half_lat, half_lat), 6)) for _ in range(n_nodes)]
+    # nœuds rangés en serpentin, rangée par rangée : des positions proches sont des nœuds voisins
+    rows = max(1, int(math.sqrt(n_nodes)))
+    def serpentine_key(i:int) -> tuple[int, float]:
+        row = min(int((coordinates[i][1] - center[1] + half_lat) / (2 * half_lat) * rows), rows - 1)
+        return row, coordinates[i][0] if row % 2 == 0 else -coordinates[i][0]
+    order = sorted(range(n_nodes), key = serpentine_key)
+    first_node_id, first_way_id = 1_000_000_000, 900_000
+    triples = 0
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding = 'utf-8') as file:
+            file.write(OSM2RDF_PREFIXES)
+            for i, (lon, lat) in enumerate(coordinates):
+                entity_tags = sample_tags(rng, tags, weights, tuic_ratio, values_by_key) if rng.random() < tagged_ratio else {}
+                write_entity(file, 'osmnode', first_node_id + i, 'node', entity_tags, f'POINT({lon:.6f} {lat:.6f})')
+                triples += 3 + len(entity_tags)
+
+            # positions (dans le serpentin) des extrémités des chemins déjà écrits
+            endpoint_positions: list[int] = []
+            # nœuds de chaque chemin, écrits dans la section des relations spatiales
+            ways_nodes: list[tuple[int, list[int]]] = []
+            for way in range(n_ways if n_nodes >= 3 else 0):
+                is_polygon = rng.random() < polygon_ratio
+                min_nodes = 3 if is_polygon else 2
+                if endpoint_positions and rng.random() < shared_endpoint_ratio:
+                    position = rng.choice(endpoint_positions)
+                else:
+                    position = rng.randrange(n_nodes)
+                # nœuds suivants le long du serpentin, à petits pas
+                positions = [position]
+                for _ in range(rng.randint(min_nodes - 1, 6)):
+                    positions.append(min(positions[-1] + rng.randint(1, 3), n_nodes - 1))
+                positions = list(dict.fromkeys(positions))
+                if len(positions) < min_nodes:
+                    positions = list(range(n_nodes - min_nodes, n_nodes))
+                way_nodes = [order[position] for position in positions]
+
+                # coordonnées séparées par une virgule seule, comme les écrit osm2rdf
+                points = [f'{coordinates[node][0]:.6f} {coordinates[node][1]:.6f}' for node in way_nodes]
+                if is_polygon:
+                    wkt = f'POLYGON(({",".join(points + points[:1])}))'
+                else:
+                    wkt = f'LINESTRING({",".join(points)})'
+                    endpoint_positions.extend((positions[0], positions[-1]))
+                entity_tags = sample_tags(rng, area_tags, area_weights, tuic_ratio, values_by_key) if is_polygon \
+                    else sample_tags(rng, line_tags, line_weights, tuic_ratio, values_by_key)
+                write_entity(file, 'osmway', first_way_id + way, 'way', entity_tags, wkt)
+                ways_nodes.append((first_way_id + way, [first_node_id + node for node in way_nodes]))
+                triples += 3 + len(entity_tags) + len(way_nodes)
+            write_spatial_relations(file, ways_nodes)
+        replace_file(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    return {'nodes': n_nodes, 'ways': n_ways if n_nodes >= 3 else 0, 'triples': triples}
+
+def measure_scaling(sizes:list[int],
+                    stages:tuple[str, ...] = ('instanciation', 'linking', 'query'),
+                    repeats:int = 1,
+                    seed:int = 0) -> dict[int, dict[str, dict]]:
+    ''' Measures benchmark stages (see pipeline.py) on synthetic extracts of growing size.
+    Args:
+        sizes (list[int]) : The numbers of nodes of the extracts.
+        stages (tuple[str, ...]) : The prefixes of the stages to measure.
+        repeats (int) : The number of runs of each stage, the best one being kept.
+        seed (int) : The seed of the extracts.
+    Returns:
+        dict[int, dict[str, dict]] : The measures of each stage, by number of nodes.
+    '''
+    from benchmarks.pipeline import select_stages, measure_stage
+    tags = load_tag_distribution()
+    curves: dict[int, dict[str, dict]] = {}
+    for n_nodes in sizes:
+        with tempfile.TemporaryDirectory() as fixtures_dir, tempfile.TemporaryDirectory() as work_dir:
+            counts = generate_osm_extract(os.path.join(fixtures_dir, 'osm_data_natif.ttl'), n_nodes, seed = seed, tags = tags)
+            print(f'{counts["nodes"]} nœuds, {counts["ways"]} chemins, {counts["triples"]} triplets')
+            config = {'work_dir': work_dir, 'workers': 1, 'streaming': False, 'crawler': False,
+                      'http_recording': '', 'fixtures_dir': fixtures_dir}
+            # les requêtes et le BoT portent sur les ABox instanciées à partir de l'extrait
+            curves[n_nodes] = {name: measure_stage(name, config, repeats) for name in select_stages(list(stages))}
+            for name, measure in curves[n_nodes].items():
+                if 'elapsed_s' in measure:
+                    print(f'  {name} : {measure["elapsed_s"]:.3f} s, {measure["entities_per_s"] or 0:,.0f} entités/s, '
+                          f'{measure["peak_rss_mb"] or 0:.0f} Mio')
+    return curves
+
+if __name__ == '__main__':
+    # nombre de nœuds et de chemins (None : un chemin pour 25 nœuds, comme sur le campus)
+    n_nodes = 3_600
+    n_ways = None
+    # une graine et une taille donnent toujours le même fichier
+    seed = 0
+    # fichier écrit : les fixtures du banc d'essai (pipeline.py), ou modelet_*/scripts/osm_data_natif.ttl
+    # pour le donner directement aux scripts d'instanciation
+    output_file = FIXTURES_DIR + '/osm_data_natif.ttl'
+    # scaling_sizes = [..] : mesure plutôt les étapes du banc d'essai sur des extraits de ces tailles
+    scaling_sizes = None
+    if scaling_sizes:
+        measure_scaling(scaling_sizes)
+    else:
+        print(generate_osm_extract(output_file, n_nodes, n_ways, seed))
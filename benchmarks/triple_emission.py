@@ -0,0 +1,74 @@
+import os
+import time
+import tempfile
+from rdflib import Graph, URIRef
+from utilities.utilities import get_current_path
+from utilities.graph_cache import load_cached_graph
+from utilities.rdf_stream import open_rdf_writer, TripleSink, WRITE_BATCH_SIZE
+
+# Compare l'écriture dans l'ABox des triplets de l'instanciation, entité par entité :
+# - 'add' : un Graph.add par triplet, puis écriture de l'entité et vidage du graphe
+#   (ce que faisaient les scripts d'instanciation)
+# - 'batch' : les triplets de chaque entité en une liste, confiée à un TripleSink qui les écrit par lots
+# Sans fichier, un TripleSink ajoute simplement les triplets au graphe (pas de lots) : ce cas n'est pas mesuré.
+# Les entités sont rejouées depuis une ABox existante (sa description bornée par sujet),
+# sans dépendre des données OSM natives.
+
+ABox_file = get_current_path() + '/../modelet_1/ABox.ttl'
+
+def get_entities_triples(ABox_graph:Graph) -> list[list[tuple]]:
+    # triplets de chaque entité (sujet IRI), nœuds anonymes compris
+    return [list(ABox_graph.cbd(entity))
+            for entity in sorted({s for s in ABox_graph.subjects() if isinstance(s, URIRef)})]
+
+def emit_with_add(entities_triples:list[list[tuple]], namespaces:dict, ABox_format:str) -> None:
+    piirrited_graph = Graph()
+    with tempfile.TemporaryDirectory() as directory:
+        with open_rdf_writer(os.path.join(directory, 'ABox'), namespaces, ABox_format) as write_block:
+            for triples in entities_triples:
+                for triple in triples:
+                    piirrited_graph.add(triple)
+                write_block(piirrited_graph)
+                piirrited_graph.remove((None, None, None))
+
+def emit_with_batches(entities_triples:list[list[tuple]], namespaces:dict, ABox_format:str,
+                      batch_size:int = WRITE_BATCH_SIZE) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        with open_rdf_writer(os.path.join(directory, 'ABox'), namespaces, ABox_format) as write_block:
+            sink = TripleSink(write_block = write_block, batch_size = batch_size)
+            for triples in entities_triples:
+                sink.add(triples)
+            sink.flush()
+
+def best_time(function, repeats:int, *args) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main(ABox_file:str = ABox_file, repeats:int = 3, batch_size:int = WRITE_BATCH_SIZE) -> dict[str, dict[str, float]]:
+    ABox_graph = load_cached_graph(ABox_file)
+    namespaces = dict(ABox_graph.namespaces())
+    entities_triples = get_entities_triples(ABox_graph)
+    n_triples = sum(len(triples) for triples in entities_triples)
+    print(f'{len(entities_triples)} entités, {n_triples} triplets ({ABox_file})')
+
+    results:dict[str, dict[str, float]] = {}
+    for ABox_format in ('turtle', 'nt'):
+        label = ABox_format
+        add_time = best_time(emit_with_add, repeats, entities_triples, namespaces, ABox_format)
+        batch_time = best_time(emit_with_batches, repeats, entities_triples, namespaces, ABox_format, batch_size)
+        results[label] = {'add_s': add_time, 'batch_s': batch_time, 'speedup': add_time / batch_time}
+        print(f'{label:>8} : add {add_time:.3f} s, lots {batch_time:.3f} s, '
+              f'{n_triples / batch_time:,.0f} triplets/s, ×{add_time / batch_time:.1f}')
+
+    return results
+
+if __name__ == '__main__':
+    # nombre de mesures par variante, la meilleure est retenue
+    repeats = 3
+    # triplets en attente au-delà desquels un lot est écrit
+    batch_size = WRITE_BATCH_SIZE
+    main(ABox_file, repeats, batch_size)
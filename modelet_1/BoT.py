@@ -1,9 +1,13 @@
 import os
 import types
+from typing import Union
 from rdflib import Graph
 from argparse import ArgumentParser
 from rdflib import Namespace, RDF, RDFS, OWL, SKOS, XSD, Literal, URIRef
 from script.utilities.utilities import get_current_path, run_sparql_query, is_camel_case, flatten
+from script.utilities.graph_cache import load_cached_graph
+from script.utilities.sparql_engine import run_sparql_queries
+from script.utilities.profiling import stage, profiled_main
 
 CURRENT_PATH = get_current_path()
 CURRENT_DIR = CURRENT_PATH.split("\\")[-1]
@@ -873,10 +877,8 @@ def model_test(verbose: bool = False) -> None:
          verbose (bool): wether to print detailed informations about the execution.
      """
     try:
-        incit_graph = Graph()
-        incit_graph.parse(TBox_file, format = 'turtle', encoding = 'utf-8')
-        incitv_graph = Graph()
-        incitv_graph.parse(GoT_file, format = 'turtle', encoding = 'utf-8')
+        incit_graph = load_cached_graph(TBox_file)
+        incitv_graph = load_cached_graph(GoT_file)
         if not model_unit_tests(incit_graph, incitv_graph, verbose):
             raise Exception("failed unit tests")
         print(f"🟩 Passed model test")
@@ -889,9 +891,7 @@ def data_test(verbose: bool = False) -> None:
         verbose (bool): wether to print detailed informations about the execution.
     """
     try:
-        g = Graph()
-        g.parse(TBox_file, format = 'turtle')
-        g.parse(ABox_file, format = 'turtle')
+        g = load_cached_graph([TBox_file, ABox_file])
         if not data_unit_tests(g, verbose):
             raise Exception("failed unit tests")
         print(f"🟩 Passed data test")
@@ -899,11 +899,12 @@ def data_test(verbose: bool = False) -> None:
         print(f"🟥 Failed data test{': ' + str(e) if verbose else ''}")
 
 def print_sparql_result(SQ_file: str,
-                        result: list) -> None:
+                        result: Union[bool, list]) -> None:
     """ Prints the result of a SPARQL query along with its natural language question.
     Args:
         SQ_file (str): The name of the SPARQL query file. It is used to extract the natural language question.
-        result (list): The result of the SPARQL query as a list of strings.
+        result (bool | list): The result of the SPARQL query: the answer of an ASK query or the rows of a SELECT
+            query as dicts (in-process engine), or the output lines of Apache Jena.
     """
     CQ_id = SQ_file.removesuffix('.sparql')
     CQ_natural = None
@@ -916,42 +917,64 @@ def print_sparql_result(SQ_file: str,
     if CQ_natural is None:
         raise Exception(f"Incorrect structure: missing natural language question after '# {CQ_id}'")
     print(f"{CQ_id}: {CQ_natural}") # type: ignore
-    for line in result[2:]:
-        line = line.strip((' |-='))
-        if line != '':
-            if '^^' in line:
-                line = line.split('^^')[0]
-            print(line)
-
-def query_test(verbose: bool = False) -> None:
+    if isinstance(result, bool):
+        print("Yes" if result else "No")
+    elif result and isinstance(result[0], dict):
+        for row in result:
+            print(" | ".join('' if value is None else str(value) for value in row.values()))
+    else:
+        for line in result[2:]:
+            line = line.strip((' |-='))
+            if line != '':
+                if '^^' in line:
+                    line = line.split('^^')[0]
+                print(line)
+
+def query_test(verbose: bool = False,
+               jena: bool = False) -> None:
     """ Runs the formal query test for the given modelet.
+    The ABox is loaded once and all the queries run in process, unless Apache Jena is asked for.
     Args:
         verbose (bool): wether to print detailed informations about the execution.
+        jena (bool): wether to run each query with the Apache Jena command line instead.
     """
     try:
-        for SQ_file in os.listdir(SQ_dir):
-            if SQ_file.endswith('.sparql'):
-                result = run_sparql_query(ABox_file, SQ_dir + SQ_file)
-                if verbose:
-                    print_sparql_result(SQ_file, result)
+        SQ_files = sorted(SQ_file for SQ_file in os.listdir(SQ_dir) if SQ_file.endswith('.sparql'))
+        if jena:
+            results = {SQ_file: run_sparql_query(ABox_file, SQ_dir + SQ_file) for SQ_file in SQ_files}
+        else:
+            results = run_sparql_queries(ABox_file, [SQ_dir + SQ_file for SQ_file in SQ_files])
+            results = {SQ_file: results[SQ_dir + SQ_file] for SQ_file in SQ_files}
+        if verbose:
+            for SQ_file, result in results.items():
+                print_sparql_result(SQ_file, result)
         print(f"🟩 Passed query test")
     except Exception as e:
         print(f"🟥 Failed query test{': ' + str(e) if verbose else ''}")
 
-def main(verbose: bool = False) -> None:
+@profiled_main('BoT')
+def main(verbose: bool = False,
+         jena: bool = False) -> None:
     """ Main function to run the bag of tests.
     Args:
         verbose (bool): wether to print detailed informations about the execution.
+        jena (bool): wether to run the queries with the Apache Jena command line.
     """
     print(f"Running BoT for {CURRENT_DIR}")
-    model_test(verbose)
-    data_test(verbose)
-    query_test(verbose)
+    with stage('model_test'):
+        model_test(verbose)
+    with stage('data_test'):
+        data_test(verbose)
+    with stage('query_test'):
+        query_test(verbose, jena)
 
 if __name__ == '__main__':
     parser = ArgumentParser(description = 'Run bag of tests')
     parser.add_argument('-v', '-verbose', '--verbose', action = 'store_true',
                         help = 'Enable verbose output')
+    parser.add_argument('--jena', action = 'store_true',
+                        help = 'Run the queries with the Apache Jena command line')
     args = parser.parse_args()
     verbose = args.verbose
-    main(verbose)
+    jena = args.jena
+    main(verbose, jena)
@@ -0,0 +1,379 @@
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import requests
+from utilities.utilities import *
+from utilities.http_cache import HttpCache, CachedSession
+from modelet_1.scripts import piirrite_creation as creation
+from modelet_1.scripts import piirrite_taginfo as taginfo
+
+###########################
+# Mode "crawler" de use_osm_wiki_to_fill_in_graphs
+#
+# Les étapes du mode séquentiel (clés du wiki -> filtre taginfo -> pages Key:* et valeurs
+# taginfo -> pages Tag:*) sont ici des tâches asyncio reliées par des files : une clé retenue
+# par taginfo part aussitôt vers l'étape suivante, sans attendre la fin du filtrage.
+# Les requêtes passent par un ordonnanceur par hôte (wiki, taginfo) qui borne le nombre de
+# requêtes simultanées et adapte le rythme aux réponses 429/503 (en-tête Retry-After).
+# Les requêtes elles-mêmes restent faites par requests (et le cache HTTP), dans des threads :
+# une session par thread plutôt qu'une session partagée.
+
+class HostScheduler:
+    ''' Schedules HTTP requests host by host: bounded concurrency, and a pace that slows down on
+    429/503 responses (honouring Retry-After) and speeds up again on successes.
+    '''
+
+    def __init__(self,
+                 http_cache: HttpCache | None = None,
+                 max_concurrency_per_host: int = 8,
+                 max_retries: int = 6,
+                 max_interval_s: float = 10.0) -> None:
+        self.http_cache = http_cache
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.max_retries = max_retries
+        self.max_interval_s = max_interval_s
+        self.hosts: dict[str, dict] = {}
+        self.executor = ThreadPoolExecutor(max_workers = 2 * max_concurrency_per_host)
+        self.local = threading.local()
+        self.sessions: list[CachedSession] = []
+
+    def close(self) -> None:
+        self.executor.shutdown(wait = True)
+        for session in self.sessions:
+            session.close()
+
+    def _session(self) -> CachedSession:
+        # appelé dans les threads de l'executor : une session par thread
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = CachedSession(self.http_cache)
+            self.sessions.append(session)
+        return session
+
+    def _host(self, url: str) -> dict:
+        netloc = urlsplit(url).netloc
+        if netloc not in self.hosts:
+            self.hosts[netloc] = {
+                'semaphore': asyncio.Semaphore(self.max_concurrency_per_host),
+                # pas de requête avant resume_at (Retry-After), ni plus d'une par interval_s
+                'resume_at': 0.0,
+                'next_at': 0.0,
+                'interval_s': 0.0,
+                'slowed_down_at': 0.0,
+            }
+        return self.hosts[netloc]
+
+    async def request_json(self, method: str, url: str, **kwargs) -> dict:
+        ''' Sends a request through the scheduler of its host and returns the decoded JSON body.
+        Args:
+            method (str) : The HTTP method.
+            url (str) : The URL of the request.
+            **kwargs : The arguments of requests.Session.request (params, data, timeout, use_cache…).
+        Returns:
+            dict : The JSON body of the response.
+        '''
+        loop = asyncio.get_running_loop()
+        host = self._host(url)
+
+        for attempt in range(self.max_retries + 1):
+            async with host['semaphore']:
+                now = loop.time()
+                start_at = max(now, host['resume_at'], host['next_at'])
+                host['next_at'] = start_at + host['interval_s']
+                if start_at > now:
+                    await asyncio.sleep(start_at - now)
+                response = await loop.run_in_executor(
+                    self.executor, lambda: self._session().request(method, url, **kwargs)
+                )
+
+            if response.status_code in (429, 503) and attempt < self.max_retries:
+                # pause de tout l'hôte le temps demandé, et ralentissement multiplicatif ; les
+                # requêtes parties avant le dernier ralentissement ne ralentissent pas une seconde fois
+                retry_after_s = _retry_after_s(response.headers.get('Retry-After'), default = 2 ** attempt)
+                host['resume_at'] = max(host['resume_at'], loop.time() + retry_after_s)
+                if start_at >= host['slowed_down_at']:
+                    host['slowed_down_at'] = loop.time()
+                    host['interval_s'] = min(max(2 * host['interval_s'], 0.05), self.max_interval_s)
+                continue
+
+            if response.headers.get('X-Cache') != 'HIT':
+                # accélération progressive tant que l'hôte répond
+                host['interval_s'] = host['interval_s'] * 0.75 if host['interval_s'] > 0.01 else 0.0
+            response.raise_for_status()
+            return response.json()
+
+        raise requests.HTTPError(f"Too many retries: {method} {url}")
+
+def _retry_after_s(retry_after: str | None, default: float) -> float:
+    # Retry-After : un nombre de secondes ou une date HTTP
+    if not retry_after:
+        return default
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+async def _fetch_wikitexts(scheduler: HostScheduler,
+                           titles: list[str],
+                           timeout_s: float,
+                           chunk_size: int = 50) -> dict[str, tuple[str, str]]:
+    # {titre demandé: (titre résolu, wikitext)}, cache HTTP compris (voir piirrite_creation)
+    cache = scheduler.http_cache
+    served, stale, missing = creation._lookup_cached_wikitexts(cache, titles)
+
+    async def revalidate_chunk(titles_chunk: list[str]) -> None:
+        try:
+            j = await scheduler.request_json('POST', creation.OSM_WIKI_URL, data = creation._wiki_revisions_payload(titles_chunk),
+                                             timeout = timeout_s, use_cache = False)
+        except Exception:
+            missing.extend(titles_chunk)
+            return
+        creation._revalidate_wikitexts(cache, stale, titles_chunk, j, served, missing) # type: ignore
+
+    await asyncio.gather(*(revalidate_chunk(titles_chunk) for titles_chunk in creation._chunked(list(stale), chunk_size)))
+
+    async def fetch_chunk(titles_chunk: list[str]) -> None:
+        if not titles_chunk:
+            return
+        try:
+            j = await scheduler.request_json('POST', creation.OSM_WIKI_URL, data = creation._wiki_content_payload(titles_chunk),
+                                             timeout = timeout_s, use_cache = False)
+        except Exception:
+            # comme en mode séquentiel : on coupe le lot en deux pour isoler la page en cause
+            if len(titles_chunk) == 1:
+                served[titles_chunk[0]] = (titles_chunk[0], '')
+                return
+            mid = len(titles_chunk) // 2
+            await asyncio.gather(fetch_chunk(titles_chunk[:mid]), fetch_chunk(titles_chunk[mid:]))
+            return
+        creation._store_wikitexts(cache, j, titles_chunk)
+        for title, (resolved, _, content) in creation._wiki_pages_by_requested_title(j, titles_chunk).items():
+            served[title] = (resolved, content)
+
+    await asyncio.gather(*(fetch_chunk(titles_chunk) for titles_chunk in creation._chunked(missing, chunk_size)))
+    return served
+
+async def _fetch_count_all(scheduler: HostScheduler, key: str, timeout_s: float) -> int:
+    j = await scheduler.request_json('GET', f"{taginfo.TAGINFO_API_V4}/key/overview",
+                                     params = {"key": key}, timeout = timeout_s)
+    return taginfo._count_all_from_overview(j)
+
+async def _iter_key_counts(scheduler: HostScheduler, min_count_all: int, timeout_s: float, rp: int = 999):
+    # pages de /keys/all, triées par nombre d'occurences décroissant, jusqu'au seuil
+    page = 1
+    while True:
+        j = await scheduler.request_json('GET', f"{taginfo.TAGINFO_API_V4}/keys/all",
+                                         params = taginfo._keys_all_params(page, rp), timeout = timeout_s)
+        counts, has_next_page = taginfo._key_counts_from_page(j, page, min_count_all = min_count_all, rp = rp)
+        yield counts
+        if not has_next_page:
+            break
+        page += 1
+
+async def _fetch_values_over_threshold(scheduler: HostScheduler,
+                                       key: str,
+                                       min_count_all: int,
+                                       timeout_s: float,
+                                       rp: int = 200) -> list[str]:
+    values: list[str] = []
+    page = 1
+    while True:
+        j = await scheduler.request_json('GET', f"{taginfo.TAGINFO_API_V4}/key/values",
+                                         params = taginfo._values_page_params(key, page, rp), timeout = timeout_s)
+        page_values, has_next_page = taginfo._values_over_threshold_from_page(
+            j, page, min_count_all = min_count_all, rp = rp, normalize_spaces_to_underscore = True
+        )
+        values.extend(page_values)
+        if not has_next_page:
+            break
+        page += 1
+
+    return taginfo._dedupe(values)
+
+async def _drain_in_batches(queue: asyncio.Queue, batch_size: int):
+    # regroupe ce qui arrive dans la file en lots d'au plus batch_size éléments,
+    # sans attendre qu'un lot soit plein ; None marque la fin de la file
+    done = False
+    while not done:
+        batch = [await queue.get()]
+        while len(batch) < batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        if None in batch:
+            done = True
+            batch = [item for item in batch if item is not None]
+        if batch:
+            yield batch
+
+async def crawl_osm_wiki(http_cache: HttpCache | None = None,
+                         *,
+                         min_count_all_keys: int = 100_000,
+                         min_count_all_values: int = 10_000,
+                         max_concurrency_per_host: int = 8,
+                         key_chunk_size: int = 50,
+                         tag_chunk_size: int = 25,
+                         timeout_s: float = 25.0) -> tuple[dict[str, str],
+                                                           dict[str, list[str]],
+                                                           dict[str, list[str]],
+                                                           dict[str, dict[str, str]],
+                                                           dict[str, dict[str, list[str]]]]:
+    ''' Fetches the OSM wiki and taginfo data needed by use_osm_wiki_to_fill_in_graphs, as a pipeline
+    of asyncio stages. Returns the same dictionaries as the sequential mode.
+    Args:
+        http_cache (HttpCache | None) : The HTTP cache to use, if any.
+        min_count_all_keys (int) : The minimum number of occurrences of a key to keep it.
+        min_count_all_values (int) : The minimum number of occurrences of a value to keep it.
+        max_concurrency_per_host (int) : The maximum number of simultaneous requests per host.
+        key_chunk_size (int) : The maximum number of Key:* pages per wiki request.
+        tag_chunk_size (int) : The maximum number of Tag:* pages per wiki request.
+        timeout_s (float) : The timeout of each request, in seconds.
+    Returns:
+        tuple : The descriptions, ranges and values of the keys, the descriptions and tuics of the values.
+    '''
+    scheduler = HostScheduler(http_cache, max_concurrency_per_host)
+    osm_keys_descriptions: dict[str, str] = {}
+    osm_keys_ranges: dict[str, list[str]] = {}
+    osm_keys_values: dict[str, list[str]] = {}
+    osm_values_descriptions: dict[str, dict[str, str]] = {}
+    osm_values_combinations: dict[str, dict[str, list[str]]] = {}
+    kept_keys_queue: asyncio.Queue = asyncio.Queue()
+    titles_queue: asyncio.Queue = asyncio.Queue()
+    queued_titles: set[str] = set()
+    requested_value_keys: set[str] = set()
+    counters = {'checked': 0, 'kept': 0, 'tags': 0}
+
+    try:
+        # 0) clés du wiki
+        print('Récupération des clés depuis le wiki…')
+        osm_raw_keys: list[str] = []
+        params = creation._wiki_key_pages_params()
+        while True:
+            raw_keys = await scheduler.request_json('GET', creation.OSM_WIKI_URL, params = dict(params), timeout = timeout_s)
+            osm_raw_keys.extend(page['title'].replace('Key:', '') for page in raw_keys.get('query', {}).get('allpages', []))
+            if 'continue' not in raw_keys:
+                break
+            params.update(raw_keys['continue'])
+        osm_keys = creation.filter_osm_keys_locally(osm_raw_keys)
+        print(f'{len(osm_raw_keys)} clés récupérées, {len(osm_keys)} ont passé le filtre local.')
+
+        # 1) filtre taginfo : les nombres d'occurences sont lus par pages de /keys/all (une requête
+        # /key/overview par clé si la liste est indisponible) ; chaque clé retenue part aussitôt vers l'étape 2
+        async def keep_key(osm_key: str, count_all: int) -> None:
+            if count_all > min_count_all_keys:
+                counters['kept'] += 1
+                await kept_keys_queue.put(osm_key)
+
+        async def check_key(osm_key: str) -> None:
+            try:
+                count_all = await _fetch_count_all(scheduler, osm_key, timeout_s)
+            except Exception:
+                count_all = 0
+            counters['checked'] += 1
+            display_progress(counters['checked'], len(osm_keys), message = f'des {len(osm_keys)} clés vérifiées…')
+            await keep_key(osm_key, count_all)
+
+        async def filter_stage() -> None:
+            wanted_keys = set(osm_keys)
+            try:
+                async for counts in _iter_key_counts(scheduler, min_count_all_keys, timeout_s):
+                    for osm_key, count_all in counts.items():
+                        if osm_key in wanted_keys:
+                            wanted_keys.discard(osm_key)
+                            await keep_key(osm_key, count_all)
+            except (requests.RequestException, ValueError):
+                await asyncio.gather(*(check_key(osm_key) for osm_key in osm_keys if osm_key in wanted_keys))
+            await kept_keys_queue.put(None)
+
+        # 2) pages Key:* et valeurs taginfo ; les pages Tag:* à lire partent vers l'étape 3
+        async def fetch_key_values(osm_key: str) -> None:
+            try:
+                values = creation.should_be_concept(
+                    await _fetch_values_over_threshold(scheduler, osm_key, min_count_all_values, timeout_s)
+                )
+            except Exception:
+                values = []
+            osm_keys_values[osm_key] = values
+            osm_values_descriptions.setdefault(osm_key, {})
+            osm_values_combinations.setdefault(osm_key, {})
+            for value in (values if values else ['any']):
+                osm_values_descriptions[osm_key][value] = ''
+                osm_values_combinations[osm_key][value] = []
+            for value in values:
+                title = f"Tag:{osm_key}={value.replace('_', ' ')}"
+                if title not in queued_titles:
+                    queued_titles.add(title)
+                    await titles_queue.put(title)
+
+        async def process_keys(keys_chunk: list[str]) -> None:
+            keys = [creation.normalize_osm_key(k) for k in keys_chunk]
+            for k in keys:
+                osm_keys_descriptions.setdefault(k, '')
+                osm_keys_ranges.setdefault(k, [])
+            try:
+                wikitexts = await _fetch_wikitexts(scheduler, [f"Key:{k}" for k in keys], timeout_s, key_chunk_size)
+            except Exception:
+                wikitexts = {}
+
+            # comme en mode séquentiel, une redirection peut faire apparaître une nouvelle clé
+            value_keys = set(keys)
+            for resolved, wikitext in wikitexts.values():
+                if not resolved.startswith('Key:'):
+                    continue
+                k_norm = creation.normalize_osm_key(resolved.split('Key:', 1)[1])
+                description, elements = creation._parse_description_and_elements_from_wikitext(wikitext)
+                osm_keys_descriptions[k_norm] = creation.clean_osm_description(description)
+                osm_keys_ranges[k_norm] = elements
+                value_keys.add(k_norm)
+
+            value_keys -= requested_value_keys
+            requested_value_keys.update(value_keys)
+            await asyncio.gather(*(fetch_key_values(k) for k in value_keys))
+
+        async def key_stage() -> None:
+            tasks = [asyncio.create_task(process_keys(keys_chunk))
+                     async for keys_chunk in _drain_in_batches(kept_keys_queue, key_chunk_size)]
+            await asyncio.gather(*tasks)
+            await titles_queue.put(None)
+
+        # 3) pages Tag:*
+        async def process_tags(titles_chunk: list[str]) -> None:
+            try:
+                wikitexts = await _fetch_wikitexts(scheduler, titles_chunk, timeout_s, tag_chunk_size)
+            except Exception:
+                wikitexts = {}
+            # comme en mode séquentiel, une page est rattachée au tag de son titre résolu
+            for resolved, wikitext in wikitexts.values():
+                key_value = creation._title_to_key_value(resolved)
+                if not key_value:
+                    continue
+                osm_key = creation.normalize_osm_key(key_value[0])
+                value = key_value[1].replace(' ', '_').strip()
+                if value not in osm_values_descriptions.get(osm_key, {}):
+                    continue
+                osm_values_descriptions[osm_key][value] = creation.clean_osm_description(
+                    creation._extract_value_description(wikitext)
+                )
+                osm_values_combinations[osm_key][value] = creation.should_be_concept(
+                    creation._extract_combination_tags_union(wikitext)
+                )
+                counters['tags'] += 1
+
+        async def tag_stage() -> None:
+            tasks = [asyncio.create_task(process_tags(titles_chunk))
+                     async for titles_chunk in _drain_in_batches(titles_queue, tag_chunk_size)]
+            await asyncio.gather(*tasks)
+
+        await asyncio.gather(filter_stage(), key_stage(), tag_stage())
+    finally:
+        scheduler.close()
+
+    print(f'\n{counters["kept"]}/{len(osm_keys)} clés conservées (au moins {min_count_all_keys} occurences totales).')
+    print(f'{sum(1 for d in osm_keys_descriptions.values() if d)}/{len(osm_keys_descriptions)} clés ont une description.')
+    print(f'{counters["tags"]} pages Tag:* traitées.')
+    return osm_keys_descriptions, osm_keys_ranges, osm_keys_values, osm_values_descriptions, osm_values_combinations
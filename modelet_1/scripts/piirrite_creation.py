@@ -1,5 +1,7 @@
 import re
+import json
 import time
+from functools import lru_cache
 import requests
 from requests.adapters import HTTPAdapter
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -8,6 +10,9 @@ from typing import Iterable
 from rdflib import Graph, Namespace, Literal
 from rdflib.namespace import SKOS, RDF, RDFS, OWL, XSD
 from utilities.utilities import *
+from utilities.http_cache import HttpCache, CachedSession
+from utilities.profiling import count, stage, profiled_main
+from modelet_1.scripts.piirrite_taginfo import TaginfoClient
 
 piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
 piirritev = Namespace('http://piirrite.univ-lyon1.fr/vocabulary#')
@@ -20,7 +25,7 @@ GOT_FILE = '/GoT.ttl'
 TBOX_FILE = '/TBox.ttl'
 TBOX2_FILE = '/TBox2.ttl'
 OSM_WIKI_URL = 'https://wiki.openstreetmap.org/w/api.php'
-TAGINFO_API_V4 = "https://taginfo.openstreetmap.org/api/4"
+HTTP_CACHE_FILE = get_current_path() + '/.http_cache.sqlite'
 
 ###########################
 
@@ -193,10 +198,12 @@ def add_hasOsmTuic_to_piirrite2(piirritev_graph:Graph, piirrite2_graph:Graph,
 
 ###########################
 
-def get_osm_keys_from_wiki() -> list[str]:
-    print('Récupération des clés depuis le wiki…')
-    osm_keys = []
-    params = {
+def open_session(http_cache:HttpCache | None = None) -> CachedSession:
+    # sans cache, la session se comporte comme une requests.Session
+    return CachedSession(http_cache)
+
+def _wiki_key_pages_params() -> dict:
+    return {
         'action': 'query',
         'list': 'allpages',
         'apnamespace': 0,  # Namespace principal (pas Template)
@@ -205,20 +212,26 @@ def get_osm_keys_from_wiki() -> list[str]:
         'aplimit': 'max'
     }
 
-    while True:
-        try:
-            response = requests.get(OSM_WIKI_URL, params=params) #type:ignore
-        except Exception:
-            return []
-        raw_keys = response.json()
-        osm_keys.extend([
-            raw_key_page['title'].replace('Key:', '')
-            for raw_key_page in raw_keys.get('query', {}).get('allpages', [])
-        ])
-
-        if 'continue' not in raw_keys:
-            break
-        params.update(raw_keys['continue'])
+def get_osm_keys_from_wiki(http_cache:HttpCache | None = None) -> list[str]:
+    print('Récupération des clés depuis le wiki…')
+    osm_keys = []
+    params = _wiki_key_pages_params()
+
+    with open_session(http_cache) as session:
+        while True:
+            try:
+                response = session.get(OSM_WIKI_URL, params=params) #type:ignore
+            except Exception:
+                return []
+            raw_keys = response.json()
+            osm_keys.extend([
+                raw_key_page['title'].replace('Key:', '')
+                for raw_key_page in raw_keys.get('query', {}).get('allpages', [])
+            ])
+
+            if 'continue' not in raw_keys:
+                break
+            params.update(raw_keys['continue'])
 
     # osm_keys = ['amenity']
 
@@ -265,17 +278,17 @@ def _chunked(seq: list[str], size: int) -> Iterable[list[str]]:
         yield seq[i:i + size]
 
 
-def _get_count_all(session: requests.Session, key: str, timeout: float) -> int | None:
-    url = f"{TAGINFO_API_V4}/key/overview"
-    r = session.get(url, params={"key": key}, timeout=timeout)
-    r.raise_for_status()
-    j = r.json()
+def filter_osm_keys_locally(osm_raw_keys: list[str]) -> list[str]:
+    # Normalisation + exclusion
+    osm_keys = [
+        osm_raw_key.replace(" ", "_")
+        for osm_raw_key in osm_raw_keys
+        if not is_excluded_key(osm_raw_key)
+    ]
 
-    counts = j.get("data", {}).get("counts", [])
-    for c in counts:
-        if c.get("type") == "all":
-            return int(c.get("count", 0))
-    return 0
+    # dédoublonnage
+    seen = set()
+    return [k for k in osm_keys if not (k in seen or seen.add(k))] # type:ignore
 
 
 def filter_osm_keys(
@@ -285,101 +298,122 @@ def filter_osm_keys(
     request_timeout_s: float = 20.0,
     max_workers: int = 16,
     chunk_size: int = 200,
+    http_cache: HttpCache | None = None,
+    taginfo: TaginfoClient | None = None,
 ) -> list[str]:
     print("Filtrage des clés pertinentes…")
 
     # 1) Normalisation + exclusion
-    osm_keys = [
-        osm_raw_key.replace(" ", "_")
-        for osm_raw_key in osm_raw_keys
-        if not is_excluded_key(osm_raw_key)
-    ]
-
-    # dédoublonnage
-    seen = set()
-    osm_keys = [k for k in osm_keys if not (k in seen or seen.add(k))] # type:ignore
+    osm_keys = filter_osm_keys_locally(osm_raw_keys)
 
     print(f"{len(osm_keys)}/{len(osm_raw_keys)} clés ont passé le filtre local. Vérification des nombres d'occurences…")
 
     kept: list[str] = []
 
-    # 2) Taginfo (pas de vrai batch côté API, donc on “batch” côté client)
-    with requests.Session() as session:
-        display_progress_bar(0, len(osm_keys), message=f'des {len(osm_keys)} clés vérifiées…')
-        for chunk_idx, keys_chunk in enumerate(_chunked(osm_keys, chunk_size), start=1):
-            futures = {}
-            with ThreadPoolExecutor(max_workers=max_workers) as pool:
-                for k in keys_chunk:
-                    futures[pool.submit(_get_count_all, session, k, request_timeout_s)] = k
-
-                for fut in as_completed(futures):
-                    k = futures[fut]
-                    try:
-                        count_all = fut.result()
-                    except Exception:
-                        continue
-
-                    if count_all is not None and count_all > min_count_all:
-                        kept.append(k)
-
-            display_progress_bar(min(chunk_idx * chunk_size, len(osm_keys)), len(osm_keys), message=f'des {len(osm_keys)} clés vérifiées…')
-    
+    # 2) Taginfo : les nombres d'occurences de toutes les clés au-dessus du seuil sont lus
+    # en quelques pages de /keys/all ; à défaut, une requête /key/overview par clé
+    with open_session(http_cache) as session:
+        taginfo = taginfo or TaginfoClient(session, timeout_s=request_timeout_s)
+        try:
+            kept = taginfo.keys_over_threshold(osm_keys, min_count_all)
+        except (requests.RequestException, ValueError):
+            display_progress_bar(0, len(osm_keys), message=f'des {len(osm_keys)} clés vérifiées…')
+            for chunk_idx, keys_chunk in enumerate(_chunked(osm_keys, chunk_size), start=1):
+                futures = {}
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    for k in keys_chunk:
+                        futures[pool.submit(taginfo.count_all, k)] = k
+
+                    for fut in as_completed(futures):
+                        k = futures[fut]
+                        try:
+                            count_all = fut.result()
+                        except Exception:
+                            continue
+
+                        if count_all is not None and count_all > min_count_all:
+                            kept.append(k)
+
+                display_progress_bar(min(chunk_idx * chunk_size, len(osm_keys)), len(osm_keys), message=f'des {len(osm_keys)} clés vérifiées…')
+
     print(f"{len(kept)}/{len(osm_keys)} clés conservées (au moins 100 000 occurences totales).")
     return kept
 
-def _clean_wikitext(s: str) -> str:
-    if not s:
-        return ""
-
+# motifs compilés une fois : _clean_wikitext ne porte que sur la valeur d'un paramètre
+_CLEAN_WIKITEXT_SUBSTITUTIONS = [
     # comments
-    s = re.sub(r"<!--.*?-->", " ", s, flags=re.DOTALL)
-
+    (re.compile(r"<!--.*?-->", re.DOTALL), " "),
     # refs
-    s = re.sub(r"<ref[^>/]*/\s*>", " ", s, flags=re.IGNORECASE)
-    s = re.sub(r"<ref[^>]*>.*?</ref>", " ", s, flags=re.IGNORECASE | re.DOTALL)
-
+    (re.compile(r"<ref[^>/]*/\s*>", re.IGNORECASE), " "),
+    (re.compile(r"<ref[^>]*>.*?</ref>", re.IGNORECASE | re.DOTALL), " "),
     # external links: [url label] -> label ; [url] -> ''
-    s = re.sub(r"\[(https?://[^\s\]]+)\s+([^\]]+)\]", r"\2", s)
-    s = re.sub(r"\[(https?://[^\s\]]+)\]", "", s)
-
+    (re.compile(r"\[(https?://[^\s\]]+)\s+([^\]]+)\]"), r"\2"),
+    (re.compile(r"\[(https?://[^\s\]]+)\]"), ""),
     # wiki links: [[A|B]] -> B ; [[A]] -> A
-    s = re.sub(r"\[\[([^|\]]+)\|([^\]]+)\]\]", r"\2", s)
-    s = re.sub(r"\[\[([^\]]+)\]\]", r"\1", s)
+    (re.compile(r"\[\[([^|\]]+)\|([^\]]+)\]\]"), r"\2"),
+    (re.compile(r"\[\[([^\]]+)\]\]"), r"\1"),
+]
+_HTML_TAG_PATTERN = re.compile(r"</?[^>]+>")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def _clean_wikitext(s: str) -> str:
+    if not s:
+        return ""
+
+    for pattern, replacement in _CLEAN_WIKITEXT_SUBSTITUTIONS:
+        s = pattern.sub(replacement, s)
 
     # bold/italic markup
     s = s.replace("'''", "").replace("''", "")
 
     # HTML tags
-    s = re.sub(r"</?[^>]+>", " ", s)
+    s = _HTML_TAG_PATTERN.sub(" ", s)
 
     # whitespace
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _WHITESPACE_PATTERN.sub(" ", s).strip()
     return s
 
 
+# blocs de template : d'abord fermé sur sa propre ligne, sinon fermé sur la même ligne
+_KEYDESCRIPTION_PATTERNS = (
+    re.compile(r"\{\{\s*KeyDescription\b(.*?)\n\}\}", re.IGNORECASE | re.DOTALL),
+    re.compile(r"\{\{\s*KeyDescription\b(.*?)\}\}", re.IGNORECASE | re.DOTALL),
+)
+_VALUEDESCRIPTION_PATTERNS = (
+    re.compile(r"\{\{\s*ValueDescription\b(.*?)\n\}\}", re.IGNORECASE | re.DOTALL),
+    re.compile(r"\{\{\s*ValueDescription\b(.*?)\}\}", re.IGNORECASE | re.DOTALL),
+)
+
+def _extract_template_block(wikitext: str, patterns: tuple[re.Pattern, ...]) -> str | None:
+    for pattern in patterns:
+        m = pattern.search(wikitext)
+        if m:
+            return m.group(1)
+    return None
+
 def _extract_keydescription_block(wikitext: str) -> str | None:
     if not wikitext:
         return None
+    return _extract_template_block(wikitext, _KEYDESCRIPTION_PATTERNS)
 
-    m = re.search(r"\{\{\s*KeyDescription\b(.*?)\n\}\}", wikitext, flags=re.IGNORECASE | re.DOTALL)
-    if not m:
-        # fallback: parfois fermé sur la même ligne
-        m = re.search(r"\{\{\s*KeyDescription\b(.*?)\}\}", wikitext, flags=re.IGNORECASE | re.DOTALL)
-    return m.group(1) if m else None
 
+@lru_cache(maxsize = None)
+def _template_param_pattern(name: str) -> re.Pattern:
+    # un motif par nom de paramètre, compilé à la première demande
+    return re.compile(
+        r"\|\s*" + re.escape(name) + r"\s*=\s*(.*?)"
+        r"(?=\n\|\s*[A-Za-z0-9_]+\s*=|\n\}\}|\Z)",
+        re.IGNORECASE | re.DOTALL,
+    )
 
-def _extract_template_param(block: str, name: str) -> str | None:
+def _extract_template_param(block: str | None, name: str) -> str | None:
     """
     Récupère |name=... (multiligne) dans un bloc de template.
     """
     if not block:
         return None
 
-    pattern = (
-        r"\|\s*" + re.escape(name) + r"\s*=\s*(.*?)"
-        r"(?=\n\|\s*[A-Za-z0-9_]+\s*=|\n\}\}|\Z)"
-    )
-    m = re.search(pattern, block, flags=re.IGNORECASE | re.DOTALL)
+    m = _template_param_pattern(name).search(block)
     if not m:
         return None
     return m.group(1).strip()
@@ -414,6 +448,150 @@ def _parse_description_and_elements_from_wikitext(wikitext: str) -> tuple[str, l
     return (description, on_elements)
 
 
+def _wiki_pages_by_requested_title(j: dict, titles: list[str]) -> dict[str, tuple[str, str, str]]:
+    """
+    Retourne {titre demandé: (titre résolu, id de révision, wikitext)} à partir d'une
+    réponse de l'API (formatversion=2), en suivant normalisations et redirections.
+    """
+    query = j.get("query", {})
+    renames = {
+        item["from"]: item["to"]
+        for item in (query.get("normalized") or []) + (query.get("redirects") or [])
+    }
+    pages = {p.get("title", ""): p for p in query.get("pages", []) or []}
+
+    out: dict[str, tuple[str, str, str]] = {}
+    for title in titles:
+        resolved, seen = title, set()
+        while resolved in renames and resolved not in seen:
+            seen.add(resolved)
+            resolved = renames[resolved]
+        p = pages.get(resolved)
+        if p is None:
+            continue
+
+        revs = p.get("revisions") or []
+        if "missing" in p or not revs:
+            out[title] = (resolved, "", "")
+            continue
+        content = revs[0].get("slots", {}).get("main", {}).get("content", "")
+        out[title] = (resolved, str(revs[0].get("revid", "")), content or "")
+
+    return out
+
+def _store_wikitexts(cache: HttpCache | None, j: dict, titles: list[str]) -> None:
+    if cache is None:
+        return
+    for title, (resolved, revid, content) in _wiki_pages_by_requested_title(j, titles).items():
+        cache.put(f"wiki:{title}", json.dumps([resolved, content]).encode("utf-8"), revid)
+
+def _lookup_cached_wikitexts(
+    cache: HttpCache | None,
+    titles: list[str],
+) -> tuple[dict[str, tuple[str, str]], dict[str, tuple[str, str, str | None]], list[str]]:
+    """
+    Répartit les titres entre pages servies par le cache HTTP, pages en cache mais
+    périmées (à revalider) et pages à télécharger. Aucune requête réseau.
+    """
+    if cache is None:
+        return {}, {}, list(titles)
+
+    served: dict[str, tuple[str, str]] = {}
+    stale: dict[str, tuple[str, str, str | None]] = {}
+    missing: list[str] = []
+    for title in titles:
+        entry = cache.get(f"wiki:{title}")
+        if entry is None:
+            missing.append(title)
+            continue
+        resolved, content = json.loads(entry.body)
+        if cache.is_fresh(entry):
+            served[title] = (resolved, content)
+        else:
+            stale[title] = (resolved, content, entry.validator)
+    count('http_cache_hits', len(served))
+
+    if cache.offline:
+        # hors ligne, les pages absentes du cache restent vides
+        if missing:
+            print(f"{len(missing)} pages wiki absentes du cache HTTP (mode hors ligne).")
+        for title in missing:
+            served[title] = (title, "")
+        missing = []
+
+    return served, stale, missing
+
+def _wiki_content_payload(titles_chunk: list[str]) -> dict:
+    return {
+        "action": "query",
+        "prop": "revisions",
+        "rvprop": "ids|content",
+        "rvslots": "main",
+        "formatversion": 2,
+        "format": "json",
+        "redirects": 1,
+        "titles": "|".join(titles_chunk),
+    }
+
+def _wiki_revisions_payload(titles_chunk: list[str]) -> dict:
+    # requête légère : ids de révision seulement, sans contenu
+    return {
+        "action": "query",
+        "prop": "revisions",
+        "rvprop": "ids",
+        "formatversion": 2,
+        "format": "json",
+        "redirects": 1,
+        "titles": "|".join(titles_chunk),
+    }
+
+def _revalidate_wikitexts(
+    cache: HttpCache,
+    stale: dict[str, tuple[str, str, str | None]],
+    titles_chunk: list[str],
+    j: dict,
+    served: dict[str, tuple[str, str]],
+    missing: list[str],
+) -> None:
+    # une page dont l'id de révision n'a pas changé est servie par le cache, les autres sont à télécharger
+    revisions = _wiki_pages_by_requested_title(j, titles_chunk)
+    for title in titles_chunk:
+        resolved, content, validator = stale[title]
+        if title in revisions and revisions[title][:2] == (resolved, validator or ""):
+            cache.touch(f"wiki:{title}")
+            count('http_cache_hits')
+            served[title] = (resolved, content)
+        else:
+            missing.append(title)
+
+def _get_cached_wikitexts(
+    session: CachedSession,
+    titles: list[str],
+    *,
+    chunk_size: int = 50,
+    timeout_s: float = 25.0,
+) -> tuple[dict[str, tuple[str, str]], list[str]]:
+    """
+    Sert depuis le cache HTTP les pages wiki inchangées.
+    Retourne ({titre demandé: (titre résolu, wikitext)}, titres à télécharger).
+
+    Une page en cache mais périmée est revalidée par son id de révision : une requête
+    légère (sans contenu) par lot de titres, et seules les pages modifiées sont retéléchargées.
+    """
+    served, stale, missing = _lookup_cached_wikitexts(session.cache, titles)
+
+    for titles_chunk in _chunked(list(stale), chunk_size):
+        try:
+            r = session.post(OSM_WIKI_URL, data=_wiki_revisions_payload(titles_chunk), timeout=timeout_s, use_cache=False)
+            r.raise_for_status()
+            j = r.json()
+        except Exception:
+            missing.extend(titles_chunk)
+            continue
+        _revalidate_wikitexts(session.cache, stale, titles_chunk, j, served, missing) # type: ignore
+
+    return served, missing
+
 def _fetch_wiki_wikitexts_by_batch(
     session: requests.Session,
     keys: list[str],
@@ -426,24 +604,22 @@ def _fetch_wiki_wikitexts_by_batch(
     """
     out: dict[str, str] = {}
 
-    for keys_chunk in _chunked(keys, wiki_chunk_size):
-        titles = "|".join([f"Key:{k}" for k in keys_chunk])
+    # les pages inchangées sont servies par le cache HTTP, les autres sont téléchargées
+    cached, titles_to_fetch = _get_cached_wikitexts(session, [f"Key:{k}" for k in keys], timeout_s=timeout_s)
+    for resolved, content in cached.values():
+        if resolved.startswith("Key:"):
+            out[resolved.split("Key:", 1)[1]] = content
+
+    for titles_chunk in _chunked(titles_to_fetch, wiki_chunk_size):
         r = session.get(
             OSM_WIKI_URL,
-            params={
-                "action": "query",
-                "prop": "revisions",
-                "rvprop": "content",
-                "rvslots": "main",
-                "formatversion": 2,
-                "format": "json",
-                "redirects": 1,
-                "titles": titles,
-            }, #type:ignore
+            params=_wiki_content_payload(titles_chunk), #type:ignore
             timeout=timeout_s,
+            use_cache=False,
         )
         r.raise_for_status()
         j = r.json()
+        _store_wikitexts(session.cache, j, titles_chunk)
         pages = j.get("query", {}).get("pages", [])
 
         for p in pages:
@@ -466,128 +642,73 @@ def _fetch_wiki_wikitexts_by_batch(
 
     return out
 
-def _get_values_over_threshold(
-    session: requests.Session,
-    key: str,
-    *,
-    min_count_all: int = 10_000,
-    timeout_s: float = 20.0,
-    rp: int = 200,
-    normalize_spaces_to_underscore: bool = True,
-) -> list[str]:
-    values: list[str] = []
-    page = 1
-
-    while True:
-        r = session.get(
-            f"{TAGINFO_API_V4}/key/values",
-            params={
-                "key": key,
-                "page": page,
-                "rp": rp,
-                "sortname": "count_all",
-                "sortorder": "desc",
-                "filter": "all",
-            }, #type:ignore
-            timeout=timeout_s,
-        )
-        r.raise_for_status()
-        j = r.json()
-
-        data = (j.get("data") or [])
-        if not data:
-            break
-
-        stop = False
-        for item in data:
-            cnt = int(item.get("count", 0))
-            if cnt <= min_count_all:
-                stop = True
-                break
-
-            v = str(item.get("value", "")).strip()
-            if not v:
-                continue
-
-            if normalize_spaces_to_underscore:
-                v = v.replace(" ", "_")
-
-            values.append(v)
-
-        if stop:
-            break
-
-        # pagination
-        total = int(j.get("total", 0))
-        if page * rp >= total:
-            break
-        page += 1
-
-    # dédoublonnage en gardant l'ordre
-    seen = set()
-    values = [v for v in values if not (v in seen or seen.add(v))]  # type: ignore
-    return values
-
 def normalize_osm_key(s: str) -> str:
     s = s.replace(" ", "_").strip()
     return s
 
-def should_be_concept(values: list[str]) -> list[str]:
-    returned_values = []
-
-    for value in values:
-
-        if any(b in value.lower() for b in ['yes', 'no']):
-            if 'openinghours' in value.lower():
-                value = 'OpeningHours'
-            else:
-                continue
-
-        # certaines valeurs contiennent :00 mais ce sont toutes des horaires
-        # certaines valeurs contiennent des suffixes régionaux à deux lettres,
-        # mais on ne s'intéressent qu'aux clés globales
-        if any(s in value for s in [':00',
-            'ES:', 'NL:', 'DE:', 'FR:', 'FI:', 'IT:', 'US:']):
-            continue
-
-        if is_number(value.split('_')[0]):
-            continue
-
-        if any(value.startswith(o) for o in ['1st', '2nd', '3rd']):
-            continue
-
-        if value.startswith('http'):
-            continue
-
-        if is_color(value):
-            continue
-
-        if is_date(value):
-            continue
-
-        if is_email(value):
-            continue
+class ConceptClassifier:
+    ''' Decides which OSM values are worth a piirritev concept, and normalizes them.
+    The checks are compiled once (a combined regex for the substrings, frozensets for the
+    special characters) and the answer for each value is kept in an LRU cache: the
+    instanciation asks for the same values (yes, parking, …) over and over.
+    '''
+
+    # certaines valeurs contiennent :00 mais ce sont toutes des horaires
+    # certaines valeurs contiennent des suffixes régionaux à deux lettres,
+    # mais on ne s'intéressent qu'aux clés globales
+    REJECTED_SUBSTRINGS = (':00', 'ES:', 'NL:', 'DE:', 'FR:', 'FI:', 'IT:', 'US:')
+    REJECTED_PREFIXES = ('1st', '2nd', '3rd', 'http')
+    # peut-être que des valeurs généralisables en concepts
+    # contiennent des caractères spéciaux, mais on considère
+    # que ça ne vaut pas le coup de les chercher
+    SPECIAL_CHARACTERS = frozenset([':', ';', '/', ',', '~',
+                                    '〜', '|', '%', '"', '!',
+                                    '®', '（', '）', '«', '»',
+                                    '#', '+', '*', '='])
+
+    def __init__(self, cache_size: int = 65_536) -> None:
+        self._yes_no_pattern = re.compile('yes|no')
+        self._rejected_pattern = re.compile('|'.join(map(re.escape, self.REJECTED_SUBSTRINGS)))
+        self.classify_value = lru_cache(maxsize = cache_size)(self._classify_value)
+
+    def _classify_value(self, value: str) -> str | None:
+        # valeur normalisée si elle peut devenir un concept, None sinon
+        lowered = value.lower()
+        if self._yes_no_pattern.search(lowered):
+            if 'openinghours' not in lowered:
+                return None
+            value = 'OpeningHours'
 
         # on considère que les valeurs composées de 3 mots ou plus
         # ne sont pas généralisables en concepts
-        if len(value.split('_')) > 2 or len(value.split(' ')) > 3:
-            continue
-
-        # peut-être que des valeurs généralisables en concepts
-        # contiennent des caractères spéciaux, mais on considère
-        # que ça ne vaut pas le coup de les chercher
-        if any(sc in value for sc in [':', ';', '/', ',', '~',
-                                      '〜', '|', '%', '"', '!',
-                                      '®', '（', '）', '«', '»',
-                                      '#', '+', '*', '=']):
-            continue
+        if value.count('_') > 1 or value.count(' ') > 2:
+            return None
+        if not self.SPECIAL_CHARACTERS.isdisjoint(value) or self._rejected_pattern.search(value):
+            return None
+        if value.startswith(self.REJECTED_PREFIXES):
+            return None
+        if is_number(value.split('_')[0]) or is_color(value) or is_email(value) or is_date(value):
+            return None
+
+        return value.replace('\'', '').replace('.', '_')
+
+    def classify(self, values: Iterable[str]) -> list[str]:
+        ''' Keeps the values which can become concepts, normalized.
+        Args:
+            values (Iterable[str]) : The OSM values.
+        Returns:
+            list[str] : The normalized values, in the same order.
+        '''
+        classify_value = self.classify_value
+        return [concept for concept in map(classify_value, values) if concept is not None]
+
+    def is_concept(self, value: str) -> bool:
+        return self.classify_value(value) is not None
+
+CONCEPT_CLASSIFIER = ConceptClassifier()
 
-        value = value.replace('\'', '')
-        value = value.replace('.', '_')
-
-        returned_values.append(value)
-    
-    return returned_values
+def should_be_concept(values: list[str]) -> list[str]:
+    return CONCEPT_CLASSIFIER.classify(values)
 
 def get_osm_keys_datas(
     osm_keys: list[str],
@@ -595,6 +716,8 @@ def get_osm_keys_datas(
     wiki_chunk_size: int = 50,
     taginfo_max_workers: int = 16,
     request_timeout_s: float = 25.0,
+    http_cache: HttpCache | None = None,
+    taginfo: TaginfoClient | None = None,
 ) -> tuple[dict[str, str], dict[str, list[str]], dict[str, list[str]]]:
     print("Récupération du contenu wiki des clés…")
     # normalisation + dédoublonnage (garde l’ordre)
@@ -606,7 +729,7 @@ def get_osm_keys_datas(
     osm_keys_ranges: dict[str, list[str]] = {k: [] for k in keys}
     osm_keys_values: dict[str, list[str]] = {k: [] for k in keys}
 
-    with requests.Session() as session:
+    with open_session(http_cache) as session:
         # 1) WIKI en batch
         wikitexts = _fetch_wiki_wikitexts_by_batch(
             session,
@@ -633,16 +756,15 @@ def get_osm_keys_datas(
         input_keys = set(normalize_osm_key(k) for k in keys)
         all_keys = input_keys | wiki_keys
 
-        # 2) TAGINFO (1 req / key, parallélisé)
+        # 2) TAGINFO (1 req / key, parallélisé ; les clés déjà vues sont servies par le client)
+        taginfo = taginfo or TaginfoClient(session, timeout_s=request_timeout_s)
         futures = {}
         with ThreadPoolExecutor(max_workers=taginfo_max_workers) as pool:
             for k in all_keys:
                 futures[pool.submit(
-                    _get_values_over_threshold,
-                    session,
+                    taginfo.values,
                     k,
                     min_count_all=10_000,
-                    timeout_s=request_timeout_s,
                     rp=200,
                     normalize_spaces_to_underscore=True,
                 )] = k
@@ -667,6 +789,20 @@ def get_osm_keys_datas(
 
         return osm_keys_descriptions, osm_keys_ranges, osm_keys_values
 
+# Templates des descriptions, dans l'ordre d'application
+_DESCRIPTION_TEMPLATE_SUBSTITUTIONS = [
+    # {{Tag|A|B}} -> A=B ({{Tag|A||B}} donne A=|B, le '|' est retiré ensuite)
+    (re.compile(r'\{\{Tag\|([^|}]+)\|([^}]+)\}\}', re.IGNORECASE), r'\1=\2'),
+    # {{tag|A}} -> A
+    (re.compile(r'\{\{tag\|([^}]+)\}\}', re.IGNORECASE), r'\1'),
+    # {{wikiIcon|…|B}} -> B
+    (re.compile(r'\{\{wikiIcon\|[^|}]+\|([^}]+)\}\}', re.IGNORECASE), r'\1'),
+    # {{main|…}} supprimé avec l'espace final éventuel
+    (re.compile(r'\{\{main\|[^}]+\}\}\s*', re.IGNORECASE), ''),
+    # {{Prefix|A}} -> A
+    (re.compile(r'\{\{Prefix\|([^}]+)\}\}'), r'\1'),
+]
+
 def clean_osm_description(description:str) -> str:
     clean_description = (
         description
@@ -685,40 +821,9 @@ def clean_osm_description(description:str) -> str:
         clean_description,
         flags = re.IGNORECASE
     )
-    # Remplacer {{Tag|A|B}} par A=B
-    clean_description = re.sub(
-        r'\{\{Tag\|([^|}]+)\|([^}]+)\}\}', 
-        r'\1=\2', 
-        clean_description,
-        flags = re.IGNORECASE
-    )
-    # Remplacer {{tag|A}} par A
-    clean_description = re.sub(
-        r'\{\{tag\|([^}]+)\}\}', 
-        r'\1', 
-        clean_description,
-        flags = re.IGNORECASE
-    )
-    # Remplacer {{wikiIcon|…|B}} par B
-    clean_description = re.sub(
-        r'\{\{wikiIcon\|[^|}]+\|([^}]+)\}\}', 
-        r'\1', 
-        clean_description,
-        flags = re.IGNORECASE
-    )
-    # Supprimer {{main|…}} avec espace final éventuel
-    clean_description = re.sub(
-        r'\{\{main\|[^}]+\}\}\s*', 
-        '', 
-        clean_description,
-        flags = re.IGNORECASE
-    )
-    # Remplacer '{{Prefix|A}}' par 'A'
-    clean_description = re.sub(
-        r'\{\{Prefix\|([^}]+)\}\}',
-        r'\1',
-        clean_description
-    )
+    if '{{' in clean_description:
+        for pattern, replacement in _DESCRIPTION_TEMPLATE_SUBSTITUTIONS:
+            clean_description = pattern.sub(replacement, clean_description)
 
     clean_description = clean_description.replace('  ', ' ') \
         .replace('Tag:', '').replace('|', '')
@@ -766,24 +871,20 @@ def _fetch_wiki_wikitexts_by_titles_batch(
 ) -> dict[str, str]:
     out: dict[str, str] = {}
 
+    # les pages inchangées sont servies par le cache HTTP, les autres sont téléchargées
+    cached, titles_to_fetch = _get_cached_wikitexts(session, titles, timeout_s=timeout_s)
+    for resolved, content in cached.values():
+        out[resolved] = content
+    if cached:
+        print(f"{len(cached)}/{len(titles)} pages servies par le cache HTTP.")
+
     def fetch_chunk(titles_chunk: list[str]) -> None:
         if not titles_chunk:
             return
 
         # POST -> évite les URLs trop longues
-        payload = {
-            "action": "query",
-            "prop": "revisions",
-            "rvprop": "content",
-            "rvslots": "main",
-            "formatversion": 2,
-            "format": "json",
-            "redirects": 1,
-            "titles": "|".join(titles_chunk),
-        }
-
         try:
-            r = session.post(OSM_WIKI_URL, data=payload, timeout=timeout_s)
+            r = session.post(OSM_WIKI_URL, data=_wiki_content_payload(titles_chunk), timeout=timeout_s, use_cache=False)
             r.raise_for_status()
             j = r.json()
         except Exception:
@@ -796,6 +897,7 @@ def _fetch_wiki_wikitexts_by_titles_batch(
             fetch_chunk(titles_chunk[mid:])
             return
 
+        _store_wikitexts(session.cache, j, titles_chunk)
         pages = j.get("query", {}).get("pages", []) or []
         for p in pages:
             title = p.get("title") or ""
@@ -814,11 +916,11 @@ def _fetch_wiki_wikitexts_by_titles_batch(
             content = revs[0].get("slots", {}).get("main", {}).get("content", "")
             out[title] = content or ""
 
-    for chunk_idx, titles_chunk in enumerate(_chunked(titles, wiki_chunk_size)):
+    for chunk_idx, titles_chunk in enumerate(_chunked(titles_to_fetch, wiki_chunk_size)):
         fetch_chunk(titles_chunk)
         if sleep_s:
             time.sleep(sleep_s)
-        display_progress_bar(min((chunk_idx + 1) * wiki_chunk_size, len(titles)), len(titles), message = f'des {len(titles)} valeurs récupérées…')
+        display_progress_bar(min((chunk_idx + 1) * wiki_chunk_size, len(titles_to_fetch)), len(titles_to_fetch), message = f'des {len(titles_to_fetch)} valeurs récupérées…')
 
     return out
 
@@ -826,12 +928,15 @@ def _fetch_wiki_wikitexts_by_titles_batch(
 def _extract_valuedescription_block(wikitext: str) -> str | None:
     if not wikitext:
         return None
+    return _extract_template_block(wikitext, _VALUEDESCRIPTION_PATTERNS)
 
-    m = re.search(r"\{\{\s*ValueDescription\b(.*?)\n\}\}", wikitext, flags=re.IGNORECASE | re.DOTALL)
-    if not m:
-        m = re.search(r"\{\{\s*ValueDescription\b(.*?)\}\}", wikitext, flags=re.IGNORECASE | re.DOTALL)
-    return m.group(1) if m else None
 
+_TAG_TEMPLATE_PATTERN = re.compile(r"\{\{\s*Tag\s*\|\s*([^}]+?)\s*\}\}", re.IGNORECASE | re.DOTALL)
+_KEY_TEMPLATE_PATTERN = re.compile(r"\{\{\s*Key\s*\|\s*([^}]+?)\s*\}\}", re.IGNORECASE | re.DOTALL)
+_COMBINATION_SECTION_PATTERN = re.compile(
+    r"==\s*Tags used in combination\s*==\s*(.*?)(?=\n==[^=]|\Z)",
+    re.IGNORECASE | re.DOTALL,
+)
 
 def _extract_tags_from_templates(text: str) -> list[str]:
     if not text:
@@ -840,7 +945,7 @@ def _extract_tags_from_templates(text: str) -> list[str]:
     out: list[str] = []
 
     # {{Tag|...}}
-    for m in re.finditer(r"\{\{\s*Tag\s*\|\s*([^}]+?)\s*\}\}", text, flags=re.IGNORECASE | re.DOTALL):
+    for m in _TAG_TEMPLATE_PATTERN.finditer(text):
         inside = m.group(1).strip()
         parts = [p.strip() for p in inside.split("|") if p.strip() and "=" not in p]  # ignore params nommés
         if not parts:
@@ -853,7 +958,7 @@ def _extract_tags_from_templates(text: str) -> list[str]:
         out.append(t)
 
     # {{Key|...}} (on prend juste la clé)
-    for m in re.finditer(r"\{\{\s*Key\s*\|\s*([^}]+?)\s*\}\}", text, flags=re.IGNORECASE | re.DOTALL):
+    for m in _KEY_TEMPLATE_PATTERN.finditer(text):
         inside = m.group(1).strip()
         # ignore params nommés
         if "=" in inside:
@@ -883,11 +988,7 @@ def _extract_combination_tags_union(wikitext: str) -> list[str]:
     if comb:
         raw_items.extend(_extract_tags_from_templates(comb))
 
-    sec = re.search(
-        r"==\s*Tags used in combination\s*==\s*(.*?)(?=\n==[^=]|\Z)",
-        wikitext,
-        flags=re.IGNORECASE | re.DOTALL,
-    )
+    sec = _COMBINATION_SECTION_PATTERN.search(wikitext)
     if sec:
         raw_items.extend(_extract_tags_from_templates(sec.group(1)))
 
@@ -931,6 +1032,7 @@ def get_osm_values_datas(
     *,
     wiki_chunk_size: int = 50,
     request_timeout_s: float = 25.0,
+    http_cache: HttpCache | None = None,
 ) -> tuple[dict[str, dict[str, str]], dict[str, dict[str, list[str]]]]:
     print("Récupération du contenu wiki des valeurs…")
 
@@ -966,7 +1068,7 @@ def get_osm_values_datas(
             osm_values_descriptions[k][v] = ""
             osm_values_combinations[k][v] = []
 
-    with requests.Session() as session:
+    with open_session(http_cache) as session:
         wikitexts_by_title = _fetch_wiki_wikitexts_by_titles_batch(
             session,
             titles,
@@ -998,31 +1100,66 @@ def get_osm_values_datas(
     return osm_values_descriptions, osm_values_combinations
 
 def use_osm_wiki_to_fill_in_graphs(piirritev_graph:Graph,
-                                   piirrite2_graph:Graph) -> None:
-    osm_raw_keys = get_osm_keys_from_wiki()
-    osm_keys = filter_osm_keys(osm_raw_keys)
-    osm_keys_descriptions, osm_keys_ranges, osm_keys_values = get_osm_keys_datas(osm_keys)
-    osm_keys_values_descriptions, osm_keys_values_tuics = get_osm_values_datas(osm_keys_values)
-
-    for osm_key, key_description in osm_keys_descriptions.items():
-        add_OsmConceptScheme_to_piirritev(piirritev_graph, osm_key, key_description)
-        for value, value_description in osm_keys_values_descriptions[osm_key].items():
-            add_OsmConcept_to_piirritev(piirritev_graph, osm_key, value, value_description)
-            if value in osm_keys_values_tuics[osm_key].keys():
-                for tuic in osm_keys_values_tuics[osm_key][value]:
-                    add_hasOsmTuic_to_piirrite2(piirritev_graph, piirrite2_graph,
-                                             osm_key, value, tuic, '')
-
-def main():
-    piirrite_graph = init_piirrite_graph()
-    piirritev_graph = init_piirritev_graph()
-    piirrite2_graph = init_piirrite2_graph()
-    use_osm_wiki_to_fill_in_graphs(piirritev_graph, piirrite2_graph)
-    piirrite_graph.serialize(CURRENT_MODELET + TBOX_FILE, 'turtle')
-    piirritev_graph.serialize(CURRENT_MODELET + GOT_FILE, 'turtle')
-    piirrite2_graph.serialize(CURRENT_MODELET + TBOX2_FILE, 'turtle')
+                                   piirrite2_graph:Graph,
+                                   http_cache:HttpCache | None = None,
+                                   crawler:bool = False) -> None:
+    if crawler:
+        # import local : piirrite_crawler importe lui-même ce module
+        import asyncio
+        from modelet_1.scripts.piirrite_crawler import crawl_osm_wiki
+        with stage('crawl'):
+            osm_keys_descriptions, osm_keys_ranges, osm_keys_values, \
+                osm_keys_values_descriptions, osm_keys_values_tuics = asyncio.run(crawl_osm_wiki(http_cache))
+    else:
+        with stage('wiki_keys'):
+            osm_raw_keys = get_osm_keys_from_wiki(http_cache)
+        # un seul client taginfo pour toute l'exécution : chaque clé n'y est demandée qu'une fois
+        with open_session(http_cache) as taginfo_session:
+            taginfo = TaginfoClient(taginfo_session)
+            with stage('filter_keys'):
+                osm_keys = filter_osm_keys(osm_raw_keys, http_cache=http_cache, taginfo=taginfo)
+            with stage('keys_datas'):
+                osm_keys_descriptions, osm_keys_ranges, osm_keys_values = get_osm_keys_datas(osm_keys, http_cache=http_cache, taginfo=taginfo)
+        with stage('values_datas'):
+            osm_keys_values_descriptions, osm_keys_values_tuics = get_osm_values_datas(osm_keys_values, http_cache=http_cache)
+
+    with stage('fill_graphs'):
+        for osm_key, key_description in osm_keys_descriptions.items():
+            add_OsmConceptScheme_to_piirritev(piirritev_graph, osm_key, key_description)
+            for value, value_description in osm_keys_values_descriptions[osm_key].items():
+                add_OsmConcept_to_piirritev(piirritev_graph, osm_key, value, value_description)
+                if value in osm_keys_values_tuics[osm_key].keys():
+                    for tuic in osm_keys_values_tuics[osm_key][value]:
+                        add_hasOsmTuic_to_piirrite2(piirritev_graph, piirrite2_graph,
+                                                 osm_key, value, tuic, '')
+
+@profiled_main('modelet_1.creation')
+def main(offline:bool = False, cache_ttl_days:float = 7, crawler:bool = False):
+    with stage('init_graphs'):
+        piirrite_graph = init_piirrite_graph()
+        piirritev_graph = init_piirritev_graph()
+        piirrite2_graph = init_piirrite2_graph()
+    http_cache = HttpCache(HTTP_CACHE_FILE, ttl_s=cache_ttl_days * 24 * 3600, offline=offline)
+    try:
+        with stage('osm_wiki'):
+            use_osm_wiki_to_fill_in_graphs(piirritev_graph, piirrite2_graph, http_cache, crawler)
+    finally:
+        http_cache.close()
+    with stage('serialize'):
+        piirrite_graph.serialize(CURRENT_MODELET + TBOX_FILE, 'turtle')
+        piirritev_graph.serialize(CURRENT_MODELET + GOT_FILE, 'turtle')
+        piirrite2_graph.serialize(CURRENT_MODELET + TBOX2_FILE, 'turtle')
 
     print(f'Ontologie et glossaire initialisés, remplis et sauvegardés avec succès.')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # offline = True : aucune requête réseau, tout est servi par le cache HTTP
+    # (HTTP_CACHE_FILE, qu'il suffit de copier pour rejouer une génération à l'identique)
+    offline = False
+    # durée de validité des réponses en cache, en jours : passé ce délai, les pages wiki
+    # sont revalidées par leur id de révision et les réponses taginfo retéléchargées
+    cache_ttl_days = 7
+    # crawler = True : les étapes (filtre taginfo, pages Key:*, valeurs, pages Tag:*) s'enchaînent
+    # en flux avec asyncio, avec un nombre de requêtes simultanées borné et adapté à chaque hôte
+    crawler = False
+    main(offline, cache_ttl_days, crawler)
\ No newline at end of file
@@ -1,7 +1,16 @@
+import json
+import hashlib
+from contextlib import nullcontext
+from multiprocessing import Pool
 from rdflib import Graph, Namespace, Literal, URIRef, BNode
 from rdflib.namespace import OWL, RDF, RDFS, XSD, SKOS
 from utilities.utilities import *
-from modelet_1.scripts.piirrite_creation import should_be_concept
+from utilities.rdf_stream import iter_osm_entities, open_rdf_writer, serialize_block, index_subject_statements, TripleSink
+from utilities.graph_cache import load_cached_graph
+from utilities.compiled_graph import CompiledGraphWriter, save_compiled_graph, load_compiled_graph
+from utilities.profiling import count, stage, profiled_main
+from utilities.interning import camel, concept_name, vocabulary_iri, osm_entity_iri, value_literal
+from modelet_1.scripts.piirrite_creation import CONCEPT_CLASSIFIER
 
 piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
 piirritev = Namespace('http://piirrite.univ-lyon1.fr/vocabulary#')
@@ -16,33 +25,29 @@ GoT_file = get_current_path() + '/../GoT.ttl'
 TBox_file = get_current_path() + '/../TBox.ttl'
 TBox2_file = get_current_path() + '/../TBox2.ttl'
 ABox_file = get_current_path() + '/../ABox.ttl'
+ABox_hashes_file = get_current_path() + '/../ABox.hashes.json'
 
 def init_piirrite_graph() -> Graph:
-    piirrite_graph = Graph()
-    with open(TBox_file, 'r', encoding = 'utf-8') as TBox_file_content:
-        piirrite_graph.parse(data = TBox_file_content.read(), format = 'turtle')
-    with open(TBox2_file, 'r', encoding = 'utf-8') as TBox2_file_content:
-        piirrite_graph.parse(data = TBox2_file_content.read(), format = 'turtle')
-    
-    return piirrite_graph
+    return load_cached_graph([TBox_file, TBox2_file])
 
 def init_piirritev_graph() -> Graph:
-    piirritev_graph = Graph()
-    with open(GoT_file, 'r', encoding = 'utf-8') as GoT_file_content:
-        piirritev_graph.parse(data = GoT_file_content.read(), format = 'turtle')
-    
-    return piirritev_graph
+    return load_cached_graph(GoT_file)
+
+piirrited_namespaces = {
+    'piirrite': piirrite,
+    'piirritev': piirritev,
+    'rdfs': RDFS,
+    'xsd': XSD,
+    'osm': osm,
+    'osmnode': osmnode,
+    'geo': geo,
+    'saref': saref,
+}
 
 def init_piirrited_graph() -> Graph:
     piirrited_graph = Graph()
-    piirrited_graph.bind('piirrite', piirrite)
-    piirrited_graph.bind('piirritev', piirritev)
-    piirrited_graph.bind('rdfs', RDFS)
-    piirrited_graph.bind('xsd', XSD)
-    piirrited_graph.bind('osm', osm)
-    piirrited_graph.bind('osmnode', osmnode)
-    piirrited_graph.bind('geo', geo)
-    piirrited_graph.bind('saref', saref)
+    for prefix, namespace in piirrited_namespaces.items():
+        piirrited_graph.bind(prefix, namespace)
 
     return piirrited_graph
 
@@ -50,171 +55,234 @@ def init_osmd_graph() -> Graph:
     print('Récupération des données OSM…')
     osmd_graph = Graph()
     osmd_graph.parse(raw_data_file, 'turtle')
+    count('bytes_read', os.path.getsize(raw_data_file))
     
     print('Données OSM récupérées.')
     return osmd_graph
 
-def add_geometry_to_SpatialPoint(piirrited_graph:Graph,
-                                 osmd_graph:Graph,
-                                 SpatialPoint_URI:URIRef,
-                                 osm_geometry) -> None:
-    geometries_as_WKT = list(osmd_graph.objects(osm_geometry, geo.asWKT))
-    if len(geometries_as_WKT) == 1:
-        geometry_as_WKT = str(geometries_as_WKT[0])
-        geometry = BNode()
-        piirrited_graph.add((SpatialPoint_URI, geo.hasGeometry, geometry))
-        piirrited_graph.add((geometry, RDF.type, geo.Geometry))
-        piirrited_graph.add((geometry,
-                        geo.asWKT,
-                        Literal(str(geometry_as_WKT), datatype = geo['wktLiteral'])))
-
-def value_datatype(var):
-    if isinstance(var, int):
-        return XSD.integer
-    if isinstance(var, float):
-        return XSD.float
-    if isinstance(var, bool):
-        return XSD.boolean
-    return XSD.string
-
-def remove_blank_node_property(g, subject, predicate, rdf_type):
-    blank_nodes_to_remove = []
-    
-    for bn in g.objects(subject, predicate):
-        if (bn, RDF.type, rdf_type) in g:
-            blank_nodes_to_remove.append(bn)
-    
-    for bn in blank_nodes_to_remove:
-        g.remove((bn, None, None))
-        g.remove((subject, predicate, bn))
-    
-    return len(blank_nodes_to_remove)
+def get_osm_entities(rdf_type:URIRef, streaming:bool = False):
+    # Renvoie les entités OSM du type demandé sous forme de couples (entité, graphe
+    # contenant ses triplets) ainsi que leur nombre, s'il est connu.
+    # En flux, les entités sont lues une à une depuis le fichier OSM : la mémoire
+    # utilisée ne dépend plus de la taille de l'extrait.
+    if streaming:
+        print('Lecture en flux des données OSM…')
+        return iter_osm_entities(raw_data_file, rdf_type), None
 
-def add_context_to_SpatialPoint(osm_node:URIRef,
-                                piirrite_graph:Graph, piirritev_graph:Graph, piirrited_graph:Graph, osmd_graph:Graph,
-                                SpatialPoint_URI:URIRef, osm_key:str, osm_value:str, unfounds:dict[str, dict[str, int]]) -> dict[str, dict[str, int]]:
-    
-    # si la valeur n'a pas pour vocation d'être conceptualisée
-    # et que ce n'est pas un tuic (voir ci-dessous)
-    # en suivant le dictionnaire SKOS, on l'enregistre comme telle
-    if len(osm_value.split(' ')) > 1 or not should_be_concept([osm_value]):
-        conceptScheme = snake_to_camel(osm_key)
-        if (piirritev[conceptScheme], RDF.type, SKOS.ConceptScheme) in piirritev_graph:
-            context = BNode()
-            piirrited_graph.add((SpatialPoint_URI, saref.hasProperty, context))
-            piirrited_graph.add((context, RDF.type, piirritev[conceptScheme]))
-            converted_value = str_to_best_type(osm_value)
-            piirrited_graph.add((context, saref.hasValue, Literal(converted_value, datatype = value_datatype(converted_value))))
-
-        return unfounds
-
-    # sinon, on lance le processus de conceptualisation
-
-    # OSM utilise du snake_case et PIIRRITE du CamelCase
-    concept = snake_to_camel(osm_key) + snake_to_camel(osm_value)
-
-    # Si la clé n'est pas dans le vocabulaire, on ne l'ajoute pas
-    if (piirritev[concept], RDF.type, SKOS.Concept) not in piirritev_graph:
-        if concept not in unfounds['values'].keys():
-            unfounds['values'][concept] = 1
-        else:
-            unfounds['values'][concept] += 1
-        return unfounds
-
-    # le tag courant est peut-être voué à être utilisé en combinaison avec un autre
-    # tag de la spatialEntity (ex : capacity qui se rapporte à bicycleParking)
-    # -- voir l'explication sur les tuic ci-dessous
-    # Dans ce cas, il ne faut pas l'enregistrer comme concept à part entière
-    #
-    # Si c'est le cas, deux possibilités :
-    # - soit il a déjà été enregistré comme tel, et pas la peine de continuer
-    # - soit il n'a pas déjà été enregistré comme tel, alors on l'enregistre comme
-    #   concept à part entière et on le supprimera quand on l'enregistrera comme tel
-    #   (lors du traitement du tag auquel il se rapporte) : voir (*) ci-dessous
-    for saref_property in piirrited_graph.objects(SpatialPoint_URI, saref.hasProperty):
-        for tuic_predicate, _ in piirrited_graph.predicate_objects(saref_property):
-            if tuic_predicate not in [RDF.type, saref.hasValue]:
-                if str(tuic_predicate).endswith(snake_to_camel(osm_key)):
-                    return unfounds
-
-    # on enregistre la propriété contextuelle
-    context = BNode()
-    piirrited_graph.add((SpatialPoint_URI, saref.hasProperty, context))
-    piirrited_graph.add((context, RDF.type, piirritev[concept]))
-
-    # Il faut encore vérifier si des triplets de osmd_graph sont des
-    # étiquettes utilisées en combinaison avec le concept
-    #
-    # Plus de détails : OSM permet à certains tags d'avoir des attributs supplémentaires
-    # à travers des "tags used in combination" ("tuic").
-    # ex: [amemity=bicycle_parking, capacity="12"]
-    # Ici, OSM comprend implicitement que l'attribut "capacity" se rapporte au tag "bicycle_parking"
-    # grâce à la logique interne des tuic.
-    # PIIRRITE gère ces attributs supplémentaires !
-    # Pour cela, il passe par la propriété piirrite:hasRelatedOsmTag
-    # ex: piirritev:OsmAmenityBicycleParking a skos:Concept ;
-    #         piirrite:hasRelatedOsmTag piirritev:hasOsmBicycleParkingCapacity
-    #     osmnode:1 a piirrite:SpatialPoint ;
-    #         piirrite:hasAmenity [ a saref:Property ;
-    #             rdfs:isDefinedBy piirritev:OsmAmenityBicycleParking ;
-    #             piirritev:hasOsmBicycleParkingCapacity '12']
-
-    # Ensemble des propriétés liées au nœud OSM courant
-    tuic_candidates = {}
-    for p, o in osmd_graph.predicate_objects(osm_node):
+    osmd_graph = init_osmd_graph()
+    osm_entities = [
+        (osm_entity, osmd_graph)
+        for osm_entity in osmd_graph.subjects(RDF.type, rdf_type)
+        if isinstance(osm_entity, URIRef)
+    ]
+    return osm_entities, len(osm_entities)
+
+def build_tag_index(piirrite_graph:Graph, piirritev_graph:Graph) -> dict[str, dict]:
+    # Index en mémoire du glossaire, construit une seule fois avant la boucle sur les
+    # nœuds OSM : on évite ainsi de parcourir piirritev_graph et piirrite_graph pour
+    # chaque étiquette de chaque nœud.
+    # - 'concept_schemes_by_name' / 'concepts_by_name' : nom CamelCase -> URI
+    # - 'tuics_by_concept' : URI du concept -> osmId des tuic autorisés
+    # - 'concept_schemes' / 'concepts' : résultats déjà résolus par (clé, valeur) OSM
+    concept_schemes_by_name = {}
+    for concept_scheme in piirritev_graph.subjects(RDF.type, SKOS.ConceptScheme):
+        if isinstance(concept_scheme, URIRef) and str(concept_scheme).startswith(str(piirritev)):
+            concept_schemes_by_name[str(concept_scheme)[len(str(piirritev)):]] = concept_scheme
+
+    concepts_by_name = {}
+    tuics_by_concept = {}
+    for concept in piirritev_graph.subjects(RDF.type, SKOS.Concept):
+        if not isinstance(concept, URIRef) or not str(concept).startswith(str(piirritev)):
+            continue
+        concepts_by_name[str(concept)[len(str(piirritev)):]] = concept
+
+        possible_tuics = []
+        for o in piirritev_graph.objects(concept, piirrite.hasRelatedOsmTag):
+            osm_name = next(piirrite_graph.objects(URIRef(str(o)), piirrite.osmId, True), None)
+            if osm_name:
+                possible_tuics.append(str(osm_name))
+        tuics_by_concept[concept] = tuple(possible_tuics)
+
+    return {
+        'concept_schemes_by_name': concept_schemes_by_name,
+        'concepts_by_name': concepts_by_name,
+        'tuics_by_concept': tuics_by_concept,
+        'concept_schemes': {},
+        'concepts': {},
+    }
+
+def lookup_concept_scheme(tag_index:dict[str, dict], osm_key:str) -> URIRef | None:
+    # schéma de concepts piirritev correspondant à une clé OSM, s'il existe
+    if osm_key not in tag_index['concept_schemes']:
+        tag_index['concept_schemes'][osm_key] = tag_index['concept_schemes_by_name'].get(camel(osm_key))
+
+    return tag_index['concept_schemes'][osm_key]
+
+def lookup_concept(tag_index:dict[str, dict], osm_key:str, osm_value:str) -> tuple[URIRef | None, tuple[str, ...]]:
+    # concept piirritev correspondant à une étiquette OSM, s'il existe,
+    # et osmId des étiquettes utilisables en combinaison avec lui (tuic)
+    if (osm_key, osm_value) not in tag_index['concepts']:
+        concept = tag_index['concepts_by_name'].get(concept_name(osm_key, osm_value))
+        tag_index['concepts'][(osm_key, osm_value)] = (concept, tag_index['tuics_by_concept'].get(concept, ()))
+
+    return tag_index['concepts'][(osm_key, osm_value)]
+
+def get_SpatialPoint_geometry_triples(osmd_graph:Graph,
+                                      SpatialPoint_URI:URIRef,
+                                      osm_geometry) -> list[tuple]:
+    geometries_as_WKT = list(osmd_graph.objects(osm_geometry, geo.asWKT))
+    if len(geometries_as_WKT) != 1:
+        return []
+    geometry_as_WKT = str(geometries_as_WKT[0])
+    geometry = BNode()
+    return [
+        (SpatialPoint_URI, geo.hasGeometry, geometry),
+        (geometry, RDF.type, geo.Geometry),
+        (geometry, geo.asWKT, Literal(str(geometry_as_WKT), datatype = geo['wktLiteral'])),
+    ]
+
+def plan_SpatialEntity_properties(tag_index:dict[str, dict],
+                                  osm_tags:list[tuple[str, str]],
+                                  tuic_candidates:dict[str, str],
+                                  unfounds:dict[str, dict[str, int]]) -> tuple[list[dict], dict[str, dict[str, int]]]:
+    # Propriétés contextuelles (saref:hasProperty) d'une entité, décidées à partir de toutes ses
+    # étiquettes avant d'écrire quoi que ce soit dans le graphe : chaque propriété est un dictionnaire
+    # {'type': concept ou schéma de concepts, 'value': littéral ou None, 'tuics': [(prédicat, littéral)]}
+
+    properties:list[dict] = []
+    for osm_key, osm_value in osm_tags:
+
+        # si la valeur n'a pas pour vocation d'être conceptualisée
+        # et que ce n'est pas un tuic (voir ci-dessous)
+        # en suivant le dictionnaire SKOS, on l'enregistre comme telle
+        if len(osm_value.split(' ')) > 1 or not CONCEPT_CLASSIFIER.is_concept(osm_value):
+            conceptScheme = lookup_concept_scheme(tag_index, osm_key)
+            if conceptScheme is not None:
+                properties.append({'type': conceptScheme, 'value': value_literal(osm_value), 'tuics': []})
+            continue
+
+        # sinon, on lance le processus de conceptualisation
+
+        # OSM utilise du snake_case et PIIRRITE du CamelCase
+        concept_URI, possible_tuics = lookup_concept(tag_index, osm_key, osm_value)
+
+        # Si la clé n'est pas dans le vocabulaire, on ne l'ajoute pas
+        if concept_URI is None:
+            concept = concept_name(osm_key, osm_value)
+            if concept not in unfounds['values'].keys():
+                unfounds['values'][concept] = 1
+            else:
+                unfounds['values'][concept] += 1
+            continue
+
+        # le tag courant est peut-être voué à être utilisé en combinaison avec un autre
+        # tag de la spatialEntity (ex : capacity qui se rapporte à bicycleParking)
+        # -- voir l'explication sur les tuic ci-dessous
+        # Dans ce cas, il ne faut pas l'enregistrer comme concept à part entière
+        #
+        # Si c'est le cas, deux possibilités :
+        # - soit il a déjà été rattaché comme tel, et pas la peine de continuer
+        # - soit il n'a pas déjà été rattaché comme tel, alors on le prévoit comme
+        #   concept à part entière et on l'écartera quand on le rattachera comme tel
+        #   (lors du traitement du tag auquel il se rapporte) : voir (*) ci-dessous
+        osm_key_name = camel(osm_key)
+        if any(str(tuic_URI).endswith(osm_key_name) for property in properties for tuic_URI, _ in property['tuics']):
+            continue
+
+        # on prévoit la propriété contextuelle
+        property = {'type': concept_URI, 'value': None, 'tuics': []}
+        properties.append(property)
+
+        # Il faut encore vérifier si des étiquettes de l'entité sont des
+        # étiquettes utilisées en combinaison avec le concept
+        #
+        # Plus de détails : OSM permet à certains tags d'avoir des attributs supplémentaires
+        # à travers des "tags used in combination" ("tuic").
+        # ex: [amemity=bicycle_parking, capacity="12"]
+        # Ici, OSM comprend implicitement que l'attribut "capacity" se rapporte au tag "bicycle_parking"
+        # grâce à la logique interne des tuic.
+        # PIIRRITE gère ces attributs supplémentaires !
+        # Pour cela, il passe par la propriété piirrite:hasRelatedOsmTag
+        # ex: piirritev:OsmAmenityBicycleParking a skos:Concept ;
+        #         piirrite:hasRelatedOsmTag piirritev:hasOsmBicycleParkingCapacity
+        #     osmnode:1 a piirrite:SpatialPoint ;
+        #         piirrite:hasAmenity [ a saref:Property ;
+        #             rdfs:isDefinedBy piirritev:OsmAmenityBicycleParking ;
+        #             piirritev:hasOsmBicycleParkingCapacity '12']
+
+        # L'ensemble des étiquettes utilisées en combinaison avec le concept PIIRRITEV
+        # courant (possible_tuics) provient de l'index construit par build_tag_index
+        for tuic, tuic_value in tuic_candidates.items():
+            if tuic in possible_tuics:
+                # on a trouvé un tuic !
+                tuic_piirritev_name = camel(tuic) if tuic != osm_value else 'Type'
+                tuic_URI = vocabulary_iri(piirrite, 'has' + concept_name(osm_key, osm_value) + tuic_piirritev_name)
+                property['tuics'].append((tuic_URI, value_literal(tuic_value)))
+
+                # (*) si le tuic était déjà prévu comme concept à part entière,
+                # on écarte ce concept
+                properties = [planned for planned in properties
+                              if str(planned['type']).split('#')[-1] != tuic_piirritev_name]
+
+    return properties, unfounds
+
+def get_SpatialEntity_properties_triples(SpatialEntity_URI:URIRef, properties:list[dict]) -> list[tuple]:
+    # triplets des propriétés prévues par plan_SpatialEntity_properties
+    triples:list[tuple] = []
+    for property in properties:
+        context = BNode()
+        triples.append((SpatialEntity_URI, saref.hasProperty, context))
+        triples.append((context, RDF.type, property['type']))
+        if property['value'] is not None:
+            triples.append((context, saref.hasValue, property['value']))
+        triples.extend((context, tuic_URI, tuic_literal) for tuic_URI, tuic_literal in property['tuics'])
+
+    return triples
+
+def get_osm_tags(osm_entity:URIRef, osmd_graph:Graph) -> tuple[list[tuple[str, str]], dict[str, str]]:
+    # étiquettes (clé, valeur) de l'entité, relevées une seule fois, et par clé celles
+    # qui peuvent être des tuic
+    osm_tags:list[tuple[str, str]] = []
+    tuic_candidates:dict[str, str] = {}
+    for p, o in osmd_graph.predicate_objects(osm_entity):
         if 'wiki/Key:' in str(p):
             tuic_candidates[str(p).split('wiki/Key:')[-1]] = str(o)
-    
-    # Ensemble des étiquettes utilisées en combinaison avec le concept PIIRRITEV courant
-    possible_tuics = []
-    for o in piirritev_graph.objects(piirritev[concept], piirrite.hasRelatedOsmTag):
-        osm_name = next(piirrite_graph.objects(URIRef(str(o)), piirrite.osmId, True), None)
-        if osm_name:
-            possible_tuics.append(str(osm_name))
-
-    for tuic, tuic_value in tuic_candidates.items():
-        if tuic in possible_tuics:
-            # on a trouvé un tuic !
-            tuic_piirritev_name = snake_to_camel(tuic) if tuic != osm_value else 'Type'
-            tuic_URI = piirrite['has' + snake_to_camel(osm_key) + snake_to_camel(osm_value) + tuic_piirritev_name]
-            converted_value = str_to_best_type(tuic_value)
-            piirrited_graph.add((context, tuic_URI, Literal(converted_value, datatype = value_datatype(converted_value))))
-
-            # (*) si le tuic était déjà enregistré comme concept à part entière,
-            # on supprime ce concept
-            for property in piirrited_graph.objects(SpatialPoint_URI, saref.hasProperty):
-                for property_type in piirrited_graph.objects(property, RDF.type):
-                    pt_name = str(property_type).split('#')[1]
-                    if pt_name == tuic_piirritev_name:
-                        remove_blank_node_property(piirrited_graph,
-                                                   SpatialPoint_URI,
-                                                   saref.hasProperty,
-                                                   property_type)
+            if isinstance(p, URIRef) and str(p).startswith(str(osm)):
+                # if 'addr:' in str(p) or 'operator' in str(p):
+                #     continue
+                osm_tags.append((str(p).split('wiki/Key:')[-1], str(o)))
 
-    return unfounds
+    return osm_tags, tuic_candidates
+
+def get_SpatialPoint_triples(osm_node:URIRef,
+                             osmd_graph:Graph,
+                             tag_index:dict[str, dict],
+                             unfounds:dict[str, dict[str, int]]) -> tuple[list[tuple], dict[str, dict[str, int]]]:
+    # Tous les triplets du SpatialPoint, construits avant d'être ajoutés d'un coup
+    # (à un graphe ou à un TripleSink)
+    SpatialPoint_URI = osm_entity_iri(osmnode, osm_node)
+
+    triples:list[tuple] = [
+        (SpatialPoint_URI, RDF.type, piirrite.SpatialPoint),
+        (SpatialPoint_URI, RDF.type, osm.node),
+    ]
+
+    for osm_geometry in osmd_graph.objects(osm_node, geo.hasGeometry):
+        triples.extend(get_SpatialPoint_geometry_triples(osmd_graph, SpatialPoint_URI, osm_geometry))
+
+    osm_tags, tuic_candidates = get_osm_tags(osm_node, osmd_graph)
+    properties, unfounds = plan_SpatialEntity_properties(tag_index, osm_tags, tuic_candidates, unfounds)
+    triples.extend(get_SpatialEntity_properties_triples(SpatialPoint_URI, properties))
+
+    return triples, unfounds
 
 def add_SpatialPoint_to_piirrited(osm_node:URIRef,
                                osmd_graph:Graph,
-                               piirrite_graph:Graph,
-                               piirritev_graph:Graph,
+                               tag_index:dict[str, dict],
                                piirrited_graph:Graph,
                                unfounds:dict[str, dict[str, int]]) -> dict[str, dict[str, int]]:
-    SpatialPoint_URI = osmnode[str(osm_node).split('/')[-1]]
-
-    piirrited_graph.add((SpatialPoint_URI, RDF.type, piirrite.SpatialPoint))
-    piirrited_graph.add((SpatialPoint_URI, RDF.type, osm.node))
-
-    for p, o in osmd_graph.predicate_objects(osm_node):
-        if p == geo.hasGeometry:
-            add_geometry_to_SpatialPoint(piirrited_graph, osmd_graph, SpatialPoint_URI, o)
-        
-        elif isinstance(p, URIRef) and str(p).startswith(str(osm)) and 'wiki/Key:' in str(p):
-            # if 'addr:' in str(p) or 'operator' in str(p):
-            #     continue
-            unfounds = add_context_to_SpatialPoint(
-                osm_node, piirrite_graph, piirritev_graph, piirrited_graph, osmd_graph,
-                SpatialPoint_URI, str(p).split('wiki/Key:')[-1], str(o), unfounds
-            )
+    triples, unfounds = get_SpatialPoint_triples(osm_node, osmd_graph, tag_index, unfounds)
+    piirrited_graph.addN((s, p, o, piirrited_graph) for s, p, o in triples)
 
     return unfounds
 
@@ -234,31 +302,261 @@ def display_unfounds(unfounds:dict[str, dict[str, int]]) -> None:
     print(f'{unfound_values} valeurs non trouvées dans piirritev:')
     print(sort_dict_by_values(unfounds['values']))
 
+def merge_unfounds(unfounds:dict[str, dict[str, int]],
+                   shard_unfounds:dict[str, dict[str, int]]) -> dict[str, dict[str, int]]:
+    for kind, counts in shard_unfounds.items():
+        for name, n_unfound in counts.items():
+            unfounds[kind][name] = unfounds[kind].get(name, 0) + n_unfound
+
+    return unfounds
+
+###########################
+# Peuplement parallèle
+#
+# Chaque entité OSM ne dépend que de ses propres triplets et du glossaire (en lecture seule) :
+# les entités sont donc réparties en lots ("shards") traités par un pool de processus.
+# Chaque processus renvoie les triplets de son lot, déjà sérialisés dans le format de l'ABox :
+# le processus parent les écrit tels quels, lot après lot, dans l'ordre des entités.
+
+_worker_tag_index:dict[str, dict] = {}
+_worker_ABox_format:str | None = None
+
+def get_osm_entity_triples(osmd_graph:Graph, osm_entity:URIRef) -> list[tuple]:
+    # triplets de l'entité OSM et de sa géométrie : c'est tout ce dont a besoin son instanciation
+    osm_entity_triples = list(osmd_graph.triples((osm_entity, None, None)))
+    for osm_geometry in osmd_graph.objects(osm_entity, geo.hasGeometry):
+        osm_entity_triples.extend(osmd_graph.triples((osm_geometry, None, None)))
+
+    return osm_entity_triples
+
+def iter_osm_shards(osm_entities, shard_size:int):
+    shard = []
+    for osm_entity, osmd_graph in osm_entities:
+        shard.append((osm_entity, get_osm_entity_triples(osmd_graph, osm_entity)))
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+def init_worker(tag_index:dict[str, dict], ABox_format:str | None = None) -> None:
+    # ABox_format = None : les lots ne sont pas écrits, inutile de les sérialiser
+    global _worker_tag_index, _worker_ABox_format
+    _worker_tag_index = tag_index
+    _worker_ABox_format = ABox_format
+
+def fill_in_shard(shard:list[tuple[URIRef, list[tuple]]]) -> tuple[list[tuple], str | None, dict[str, dict[str, int]]]:
+    osmd_graph = Graph()
+    shard_triples:list[tuple] = []
+    unfounds:dict[str, dict[str, int]] = {'keys': {}, 'values': {}}
+
+    for osm_node, osm_node_triples in shard:
+        osmd_graph.addN((s, p, o, osmd_graph) for s, p, o in osm_node_triples)
+        SpatialPoint_triples, unfounds = get_SpatialPoint_triples(osm_node, osmd_graph, _worker_tag_index, unfounds)
+        shard_triples.extend(SpatialPoint_triples)
+
+    # Les triplets servent au processus parent à indexer le lot (index spatial, ABox compilée),
+    # le texte à l'écrire sans le sérialiser à nouveau. Les nœuds anonymes de rdflib ont des
+    # identifiants aléatoires (uuid4) : ceux de deux processus ne peuvent pas se confondre.
+    shard_ABox = serialize_block(shard_triples, piirrited_namespaces, _worker_ABox_format) \
+        if _worker_ABox_format is not None else None
+    return shard_triples, shard_ABox, unfounds
+
+###########################
+# Peuplement incrémental
+#
+# En mode incrémental seulement, une empreinte est calculée pour chaque entité OSM à partir de
+# ses triplets source et des entrées du glossaire qu'elle utilise ; les empreintes sont gardées
+# à côté de l'ABox. Au peuplement incrémental suivant, une entité dont l'empreinte n'a pas changé
+# est recopiée depuis l'ABox précédente au lieu d'être reconstruite, et celles qui ont disparu ne
+# sont pas recopiées. L'ABox précédente n'est pas parsée : l'énoncé Turtle d'une entité recopiée
+# est repris tel quel (voir index_subject_statements), et ses triplets, dont ont besoin l'index
+# spatial et l'ABox compilée, sont lus dans la version compilée de l'ABox précédente.
+
+def hash_osm_entity(osm_entity:URIRef, osmd_graph:Graph, tag_index:dict[str, dict]) -> str:
+    source = [
+        ' '.join(term.n3() for term in triple)
+        for triple in get_osm_entity_triples(osmd_graph, osm_entity)
+    ]
+    # les concepts et tuic auxquels renvoient les étiquettes : une modification du
+    # glossaire qui les concerne change donc l'empreinte
+    for p, o in osmd_graph.predicate_objects(osm_entity):
+        if isinstance(p, URIRef) and 'wiki/Key:' in str(p):
+            osm_key = str(p).split('wiki/Key:')[-1]
+            source.append(repr((osm_key,
+                                lookup_concept_scheme(tag_index, osm_key),
+                                lookup_concept(tag_index, osm_key, str(o)))))
+
+    return hashlib.sha1('\n'.join(sorted(source)).encode('utf-8')).hexdigest()
+
+def load_ABox_hashes(ABox_file:str, ABox_hashes_file:str, incremental:bool, ABox_format:str = 'turtle') -> dict | None:
+    # None hors du mode incrémental : aucune empreinte n'est calculée
+    # - 'previous' : empreintes du dernier peuplement, vides si l'on repart de zéro
+    # - 'current' : empreintes du peuplement en cours, pour que le suivant puisse être incrémental
+    # - 'previous_ABox_graph' : l'ABox précédente compilée, d'où sont lus les triplets des entités inchangées
+    # - 'previous_ABox_statements' / 'previous_ABox_header' : position de l'énoncé de chaque entité
+    #   dans l'ABox précédente et préfixes dont ils dépendent, vides si l'ABox est écrite en N-Triples
+    if not incremental:
+        return None
+    ABox_hashes = {'previous': {}, 'current': {}, 'previous_ABox_file': ABox_file,
+                   'previous_ABox_graph': Graph(), 'previous_ABox_statements': {}, 'previous_ABox_header': ''}
+    if not os.path.exists(ABox_hashes_file) or not os.path.exists(ABox_file):
+        print('Pas de peuplement précédent : l\'ABox sera entièrement reconstruite.')
+        return ABox_hashes
+
+    print('Récupération de l\'ABox précédente…')
+    with open(ABox_hashes_file, 'r', encoding = 'utf-8') as ABox_hashes_file_content:
+        ABox_hashes['previous'] = json.load(ABox_hashes_file_content)
+    ABox_hashes['previous_ABox_graph'] = load_compiled_graph(ABox_file, ABox_format)
+    if ABox_format == 'turtle':
+        ABox_hashes['previous_ABox_statements'], ABox_hashes['previous_ABox_header'] = index_subject_statements(ABox_file)
+
+    return ABox_hashes
+
+def save_ABox_hashes(ABox_hashes:dict | None, ABox_hashes_file:str) -> None:
+    # après un peuplement complet, les empreintes d'un peuplement précédent ne décrivent plus
+    # l'ABox : elles sont retirées, et le prochain peuplement incrémental repartira de zéro
+    if ABox_hashes is None:
+        if os.path.exists(ABox_hashes_file):
+            os.remove(ABox_hashes_file)
+        return
+    with open(ABox_hashes_file + '.tmp', 'w', encoding = 'utf-8') as ABox_hashes_file_content:
+        json.dump(ABox_hashes['current'], ABox_hashes_file_content, indent = 0, sort_keys = True)
+    os.replace(ABox_hashes_file + '.tmp', ABox_hashes_file)
+
+    removed = len(ABox_hashes['previous'].keys() - ABox_hashes['current'].keys())
+    if removed:
+        print(f'{removed} entités disparues des données OSM ont été retirées de l\'ABox.')
+
+def filter_unchanged_osm_entities(osm_entities,
+                                  ABox_hashes:dict,
+                                  hash_entity:Callable[[URIRef, Graph], str],
+                                  sink:TripleSink,
+                                  get_previous_links:Callable[[URIRef], Iterable[tuple]] | None = None):
+    # Ne laisse passer que les entités OSM à reconstruire ; les autres sont recopiées
+    # directement depuis l'ABox précédente, ainsi que les triplets d'autres sujets qui
+    # les concernent (get_previous_links)
+    reused = 0
+    statements = ABox_hashes['previous_ABox_statements']
+    with open(ABox_hashes['previous_ABox_file'], 'rb') if statements else nullcontext() as previous_ABox:
+        for osm_entity, osmd_graph in osm_entities:
+            entity_hash = hash_entity(osm_entity, osmd_graph)
+            ABox_hashes['current'][str(osm_entity)] = entity_hash
+
+            previous_triples = ABox_hashes['previous_ABox_graph'].store.description(osm_entity) \
+                if ABox_hashes['previous'].get(str(osm_entity)) == entity_hash else []
+            if not previous_triples:
+                yield osm_entity, osmd_graph
+                continue
+
+            span = statements.get(str(osm_entity))
+            if span is not None:
+                previous_ABox.seek(span[0])
+                sink.copy(previous_triples, previous_ABox.read(span[1] - span[0]).decode('utf-8'),
+                          ABox_hashes['previous_ABox_header'])
+            else:
+                sink.add(previous_triples)
+            if get_previous_links is not None:
+                sink.add(get_previous_links(osm_entity))
+            reused += 1
+
+    if ABox_hashes['previous']:
+        print(f'\n{reused} entités inchangées reprises de l\'ABox précédente.')
+
 def use_osm_data_to_fill_in_piirrited_graph(piirrite_graph:Graph,
                                          piirritev_graph:Graph,
-                                         piirrited_graph:Graph) -> None:
-    osmd_graph = init_osmd_graph()
+                                         piirrited_graph:Graph,
+                                         workers:int = 1,
+                                         shard_size:int = 2_000,
+                                         streaming:bool = False,
+                                         write_block:Callable[..., None] | None = None,
+                                         ABox_hashes:dict | None = None,
+                                         ABox_format:str = 'turtle') -> None:
+    # Sans write_block, tout le peuplement est gardé dans piirrited_graph ;
+    # avec, les SpatialPoints sont écrits par lots, sans passer par piirrited_graph (voir TripleSink).
+    # ABox_format est celui de write_block : les processus y sérialisent leurs lots.
+    # Avec ABox_hashes (voir load_ABox_hashes), seules les entités modifiées sont reconstruites
+    with stage('osm_data'):
+        osm_nodes, n_osm_nodes = get_osm_entities(osm['node'], streaming)
+    with stage('tag_index'):
+        tag_index = build_tag_index(piirrite_graph, piirritev_graph)
+    sink = TripleSink(piirrited_graph, write_block)
+
+    if ABox_hashes is not None:
+        osm_nodes = filter_unchanged_osm_entities(
+            osm_nodes, ABox_hashes,
+            lambda osm_node, osmd_graph: hash_osm_entity(osm_node, osmd_graph, tag_index),
+            sink
+        )
+        # le nombre d'entités à reconstruire n'est pas connu à l'avance
+        if ABox_hashes['previous']:
+            n_osm_nodes = None
+
+    progress_message = f'des {n_osm_nodes} nœuds traités…' if n_osm_nodes is not None else 'nœuds traités…'
 
     # on veut garder la trace des clés et valeurs OSM non trouvées dans PIIRRITE
     unfounds:dict[str, dict[str, int]] = {'keys': {}, 'values': {}}
 
-    osm_nodes = list(osmd_graph.subjects(RDF.type, osm['node']))
-    for count, osm_node in enumerate(osm_nodes):
-        if isinstance(osm_node, URIRef):
-            unfounds = add_SpatialPoint_to_piirrited(osm_node, osmd_graph, piirrite_graph,
-                                                  piirritev_graph, piirrited_graph, unfounds)
-        display_progress_bar(count, len(osm_nodes), message = f'des {len(osm_nodes)} nœuds traités…')
+    if workers > 1:
+        shards = iter_osm_shards(osm_nodes, shard_size)
+        ABox_format = ABox_format if write_block is not None else None
+        with stage('entities'), Pool(workers, initializer = init_worker, initargs = (tag_index, ABox_format)) as pool:
+            # les lots sont rendus dans l'ordre de soumission : l'écriture est déterministe
+            for n_shards, (shard_triples, shard_ABox, shard_unfounds) in enumerate(imap_bounded(pool, fill_in_shard, shards, 2 * workers), start = 1):
+                if write_block is not None:
+                    write_block(shard_triples, shard_ABox)
+                else:
+                    sink.add(shard_triples)
+                unfounds = merge_unfounds(unfounds, shard_unfounds)
+                display_progress(n_shards * shard_size if n_osm_nodes is None else min(n_shards * shard_size, n_osm_nodes),
+                                 n_osm_nodes, message = progress_message)
+
+        sink.flush()
+        display_unfounds(unfounds)
+        return
+
+    with stage('entities'):
+        for n_processed, (osm_node, osmd_graph) in enumerate(osm_nodes, start = 1):
+            SpatialPoint_triples, unfounds = get_SpatialPoint_triples(osm_node, osmd_graph, tag_index, unfounds)
+            sink.add(SpatialPoint_triples)
+            display_progress(n_processed, n_osm_nodes, message = progress_message)
+        sink.flush()
     
     display_unfounds(unfounds)
 
-def main():
-    piirrite_graph = init_piirrite_graph()
-    piirritev_graph = init_piirritev_graph()
-    piirrited_graph = init_piirrited_graph()
-    use_osm_data_to_fill_in_piirrited_graph(piirrite_graph, piirritev_graph, piirrited_graph)
-    piirrited_graph.serialize(ABox_file, 'turtle')
+@profiled_main('modelet_1.instanciation')
+def main(workers:int = 1, streaming:bool = False, ABox_format:str = 'turtle', incremental:bool = False):
+    with stage('load_graphs'):
+        piirrite_graph = init_piirrite_graph()
+        piirritev_graph = init_piirritev_graph()
+        piirrited_graph = init_piirrited_graph()
+        ABox_hashes = load_ABox_hashes(ABox_file, ABox_hashes_file, incremental, ABox_format)
+    # l'ABox n'est remplacée qu'une fois entièrement écrite
+    # les triplets sont relevés au fil de l'écriture pour écrire sa version compilée (voir utilities/compiled_graph.py)
+    compiled_ABox = CompiledGraphWriter(piirrited_namespaces)
+    with open_rdf_writer(ABox_file, piirrited_namespaces, ABox_format) as write_block:
+        def write_and_index_block(block:Iterable[tuple], text:str | None = None) -> None:
+            compiled_ABox.add(block)
+            write_block(block, text)
+        with stage('fill_in'):
+            use_osm_data_to_fill_in_piirrited_graph(piirrite_graph, piirritev_graph, piirrited_graph,
+                                                 workers, streaming = streaming, write_block = write_and_index_block,
+                                                 ABox_hashes = ABox_hashes, ABox_format = ABox_format)
+    save_ABox_hashes(ABox_hashes, ABox_hashes_file)
+    with stage('compiled_graph'):
+        save_compiled_graph(compiled_ABox, ABox_file)
 
     print('\nOntologie peuplée avec succès.')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # workers = 1 : peuplement séquentiel
+    # workers > 1 : peuplement réparti sur autant de processus
+    workers = 1
+    # streaming = True : les données OSM sont lues en flux plutôt que chargées en entier
+    streaming = False
+    # ABox_format = 'turtle' ou 'nt' (N-Triples, plus rapide à écrire et à relire)
+    ABox_format = 'turtle'
+    # incremental = True : seules les entités OSM modifiées depuis le dernier peuplement
+    # (ou dont les entrées du glossaire ont changé) sont reconstruites
+    incremental = False
+    main(workers, streaming, ABox_format, incremental)
\ No newline at end of file
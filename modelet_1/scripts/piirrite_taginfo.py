@@ -0,0 +1,307 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable
+import requests
+
+TAGINFO_API_V4 = "https://taginfo.openstreetmap.org/api/4"
+
+###########################
+# Client taginfo
+#
+# Chaque clé a un enregistrement (nombre d'occurences, valeurs, combinaisons) rempli au plus
+# une fois par exécution : le filtre des clés et la récupération des valeurs ne réinterrogent
+# plus taginfo pour une clé déjà vue, et deux threads demandant la même chose en même temps
+# attendent la même requête.
+# Les nombres d'occurences viennent de /keys/all, qui liste toutes les clés triées par nombre
+# d'occurences : quelques pages suffisent là où il fallait une requête /key/overview par clé.
+
+def _count_all_from_overview(j: dict) -> int:
+    counts = j.get("data", {}).get("counts", [])
+    for c in counts:
+        if c.get("type") == "all":
+            return int(c.get("count", 0))
+    return 0
+
+def _keys_all_params(page: int, rp: int) -> dict:
+    return {
+        "page": page,
+        "rp": rp,
+        "sortname": "count_all",
+        "sortorder": "desc",
+    }
+
+def _key_counts_from_page(
+    j: dict,
+    page: int,
+    *,
+    min_count_all: int,
+    rp: int,
+) -> tuple[dict[str, int], bool]:
+    """
+    Retourne ({clé: nombre d'occurences} de la page au-dessus du seuil, s'il faut lire la page suivante).
+    """
+    counts: dict[str, int] = {}
+    data = (j.get("data") or [])
+    if not data:
+        return counts, False
+
+    for item in data:
+        cnt = int(item.get("count_all", 0))
+        if cnt <= min_count_all:
+            return counts, False
+        counts[str(item.get("key", ""))] = cnt
+
+    total = int(j.get("total", 0))
+    return counts, page * rp < total
+
+def _values_page_params(key: str, page: int, rp: int) -> dict:
+    return {
+        "key": key,
+        "page": page,
+        "rp": rp,
+        "sortname": "count_all",
+        "sortorder": "desc",
+        "filter": "all",
+    }
+
+def _values_over_threshold_from_page(
+    j: dict,
+    page: int,
+    *,
+    min_count_all: int,
+    rp: int,
+    normalize_spaces_to_underscore: bool,
+) -> tuple[list[str], bool]:
+    """
+    Retourne (valeurs de la page au-dessus du seuil, s'il faut lire la page suivante).
+    """
+    values: list[str] = []
+    data = (j.get("data") or [])
+    if not data:
+        return values, False
+
+    for item in data:
+        cnt = int(item.get("count", 0))
+        if cnt <= min_count_all:
+            return values, False
+
+        v = str(item.get("value", "")).strip()
+        if not v:
+            continue
+
+        if normalize_spaces_to_underscore:
+            v = v.replace(" ", "_")
+
+        values.append(v)
+
+    # pagination
+    total = int(j.get("total", 0))
+    return values, page * rp < total
+
+def _combinations_page_params(key: str, page: int, rp: int) -> dict:
+    return {
+        "key": key,
+        "page": page,
+        "rp": rp,
+        "sortname": "together_count",
+        "sortorder": "desc",
+        "filter": "all",
+    }
+
+def _combinations_over_threshold_from_page(
+    j: dict,
+    page: int,
+    *,
+    min_together_count: int,
+    rp: int,
+) -> tuple[list[str], bool]:
+    """
+    Retourne (clés combinées de la page au-dessus du seuil, s'il faut lire la page suivante).
+    """
+    other_keys: list[str] = []
+    data = (j.get("data") or [])
+    if not data:
+        return other_keys, False
+
+    for item in data:
+        if int(item.get("together_count", 0)) <= min_together_count:
+            return other_keys, False
+        other_key = str(item.get("other_key", "")).strip()
+        if other_key:
+            other_keys.append(other_key)
+
+    total = int(j.get("total", 0))
+    return other_keys, page * rp < total
+
+def _dedupe(items: list[str]) -> list[str]:
+    # dédoublonnage en gardant l'ordre
+    seen = set()
+    return [i for i in items if not (i in seen or seen.add(i))] # type: ignore
+
+class TaginfoClient:
+    ''' Taginfo client serving the overview, values and combinations of the keys from one record
+    per key, fetched at most once per run. Identical requests made concurrently by several threads
+    are sent only once. The occurrence counts are read from the multi-key listing /keys/all.
+    '''
+
+    def __init__(self,
+                 session: requests.Session,
+                 base_url: str | None = None,
+                 timeout_s: float = 20.0) -> None:
+        self.session = session
+        self.base_url = base_url or TAGINFO_API_V4
+        self.timeout_s = timeout_s
+        self.records: dict[str, dict] = {}
+        # seuil jusqu'auquel /keys/all a été lu : une clé absente de la liste est en dessous
+        self.listed_above: int | None = None
+        self.lock = threading.Lock()
+        self.results: dict[tuple, Future] = {}
+        self.n_requests = 0
+
+    def _record(self, key: str) -> dict:
+        with self.lock:
+            return self.records.setdefault(key, {'count_all': None, 'values': {}, 'combinations': {}})
+
+    def _once(self, request: tuple, fetch: Callable[[], object]):
+        # une même requête n'est envoyée qu'une fois : les appels suivants, même concurrents,
+        # attendent son résultat ; un échec n'est pas retenu, la requête pourra être retentée
+        with self.lock:
+            future = self.results.get(request)
+            owner = future is None
+            if owner:
+                future = self.results[request] = Future()
+        if not owner:
+            return future.result() # type: ignore
+
+        try:
+            result = fetch()
+        except BaseException as e:
+            with self.lock:
+                del self.results[request]
+            future.set_exception(e) # type: ignore
+            raise
+        future.set_result(result) # type: ignore
+        return result
+
+    def _get_json(self, path: str, params: dict) -> dict:
+        r = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout_s)
+        with self.lock:
+            self.n_requests += 1
+        r.raise_for_status()
+        return r.json()
+
+    def load_key_counts(self, min_count_all: int, rp: int = 999) -> None:
+        ''' Reads the occurrence counts of all the keys above a threshold from /keys/all.
+        Args:
+            min_count_all (int) : The threshold under which the listing stops.
+            rp (int) : The number of keys per page.
+        '''
+        if self.listed_above is not None and self.listed_above <= min_count_all:
+            return
+
+        def fetch() -> None:
+            page = 1
+            while True:
+                counts, has_next_page = _key_counts_from_page(
+                    self._get_json("keys/all", _keys_all_params(page, rp)), page, min_count_all=min_count_all, rp=rp
+                )
+                for key, count_all in counts.items():
+                    self._record(key)['count_all'] = count_all
+                if not has_next_page:
+                    break
+                page += 1
+            with self.lock:
+                self.listed_above = min_count_all if self.listed_above is None else min(self.listed_above, min_count_all)
+
+        self._once(('keys/all', min_count_all, rp), fetch)
+
+    def count_all(self, key: str) -> int:
+        ''' Returns the number of occurrences of a key, from /keys/all if it was read, else from /key/overview.
+        Args:
+            key (str) : The OSM key.
+        Returns:
+            int : The number of occurrences of the key.
+        '''
+        record = self._record(key)
+        if record['count_all'] is None:
+            def fetch() -> int:
+                return _count_all_from_overview(self._get_json("key/overview", {"key": key}))
+            record['count_all'] = self._once(('key/overview', key), fetch)
+        return record['count_all']
+
+    def keys_over_threshold(self, keys: list[str], min_count_all: int) -> list[str]:
+        ''' Returns the keys having more than min_count_all occurrences, in their original order.
+        Args:
+            keys (list[str]) : The OSM keys to filter.
+            min_count_all (int) : The minimum number of occurrences (excluded).
+        Returns:
+            list[str] : The keys over the threshold.
+        '''
+        self.load_key_counts(min_count_all)
+        kept = []
+        for key in keys:
+            record = self.records.get(key)
+            if record is not None and record['count_all'] is not None and record['count_all'] > min_count_all:
+                kept.append(key)
+        return kept
+
+    def values(self,
+               key: str,
+               *,
+               min_count_all: int = 10_000,
+               rp: int = 200,
+               normalize_spaces_to_underscore: bool = True) -> list[str]:
+        ''' Returns the values of a key having more than min_count_all occurrences, most used first.
+        Args:
+            key (str) : The OSM key.
+            min_count_all (int) : The minimum number of occurrences of a value (excluded).
+            rp (int) : The number of values per page.
+            normalize_spaces_to_underscore (bool) : Whether to replace the spaces of the values by underscores.
+        Returns:
+            list[str] : The values of the key.
+        '''
+        record = self._record(key)
+        request = (min_count_all, normalize_spaces_to_underscore)
+        if request not in record['values']:
+            def fetch() -> list[str]:
+                values: list[str] = []
+                page = 1
+                while True:
+                    page_values, has_next_page = _values_over_threshold_from_page(
+                        self._get_json("key/values", _values_page_params(key, page, rp)), page,
+                        min_count_all=min_count_all, rp=rp, normalize_spaces_to_underscore=normalize_spaces_to_underscore,
+                    )
+                    values.extend(page_values)
+                    if not has_next_page:
+                        break
+                    page += 1
+                return _dedupe(values)
+            record['values'][request] = self._once(('key/values', key) + request, fetch)
+        return list(record['values'][request])
+
+    def combinations(self, key: str, *, min_together_count: int = 10_000, rp: int = 200) -> list[str]:
+        ''' Returns the keys used together with a key more than min_together_count times, most used first.
+        Args:
+            key (str) : The OSM key.
+            min_together_count (int) : The minimum number of objects having both keys (excluded).
+            rp (int) : The number of keys per page.
+        Returns:
+            list[str] : The keys combined with the key.
+        '''
+        record = self._record(key)
+        if min_together_count not in record['combinations']:
+            def fetch() -> list[str]:
+                other_keys: list[str] = []
+                page = 1
+                while True:
+                    page_keys, has_next_page = _combinations_over_threshold_from_page(
+                        self._get_json("key/combinations", _combinations_page_params(key, page, rp)), page,
+                        min_together_count=min_together_count, rp=rp,
+                    )
+                    other_keys.extend(page_keys)
+                    if not has_next_page:
+                        break
+                    page += 1
+                return _dedupe(other_keys)
+            record['combinations'][min_together_count] = self._once(('key/combinations', key, min_together_count), fetch)
+        return list(record['combinations'][min_together_count])
@@ -3,6 +3,8 @@ import requests
 from rdflib import Graph, Namespace, Literal
 from rdflib.namespace import SKOS, RDF, RDFS, OWL, XSD
 from utilities.utilities import *
+from utilities.graph_cache import load_cached_graph
+from utilities.profiling import stage, profiled_main
 
 piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
 piirritev = Namespace('http://piirrite.univ-lyon1.fr/vocabulary#')
@@ -35,9 +37,7 @@ def update_previous_modelet(update_level:int) -> None:
 
 def init_piirrite_graph() -> Graph:
     copy_file(PREVIOUS_MODELET + TBOX_FILE, CURRENT_MODELET + TBOX_FILE)
-    piirrite_graph = Graph()
-    with open(CURRENT_MODELET + TBOX_FILE, 'r', encoding = 'utf-8') as TBox_file_content:
-        piirrite_graph.parse(data = TBox_file_content.read(), format = 'turtle')
+    piirrite_graph = load_cached_graph(CURRENT_MODELET + TBOX_FILE)
 
     add_SpatialEntity_to_piirrite(piirrite_graph)
     add_SpatialSegment_to_piirrite(piirrite_graph)
@@ -53,19 +53,11 @@ def init_piirrite_graph() -> Graph:
 
 def init_piirritev_graph() -> Graph:
     copy_file(PREVIOUS_MODELET + GOT_FILE, CURRENT_MODELET + GOT_FILE)
-    piirritev_graph = Graph()
-    with open(CURRENT_MODELET + GOT_FILE, 'r', encoding = 'utf-8') as GoT_file_content:
-        piirritev_graph.parse(data = GoT_file_content.read(), format = 'turtle')
-
-    return piirritev_graph
+    return load_cached_graph(CURRENT_MODELET + GOT_FILE)
 
 def init_piirrite2_graph() -> Graph:
     copy_file(PREVIOUS_MODELET + TBOX2_FILE, CURRENT_MODELET + TBOX2_FILE)
-    piirrite2_graph = Graph()
-    with open(CURRENT_MODELET + TBOX2_FILE, 'r', encoding = 'utf-8') as TBox2_file_content:
-        piirrite2_graph.parse(data = TBox2_file_content.read(), format = 'turtle')
-
-    return piirrite2_graph
+    return load_cached_graph(CURRENT_MODELET + TBOX2_FILE)
 
 def add_SpatialEntity_to_piirrite(piirrite_graph:Graph) -> None:
     SpatialEntity_URI = piirrite.SpatialEntity
@@ -181,15 +173,19 @@ def update_OsmEntity(piirrite_graph:Graph) -> None:
     
 ###########################
 
+@profiled_main('modelet_2.creation')
 def main(update_level:int):
-    update_previous_modelet(update_level)
-    piirrite_graph = init_piirrite_graph()
-    piirritev_graph = init_piirritev_graph()
-    piirrite2_graph = init_piirrite2_graph()
+    with stage('update_previous_modelet'):
+        update_previous_modelet(update_level)
+    with stage('init_graphs'):
+        piirrite_graph = init_piirrite_graph()
+        piirritev_graph = init_piirritev_graph()
+        piirrite2_graph = init_piirrite2_graph()
     
-    piirrite_graph.serialize(CURRENT_MODELET + TBOX_FILE, 'turtle')
-    piirritev_graph.serialize(CURRENT_MODELET + GOT_FILE, 'turtle')
-    piirrite2_graph.serialize(CURRENT_MODELET + TBOX2_FILE, 'turtle')
+    with stage('serialize'):
+        piirrite_graph.serialize(CURRENT_MODELET + TBOX_FILE, 'turtle')
+        piirritev_graph.serialize(CURRENT_MODELET + GOT_FILE, 'turtle')
+        piirrite2_graph.serialize(CURRENT_MODELET + TBOX2_FILE, 'turtle')
 
     print(f'Ontologie et glossaire initialisés, remplis et sauvegardés avec succès.')
 
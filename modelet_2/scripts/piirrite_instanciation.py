@@ -1,7 +1,17 @@
+import hashlib
+from multiprocessing import Pool
 from rdflib import Graph, Namespace, Literal, URIRef, BNode
-from rdflib.namespace import OWL, RDF, RDFS, XSD, SKOS
+from rdflib.namespace import OWL, RDF, RDFS, XSD
 from utilities.utilities import *
-from modelet_1.scripts.piirrite_creation import should_be_concept
+from utilities.rdf_stream import iter_osm_entities, open_rdf_writer, serialize_block, TripleSink
+from utilities.graph_cache import load_cached_graph
+from utilities.compiled_graph import CompiledGraphWriter, save_compiled_graph, load_compiled_graph
+from utilities.interning import osm_entity_iri
+from utilities.geometry_store import GeometryStore
+from utilities.profiling import count, stage, profiled_main
+from modelet_1.scripts.piirrite_instanciation import build_tag_index, \
+    merge_unfounds, iter_osm_shards, hash_osm_entity, load_ABox_hashes, save_ABox_hashes, \
+    filter_unchanged_osm_entities, get_osm_tags, plan_SpatialEntity_properties, get_SpatialEntity_properties_triples
 
 piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
 piirritev = Namespace('http://piirrite.univ-lyon1.fr/vocabulary#')
@@ -18,275 +28,186 @@ GoT_file = get_current_path() + '/../GoT.ttl'
 TBox_file = get_current_path() + '/../TBox.ttl'
 TBox2_file = get_current_path() + '/../TBox2.ttl'
 ABox_file = get_current_path() + '/../ABox.ttl'
+ABox_hashes_file = get_current_path() + '/../ABox.hashes.json'
 previous_ABox_file = get_current_path() + '/../../modelet_1/ABox.ttl'
 
+# distance en mètres sous laquelle un point et le bout d'un segment sont confondus
+# (les coordonnées OSM ont 7 décimales, soit environ 1 cm)
+EXTREMITY_TOLERANCE_M = 0.05
+
 def init_piirrite_graph() -> Graph:
-    piirrite_graph = Graph()
-    with open(TBox_file, 'r', encoding = 'utf-8') as TBox_file_content:
-        piirrite_graph.parse(data = TBox_file_content.read(), format = 'turtle')
-    with open(TBox2_file, 'r', encoding = 'utf-8') as TBox2_file_content:
-        piirrite_graph.parse(data = TBox2_file_content.read(), format = 'turtle')
-    
-    return piirrite_graph
+    return load_cached_graph([TBox_file, TBox2_file])
 
 def init_piirritev_graph() -> Graph:
-    piirritev_graph = Graph()
-    with open(GoT_file, 'r', encoding = 'utf-8') as GoT_file_content:
-        piirritev_graph.parse(data = GoT_file_content.read(), format = 'turtle')
-    
-    return piirritev_graph
+    return load_cached_graph(GoT_file)
+
+piirrited_namespaces = {
+    'piirrite': piirrite,
+    'piirritev': piirritev,
+    'rdfs': RDFS,
+    'xsd': XSD,
+    'osm': osm,
+    'osmnode': osmnode,
+    'osmway': osmway,
+    'geo': geo,
+    'saref': saref,
+}
 
 def init_piirrited_graph() -> Graph:
+    # L'ABox du modelet_1 change à chaque peuplement : un instantané de graph_cache serait toujours
+    # périmé. Sa version compilée, écrite en même temps qu'elle, est ouverte sans parsing puis recopiée
     piirrited_graph = Graph()
-    piirrited_graph.bind('piirrite', piirrite)
-    piirrited_graph.bind('piirritev', piirritev)
-    piirrited_graph.bind('rdfs', RDFS)
-    piirrited_graph.bind('xsd', XSD)
-    piirrited_graph.bind('osm', osm)
-    piirrited_graph.bind('osmnode', osmnode)
-    piirrited_graph.bind('osmway', osmway)
-    piirrited_graph.bind('geo', geo)
-    piirrited_graph.bind('saref', saref)
-
-    with open(previous_ABox_file, 'r', encoding = 'utf-8') as ABox_file_content:
-        piirrited_graph.parse(data = ABox_file_content.read(), format = 'turtle')
+    for prefix, namespace in piirrited_namespaces.items():
+        piirrited_graph.bind(prefix, namespace)
+    piirrited_graph.addN((s, p, o, piirrited_graph) for s, p, o in load_compiled_graph(previous_ABox_file))
 
     return piirrited_graph
 
+def read_previous_ABox(ABox_format:str) -> str | None:
+    # Texte de l'ABox du modelet_1, recopié tel quel en tête de l'ABox plutôt que sérialisé à nouveau.
+    # Le N-Triples étant un sous-ensemble du Turtle, n'importe quelle ABox du modelet_1 convient à
+    # une ABox Turtle ; une ABox N-Triples, elle, est toujours sérialisée.
+    if ABox_format != 'turtle':
+        return None
+    with open(previous_ABox_file, 'r', encoding = 'utf-8') as previous_ABox:
+        return previous_ABox.read()
+
 def init_osmd_graph() -> Graph:
     print('Récupération des données OSM…')
     osmd_graph = Graph()
     osmd_graph.parse(raw_data_file, 'turtle')
+    count('bytes_read', os.path.getsize(raw_data_file))
     
     print('Données OSM récupérées.')
     return osmd_graph
 
-def add_geometry_to_SpatialSegment(piirrited_graph:Graph,
-                                   osmd_graph:Graph,
-                                   SpatialSegment_URI:URIRef,
-                                   osm_geometry) -> None:
+def get_osm_entities(rdf_type:URIRef, streaming:bool = False):
+    # Renvoie les entités OSM du type demandé sous forme de couples (entité, graphe
+    # contenant ses triplets) ainsi que leur nombre, s'il est connu.
+    if streaming:
+        print('Lecture en flux des données OSM…')
+        return iter_osm_entities(raw_data_file, rdf_type), None
+
+    osmd_graph = init_osmd_graph()
+    osm_entities = [
+        (osm_entity, osmd_graph)
+        for osm_entity in osmd_graph.subjects(RDF.type, rdf_type)
+        if isinstance(osm_entity, URIRef)
+    ]
+    return osm_entities, len(osm_entities)
+
+def get_SpatialSegment_geometry_triples(osmd_graph:Graph,
+                                        SpatialSegment_URI:URIRef,
+                                        osm_geometry,
+                                        geometry_store:GeometryStore | None = None) -> tuple[list[tuple], URIRef | None]:
+    # Renvoie les triplets de la géométrie et le type de segment qu'elle implique (None s'il est inconnu)
     geometries_as_WKT = list(osmd_graph.objects(osm_geometry, geo.asWKT))
-    if len(geometries_as_WKT) == 1:
-        geometry_as_WKT = str(geometries_as_WKT[0])
-        geometry = BNode()
-        piirrited_graph.add((SpatialSegment_URI, geo.hasGeometry, geometry))
-        # piirrited_graph.add((geometry, RDF.type, geo.Geometry)) # redondant par inférence
-        piirrited_graph.add((geometry,
-                        geo.asWKT,
-                        Literal(geometry_as_WKT, datatype = geo['wktLiteral'])))
-        
-        # on profite d'avoir la géométrie sous la main pour déterminer si
-        # le segment est traversable ou topological
-        if 'POLYGON' in geometry_as_WKT:
-            piirrited_graph.remove((SpatialSegment_URI, RDF.type, piirrite.SpatialSegment))
-            piirrited_graph.add((SpatialSegment_URI, RDF.type, piirrite.TopologicalSegment))
-        elif 'LINESTRING' in geometry_as_WKT:
-            piirrited_graph.remove((SpatialSegment_URI, RDF.type, piirrite.SpatialSegment))
-            piirrited_graph.add((SpatialSegment_URI, RDF.type, piirrite.TraversableSegment))
-        else:
-            print('Géométrie inconnue :', geometry_as_WKT)
-    else:
+    if len(geometries_as_WKT) != 1:
         print("plusieurs géométries trouvées.")
-
-def value_datatype(var):
-    if isinstance(var, int):
-        return XSD.integer
-    if isinstance(var, float):
-        return XSD.float
-    if isinstance(var, bool):
-        return XSD.boolean
-    return XSD.string
-
-def remove_blank_node_property(g, subject, predicate, rdf_type):
-    blank_nodes_to_remove = []
-    
-    for bn in g.objects(subject, predicate):
-        if (bn, RDF.type, rdf_type) in g:
-            blank_nodes_to_remove.append(bn)
-    
-    for bn in blank_nodes_to_remove:
-        g.remove((bn, None, None))
-        g.remove((subject, predicate, bn))
-    
-    return len(blank_nodes_to_remove)
-
-def add_context_to_SpatialSegment(osm_way:URIRef, piirrite_graph:Graph, piirritev_graph:Graph,
-                                 piirrited_graph:Graph, osmd_graph:Graph, SpatialSegment_URI:URIRef,
-                                 osm_key:str, osm_value:str, unfounds:dict[str, dict[str, int]]) -> dict[str, dict[str, int]]:
-    
-    # si la valeur n'a pas pour vocation d'être conceptualisée
-    # et que ce n'est pas un tuic (voir ci-dessous)
-    # en suivant le dictionnaire SKOS, on l'enregistre comme telle
-    if len(osm_value.split(' ')) > 1 or not should_be_concept([osm_value]):
-        conceptScheme = snake_to_camel(osm_key)
-        if (piirritev[conceptScheme], RDF.type, SKOS.ConceptScheme) in piirritev_graph:
-            context = BNode()
-            piirrited_graph.add((SpatialSegment_URI, saref.hasProperty, context))
-            piirrited_graph.add((context, RDF.type, piirritev[conceptScheme]))
-            converted_value = str_to_best_type(osm_value)
-            piirrited_graph.add((context, saref.hasValue, Literal(converted_value, datatype = value_datatype(converted_value))))
-
-        return unfounds
-
-    # sinon, on lance le processus de conceptualisation
-
-    # OSM utilise du snake_case et PIIRRITE du CamelCase
-    concept = snake_to_camel(osm_key) + snake_to_camel(osm_value)
-    
-    # Toutes les valeurs de clé possibles devraient exister.
-    # Au cas où, on vérifie
-    if (piirritev[concept], RDF.type, SKOS.Concept) not in piirritev_graph:
-        if concept not in unfounds['values'].keys():
-            unfounds['values'][concept] = 1
-        else:
-            unfounds['values'][concept] += 1
-        return unfounds
-
-    # le tag courant est peut-être voué à être utilisé en combinaison avec un autre
-    # tag de la spatialEntity (ex : capacity qui se rapporte à bicycleParking)
-    # -- voir l'explication sur les tuic ci-dessous
-    # Dans ce cas, il ne faut pas l'enregistrer comme concept à part entière
-    #
-    # Si c'est le cas, deux possibilités :
-    # - soit il a déjà été enregistré comme tel, et pas la peine de continuer
-    # - soit il n'a pas déjà été enregistré comme tel, alors on l'enregistre comme
-    #   concept à part entière et on le supprimera quand on l'enregistrera comme tel
-    #   (lors du traitement du tag auquel il se rapporte) : voir (*) ci-dessous
-    for saref_property in piirrited_graph.objects(SpatialSegment_URI, saref.hasProperty):
-        for tuic_predicate, _ in piirrited_graph.predicate_objects(saref_property):
-            if tuic_predicate not in [RDF.type, saref.hasValue]:
-                if str(tuic_predicate).endswith(snake_to_camel(osm_key)):
-                    return unfounds
-
-    # on enregistre la propriété contextuelle
-    context = BNode()
-    piirrited_graph.add((SpatialSegment_URI, saref.hasProperty, context))
-    piirrited_graph.add((context, RDF.type, piirritev[concept]))
-
-    # Il faut encore vérifier si des triplets de osmd_graph sont des
-    # étiquettes utilisées en combinaison avec le concept
-    #
-    # Plus de détails : OSM permet à certains tags d'avoir des attributs supplémentaires
-    # à travers des "tags used in combination" ("tuic").
-    # ex: [amemity=bicycle_parking, capacity="12"]
-    # Ici, OSM comprend implicitement que l'attribut "capacity" se rapporte au tag "bicycle_parking"
-    # grâce à la logique interne des tuic.
-    # PIIRRITE gère ces attributs supplémentaires !
-    # Pour cela, il passe par la propriété piirrite:hasRelatedOsmTag
-    # ex: piirritev:OsmAmenityBicycleParking a skos:Concept ;
-    #         piirrite:hasRelatedOsmTag piirritev:hasOsmBicycleParkingCapacity
-    #     osmnode:1 a piirrite:SpatialPoint ;
-    #         piirrite:hasAmenity [ a saref:Property,
-    #               piirritev:OsmAmenityBicycleParking ;
-    #             piirritev:hasOsmBicycleParkingCapacity '12']
-
-    # Ensemble des propriétés liées à l'objet OSM courant
-    tuic_candidates = {}
-    for p, o in osmd_graph.predicate_objects(osm_way):
-        if 'wiki/Key:' in str(p):
-            tuic_candidates[str(p).split('wiki/Key:')[-1]] = str(o)
-    
-    # Ensemble des étiquettes utilisées en combinaison avec le concept PIIRRITEV courant
-    possible_tuics = []
-    for o in piirritev_graph.objects(piirritev[concept], piirrite.hasRelatedOsmTag):
-        osm_name = next(piirrite_graph.objects(URIRef(str(o)), piirrite.osmId, True), None)
-        if osm_name:
-            possible_tuics.append(str(osm_name))
-
-    for tuic, tuic_value in tuic_candidates.items():
-        if tuic in possible_tuics:
-            # on a trouvé un tuic !
-            tuic_piirritev_name = snake_to_camel(tuic) if tuic != osm_value else 'Type'
-            tuic_URI = piirrite['has' + snake_to_camel(osm_key) + snake_to_camel(osm_value) + tuic_piirritev_name]
-            converted_value = str_to_best_type(tuic_value)
-            piirrited_graph.add((context, tuic_URI, Literal(converted_value, datatype = value_datatype(converted_value))))
-
-            # (*) si le tuic était déjà enregistré comme concept à part entière,
-            # on supprime ce concept
-            for property in piirrited_graph.objects(SpatialSegment_URI, saref.hasProperty):
-                for property_type in piirrited_graph.objects(property, RDF.type):
-                    pt_name = str(property_type).split('#')[1]
-                    if pt_name == tuic_piirritev_name:
-                        remove_blank_node_property(piirrited_graph,
-                                                   SpatialSegment_URI,
-                                                   saref.hasProperty,
-                                                   property_type)
-
-    return unfounds
-
-def get_WKT(SO_URI:URIRef, graph:Graph) -> str | None:
-    SO_geometry = list(graph.objects(SO_URI, geo.hasGeometry))
-    if len(SO_geometry) != 1:
-        print(f'L\'objet {SO_URI} a {len(SO_geometry)} géométrie(s).')
-        return None
-    SP_WKT = str(list(graph.objects(SO_geometry[0], geo.asWKT))[0])
-
-    return SP_WKT
-
-
-def add_extremity_to_SpatialSegment(piirrited_graph:Graph,
-                                    SpatialSegment_URI:URIRef,
-                                    SpatialPoint_URI:URIRef) -> None:
-    existing_extremities = list(piirrited_graph.objects(SpatialSegment_URI, piirrite.hasExtremity))
-    if SpatialPoint_URI in existing_extremities:
-        # On ne veut pas de doublon
-        return
-    elif len(existing_extremities) == 2:
-        # Même si c'est une polyligne, un segment n'a que 2 extremités.
+        return [], None
+    geometry_as_WKT = str(geometries_as_WKT[0])
+    # les coordonnées vont au magasin de géométries, où les calculs se font sans relire le WKT
+    if geometry_store is not None:
+        geometry_store.add(SpatialSegment_URI, geometry_as_WKT)
+    geometry = BNode()
+    triples = [
+        (SpatialSegment_URI, geo.hasGeometry, geometry),
+        # (geometry, RDF.type, geo.Geometry), # redondant par inférence
+        (geometry, geo.asWKT, Literal(geometry_as_WKT, datatype = geo['wktLiteral'])),
+    ]
+
+    # on profite d'avoir la géométrie sous la main pour déterminer si
+    # le segment est traversable ou topological
+    if 'POLYGON' in geometry_as_WKT:
+        return triples, piirrite.TopologicalSegment
+    if 'LINESTRING' in geometry_as_WKT:
+        return triples, piirrite.TraversableSegment
+    print('Géométrie inconnue :', geometry_as_WKT)
+    return triples, None
+
+def link_SpatialSegments_extremities(SpatialSegments_SpatialPoints:list[tuple[URIRef, URIRef]],
+                                     geometry_store:GeometryStore,
+                                     sink:TripleSink,
+                                     tolerance_m:float = EXTREMITY_TOLERANCE_M) -> None:
+    # Relie en une fois tous les couples (point, segment) issus de geof:sfContains : chaque point
+    # est isExtremityOf de son segment, et hasExtremity s'il est à l'une de ses deux extrémités.
+    # Les coordonnées sont comparées d'un bloc dans le magasin de géométries, à la tolérance près,
+    # plutôt que couple par couple dans le graphe.
+    if not SpatialSegments_SpatialPoints:
         return
-    
-    SP_WKT = get_WKT(SpatialPoint_URI, piirrited_graph)
-    SS_WKT = get_WKT(SpatialSegment_URI, piirrited_graph)
-
-    if SP_WKT is None: return
-    if SS_WKT is None: return
-
-    # Les polygones n'ont pas d'extremité au sens où on l'entend
-    if "POLYGON" in SS_WKT: return
-    elif "LINESTRING" in SS_WKT:
-            SS_coordinates = SS_WKT.replace('LINESTRING', '').replace('(', '').replace(')', '').split(',')
-            SP_coordinates = SP_WKT.replace('POINT', '').replace('(', '').replace(')', '')
-            if SP_coordinates in [SS_coordinates[0], SS_coordinates[-1]]:
-                # on ajoute le point comme extremité
-                piirrited_graph.add((SpatialSegment_URI, piirrite.hasExtremity, SpatialPoint_URI))
-    else: raise ValueError(f'Géométrie de segment invalide : {SS_WKT}')
-
-
-def add_SpatialPoint_to_SpatialSegment(SpatialPoint_URI:URIRef, SpatialSegment_URI:URIRef,
-                                       piirrited_graph:Graph) -> None:
-    add_extremity_to_SpatialSegment(piirrited_graph, SpatialSegment_URI, SpatialPoint_URI)
-    piirrited_graph.add((SpatialPoint_URI, piirrite.isExtremityOf, SpatialSegment_URI))
+    SpatialPoint_URIs, SpatialSegment_URIs = zip(*SpatialSegments_SpatialPoints)
+    are_extremities = geometry_store.match_endpoints(SpatialPoint_URIs, SpatialSegment_URIs, tolerance_m)
+
+    triples:list[tuple] = []
+    extremities:dict[URIRef, list[URIRef]] = {}
+    for SpatialPoint_URI, SpatialSegment_URI, is_extremity in zip(SpatialPoint_URIs, SpatialSegment_URIs, are_extremities.tolist()):
+        triples.append((SpatialPoint_URI, piirrite.isExtremityOf, SpatialSegment_URI))
+        if not is_extremity:
+            continue
+        SpatialSegment_extremities = extremities.setdefault(SpatialSegment_URI, [])
+        # pas de doublon, et même si c'est une polyligne, un segment n'a que 2 extremités
+        if SpatialPoint_URI in SpatialSegment_extremities or len(SpatialSegment_extremities) == 2:
+            continue
+        SpatialSegment_extremities.append(SpatialPoint_URI)
+        triples.append((SpatialSegment_URI, piirrite.hasExtremity, SpatialPoint_URI))
+    sink.add(triples)
+
+def get_SpatialPoints_of_SpatialSegment(osm_way:URIRef, osmd_graph:Graph) -> list[URIRef]:
+    SpatialPoints = []
+    for o in osmd_graph.objects(osm_way, geof.sfContains):
+        if 'node' in str(o):
+            SpatialPoints.append(osm_entity_iri(osmnode, o))
+
+    return SpatialPoints
+
+def get_SpatialSegment_memberships(osm_way:URIRef, osmd_graph:Graph) -> list[tuple[URIRef, URIRef]]:
+    # couples (point, segment) à relier par link_SpatialSegments_extremities
+    SpatialSegment_URI = osm_entity_iri(osmway, osm_way)
+    return [(SpatialPoint_URI, SpatialSegment_URI)
+            for SpatialPoint_URI in get_SpatialPoints_of_SpatialSegment(osm_way, osmd_graph)]
     
 
+def get_SpatialSegment_triples(osm_way:URIRef,
+                               osmd_graph:Graph,
+                               tag_index:dict[str, dict],
+                               unfounds:dict[str, dict[str, int]],
+                               geometry_store:GeometryStore | None = None) -> tuple[list[tuple], dict[str, dict[str, int]]]:
+    # Tous les triplets du SpatialSegment, construits avant d'être ajoutés d'un coup
+    # (à un graphe ou à un TripleSink)
+    SpatialSegment_URI = osm_entity_iri(osmway, osm_way)
+
+    # le type déduit d'une géométrie remplace piirrite:SpatialSegment
+    SpatialSegment_types = [piirrite.SpatialSegment]
+    geometry_triples:list[tuple] = []
+    for osm_geometry in osmd_graph.objects(osm_way, geo.hasGeometry):
+        triples, SpatialSegment_type = get_SpatialSegment_geometry_triples(osmd_graph, SpatialSegment_URI,
+                                                                           osm_geometry, geometry_store)
+        geometry_triples.extend(triples)
+        if SpatialSegment_type is not None:
+            if piirrite.SpatialSegment in SpatialSegment_types:
+                SpatialSegment_types.remove(piirrite.SpatialSegment)
+            if SpatialSegment_type not in SpatialSegment_types:
+                SpatialSegment_types.append(SpatialSegment_type)
+
+    triples = [(SpatialSegment_URI, RDF.type, SpatialSegment_type) for SpatialSegment_type in SpatialSegment_types]
+    triples.append((SpatialSegment_URI, RDF.type, osm.way))
+    triples.extend(geometry_triples)
+
+    osm_tags, tuic_candidates = get_osm_tags(osm_way, osmd_graph)
+    properties, unfounds = plan_SpatialEntity_properties(tag_index, osm_tags, tuic_candidates, unfounds)
+    triples.extend(get_SpatialEntity_properties_triples(SpatialSegment_URI, properties))
+
+    # les extrémités sont reliées une fois tous les segments créés (voir link_SpatialSegments_extremities)
+    return triples, unfounds
+
 def add_SpatialSegment_to_piirrited(osm_way:URIRef,
                                  osmd_graph:Graph,
-                                 piirrite_graph:Graph,
-                                 piirritev_graph:Graph,
+                                 tag_index:dict[str, dict],
                                  piirrited_graph:Graph,
-                                 unfounds:dict[str, dict[str, int]]) -> dict[str, dict[str, int]]:
-    SpatialSegment_URI = osmway[str(osm_way).split('/')[-1]]
-
-    piirrited_graph.add((SpatialSegment_URI, RDF.type, piirrite.SpatialSegment))
-    piirrited_graph.add((SpatialSegment_URI, RDF.type, osm.way))
-
-    SpatialPoints_to_add = []
-
-    for p, o in osmd_graph.predicate_objects(osm_way):
-        if p == geo.hasGeometry:
-            add_geometry_to_SpatialSegment(piirrited_graph, osmd_graph, SpatialSegment_URI, o)
-        
-        elif isinstance(p, URIRef) and str(p).startswith(str(osm)) and 'wiki/Key:' in str(p):
-            unfounds = add_context_to_SpatialSegment(
-                osm_way, piirrite_graph, piirritev_graph, piirrited_graph, osmd_graph,
-                SpatialSegment_URI, str(p).split('wiki/Key:')[-1], str(o), unfounds
-            )
-        
-        elif p == geof.sfContains and 'node' in str(o):
-            SpatialPoint_URI = osmnode[str(o).split('/')[-1]]
-            SpatialPoints_to_add.append(SpatialPoint_URI)
-
-    for SpatialPoint_URI in SpatialPoints_to_add:
-            add_SpatialPoint_to_SpatialSegment(SpatialPoint_URI, SpatialSegment_URI, piirrited_graph)
+                                 unfounds:dict[str, dict[str, int]],
+                                 geometry_store:GeometryStore | None = None) -> dict[str, dict[str, int]]:
+    triples, unfounds = get_SpatialSegment_triples(osm_way, osmd_graph, tag_index, unfounds, geometry_store)
+    piirrited_graph.addN((s, p, o, piirrited_graph) for s, p, o in triples)
 
     return unfounds
 
@@ -306,31 +227,160 @@ def display_unfounds(unfounds:dict[str, dict[str, int]]) -> None:
     print(f'{unfound_values} valeurs non trouvées dans piirritev:')
     print(sort_dict_by_values(unfounds['values']))
 
+###########################
+# Peuplement parallèle (voir modelet_1)
+
+_worker_tag_index:dict[str, dict] = {}
+_worker_ABox_format:str | None = None
+
+def init_worker(tag_index:dict[str, dict], ABox_format:str | None = None) -> None:
+    global _worker_tag_index, _worker_ABox_format
+    _worker_tag_index = tag_index
+    _worker_ABox_format = ABox_format
+
+def fill_in_shard(shard:list[tuple[URIRef, list[tuple]]]) -> tuple[list[tuple], str | None, list[tuple[URIRef, URIRef]], dict[str, dict[str, int]]]:
+    osmd_graph = Graph()
+    shard_triples:list[tuple] = []
+    unfounds:dict[str, dict[str, int]] = {'keys': {}, 'values': {}}
+    SpatialSegments_SpatialPoints = []
+
+    for osm_way, osm_way_triples in shard:
+        osmd_graph.addN((s, p, o, osmd_graph) for s, p, o in osm_way_triples)
+        SpatialSegment_triples, unfounds = get_SpatialSegment_triples(osm_way, osmd_graph, _worker_tag_index, unfounds)
+        shard_triples.extend(SpatialSegment_triples)
+        SpatialSegments_SpatialPoints.extend(get_SpatialSegment_memberships(osm_way, osmd_graph))
+
+    shard_ABox = serialize_block(shard_triples, piirrited_namespaces, _worker_ABox_format) \
+        if _worker_ABox_format is not None else None
+    return shard_triples, shard_ABox, SpatialSegments_SpatialPoints, unfounds
+
+###########################
+# Peuplement incrémental (voir modelet_1)
+
+def hash_osm_way(osm_way:URIRef, osmd_graph:Graph, tag_index:dict[str, dict], SpatialPoints_graph:Graph) -> str:
+    # En plus de ses propres triplets, un SpatialSegment dépend de la géométrie des
+    # SpatialPoints qu'il contient (calcul des extrémités)
+    source = [hash_osm_entity(osm_way, osmd_graph, tag_index)]
+    for SpatialPoint_URI in get_SpatialPoints_of_SpatialSegment(osm_way, osmd_graph):
+        source.append(str(SpatialPoint_URI))
+        for SpatialPoint_geometry in SpatialPoints_graph.objects(SpatialPoint_URI, geo.hasGeometry):
+            source.extend(sorted(str(WKT) for WKT in SpatialPoints_graph.objects(SpatialPoint_geometry, geo.asWKT)))
+
+    return hashlib.sha1('\n'.join(source).encode('utf-8')).hexdigest()
+
+def get_previous_SpatialSegment_links(previous_ABox_graph:Graph, SpatialSegment_URI:URIRef) -> list[tuple]:
+    # les points qui sont les extrémités du SpatialSegment : ces triplets ont pour sujet
+    # le point, ils ne sont pas recopiés avec l'énoncé du segment
+    return list(previous_ABox_graph.triples((None, piirrite.isExtremityOf, SpatialSegment_URI)))
+
 def use_osm_data_to_fill_in_piirrited_graph(piirrite_graph:Graph,
                                          piirritev_graph:Graph,
-                                         piirrited_graph:Graph) -> None:
-    osmd_graph = init_osmd_graph()
+                                         piirrited_graph:Graph,
+                                         workers:int = 1,
+                                         shard_size:int = 2_000,
+                                         streaming:bool = False,
+                                         write_block:Callable[..., None] | None = None,
+                                         ABox_hashes:dict | None = None,
+                                         ABox_format:str = 'turtle',
+                                         SpatialPoints_text:str | None = None) -> None:
+    # Les SpatialPoints du modelet précédent servent à trouver les extrémités des segments.
+    # Avec write_block, ils sont écrits d'abord (depuis leur texte, s'il est donné) puis gardés
+    # à part, en lecture seule ; les SpatialSegments sont ensuite écrits par lots (voir TripleSink)
+    SpatialPoints_graph = piirrited_graph
+    if write_block is not None:
+        write_block(SpatialPoints_graph, SpatialPoints_text)
+        piirrited_graph = Graph()
+    sink = TripleSink(piirrited_graph, write_block)
+    # géométries des points, puis des segments au fur et à mesure de leur création
+    with stage('geometry_store'):
+        geometry_store = GeometryStore.from_graph(SpatialPoints_graph)
+
+    with stage('osm_data'):
+        osm_ways, n_osm_ways = get_osm_entities(osm['way'], streaming)
+    with stage('tag_index'):
+        tag_index = build_tag_index(piirrite_graph, piirritev_graph)
+
+    if ABox_hashes is not None:
+        osm_ways = filter_unchanged_osm_entities(
+            osm_ways, ABox_hashes,
+            lambda osm_way, osmd_graph: hash_osm_way(osm_way, osmd_graph, tag_index, SpatialPoints_graph),
+            sink,
+            lambda SpatialSegment_URI: get_previous_SpatialSegment_links(ABox_hashes['previous_ABox_graph'], SpatialSegment_URI)
+        )
+        # le nombre d'entités à reconstruire n'est pas connu à l'avance
+        if ABox_hashes['previous']:
+            n_osm_ways = None
+
+    progress_message = f'des {n_osm_ways} entités traitées…' if n_osm_ways is not None else 'entités traitées…'
 
     # on veut garder la trace des clés et valeurs OSM non trouvées dans PIIRRITE
     unfounds:dict[str, dict[str, int]] = {'keys': {}, 'values': {}}
-
-    osm_ways = list(osmd_graph.subjects(RDF.type, osm['way']))
-    for count, osm_way in enumerate(osm_ways):
-        if isinstance(osm_way, URIRef):
-            unfounds = add_SpatialSegment_to_piirrited(osm_way, osmd_graph, piirrite_graph,
-                                                    piirritev_graph, piirrited_graph, unfounds)
-        display_progress_bar(count, len(osm_ways), message = f'des {len(osm_ways)} entités traitées…')
+    # couples (point, segment) de tous les segments, reliés en une fois à la fin
+    SpatialSegments_SpatialPoints:list[tuple[URIRef, URIRef]] = []
+
+    if workers > 1:
+        shards = iter_osm_shards(osm_ways, shard_size)
+        ABox_format = ABox_format if write_block is not None else None
+        with stage('entities'), Pool(workers, initializer = init_worker, initargs = (tag_index, ABox_format)) as pool:
+            for n_shards, (shard_triples, shard_ABox, shard_SpatialSegments_SpatialPoints, shard_unfounds) in enumerate(imap_bounded(pool, fill_in_shard, shards, 2 * workers), start = 1):
+                geometry_store.add_graph(shard_triples)
+                if write_block is not None:
+                    write_block(shard_triples, shard_ABox)
+                else:
+                    sink.add(shard_triples)
+                SpatialSegments_SpatialPoints.extend(shard_SpatialSegments_SpatialPoints)
+                unfounds = merge_unfounds(unfounds, shard_unfounds)
+                display_progress(n_shards * shard_size if n_osm_ways is None else min(n_shards * shard_size, n_osm_ways),
+                                 n_osm_ways, message = progress_message)
+    else:
+        with stage('entities'):
+            for n_processed, (osm_way, osmd_graph) in enumerate(osm_ways, start = 1):
+                SpatialSegment_triples, unfounds = get_SpatialSegment_triples(osm_way, osmd_graph, tag_index, unfounds,
+                                                                              geometry_store = geometry_store)
+                sink.add(SpatialSegment_triples)
+                SpatialSegments_SpatialPoints.extend(get_SpatialSegment_memberships(osm_way, osmd_graph))
+                display_progress(n_processed, n_osm_ways, message = progress_message)
+
+    with stage('linking'):
+        link_SpatialSegments_extremities(SpatialSegments_SpatialPoints, geometry_store, sink)
+        sink.flush()
 
     display_unfounds(unfounds)
 
-def main():
-    piirrite_graph = init_piirrite_graph()
-    piirritev_graph = init_piirritev_graph()
-    piirrited_graph = init_piirrited_graph()
-    use_osm_data_to_fill_in_piirrited_graph(piirrite_graph, piirritev_graph, piirrited_graph)
-    piirrited_graph.serialize(ABox_file, 'turtle')
+@profiled_main('modelet_2.instanciation')
+def main(workers:int = 1, streaming:bool = False, ABox_format:str = 'turtle', incremental:bool = False):
+    with stage('load_graphs'):
+        piirrite_graph = init_piirrite_graph()
+        piirritev_graph = init_piirritev_graph()
+        piirrited_graph = init_piirrited_graph()
+        ABox_hashes = load_ABox_hashes(ABox_file, ABox_hashes_file, incremental, ABox_format)
+    # l'ABox n'est remplacée qu'une fois entièrement écrite
+    # les triplets sont relevés au fil de l'écriture pour écrire sa version compilée (voir utilities/compiled_graph.py)
+    compiled_ABox = CompiledGraphWriter(piirrited_namespaces)
+    with open_rdf_writer(ABox_file, piirrited_namespaces, ABox_format) as write_block:
+        def write_and_index_block(block:Iterable[tuple], text:str | None = None) -> None:
+            compiled_ABox.add(block)
+            write_block(block, text)
+        with stage('fill_in'):
+            use_osm_data_to_fill_in_piirrited_graph(piirrite_graph, piirritev_graph, piirrited_graph,
+                                                 workers, streaming = streaming, write_block = write_and_index_block,
+                                                 ABox_hashes = ABox_hashes, ABox_format = ABox_format,
+                                                 SpatialPoints_text = read_previous_ABox(ABox_format))
+    save_ABox_hashes(ABox_hashes, ABox_hashes_file)
+    with stage('compiled_graph'):
+        save_compiled_graph(compiled_ABox, ABox_file)
 
     print('\nOntologie peuplée avec succès.')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # workers = 1 : peuplement séquentiel
+    # workers > 1 : peuplement réparti sur autant de processus
+    workers = 1
+    # streaming = True : les données OSM sont lues en flux plutôt que chargées en entier
+    streaming = False
+    # ABox_format = 'turtle' ou 'nt' (N-Triples, plus rapide à écrire et à relire)
+    ABox_format = 'turtle'
+    # incremental = True : seules les entités OSM modifiées depuis le dernier peuplement
+    # (ou dont les entrées du glossaire ont changé) sont reconstruites
+    incremental = False
+    main(workers, streaming, ABox_format, incremental)
\ No newline at end of file
@@ -0,0 +1,27 @@
+from utilities.utilities import *
+from utilities.compiled_graph import load_compiled_graph
+from utilities.routing import build_routing_graph, save_routing_graph
+from utilities.profiling import stage, profiled_main
+
+# Étape suivant le peuplement du modelet 2 : les TraversableSegments et leurs extrémités sont
+# compilés en un graphe de déplacement (voir utilities/routing.py), enregistré à côté de l'ABox,
+# sur lequel chercher un chemin (CQ2-3) sans passer par SPARQL.
+
+ABox_file = get_current_path() + '/../ABox.ttl'
+
+@profiled_main('modelet_2.routing')
+def main(ABox_format:str = 'turtle'):
+    print('Lecture de l\'ABox…')
+    with stage('load_ABox'):
+        ABox_graph = load_compiled_graph(ABox_file, ABox_format)
+    with stage('build'):
+        routing_graph = build_routing_graph(ABox_graph)
+    with stage('save'):
+        directory = save_routing_graph(routing_graph, ABox_file)
+    print(f'Graphe de déplacement enregistré dans {directory} : '
+          f'{routing_graph.n_nodes} points, {routing_graph.n_edges // 2} segments.')
+
+if __name__ == '__main__':
+    # ABox_format = 'turtle' ou 'nt', comme à l'écriture de l'ABox
+    ABox_format = 'turtle'
+    main(ABox_format)
@@ -0,0 +1,29 @@
+import unittest
+from rdflib import Literal
+from rdflib.namespace import XSD
+from utilities.interning import typed_value, value_literal
+
+class TestValueTyping(unittest.TestCase):
+    ''' Typing of the raw OSM values into literals.
+    '''
+
+    def test_boolean(self):
+        self.assertEqual(typed_value('yes'), (True, XSD.boolean))
+        self.assertEqual(typed_value('No'), (False, XSD.boolean))
+
+    def test_number(self):
+        self.assertEqual(typed_value('12'), (12, XSD.integer))
+        self.assertEqual(typed_value('2.5'), (2.5, XSD.float))
+
+    def test_string(self):
+        self.assertEqual(typed_value('bicycle parking'), ('bicycle parking', XSD.string))
+
+    def test_value_literal(self):
+        self.assertEqual(value_literal('yes'), Literal(True, datatype = XSD.boolean))
+        self.assertEqual(value_literal('12'), Literal(12, datatype = XSD.integer))
+        self.assertEqual(value_literal('bicycle parking'), Literal('bicycle parking', datatype = XSD.string))
+        # un seul objet par valeur
+        self.assertIs(value_literal('12'), value_literal('12'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+from modelet_1.scripts.piirrite_creation import clean_osm_description
+
+class TestDescriptionTemplates(unittest.TestCase):
+    ''' Rendering of the templates found in the descriptions of the OSM wiki.
+    '''
+
+    def test_tag_with_value(self):
+        self.assertEqual(clean_osm_description('A bench with {{Tag|backrest|yes}}.'), 'A bench with backrest=yes.')
+
+    def test_tag_with_unlinked_value(self):
+        # {{Tag|k||v}} : la valeur est affichée sans lien
+        self.assertEqual(clean_osm_description('A bench with {{Tag|backrest||yes}}.'), 'A bench with backrest=yes.')
+
+    def test_tag_without_value(self):
+        self.assertEqual(clean_osm_description('See {{Tag|amenity}}.'), 'See amenity.')
+        self.assertEqual(clean_osm_description('See {{Tag|amenity|}}.'), 'See amenity.')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,309 @@
+import os
+import numpy as np
+from typing import Optional, Iterable, Iterator
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.graph import ModificationException
+from rdflib.store import Store
+from .graph_cache import load_cached_graph
+
+COMPILED_GRAPH_SUFFIX = '.compiled'
+_COMPILED_GRAPH_VERSION = 1
+_COMPILED_ARRAYS = ('term_kinds', 'term_offsets', 'term_values', 'term_datatypes', 'term_languages',
+                    'languages', 'namespaces', 'spo', 'pos', 'osp')
+# nature de chaque terme
+_IRI = 0
+_BLANK_NODE = 1
+_LITERAL = 2
+# nombre de triplets décodés à la fois lors d'un parcours
+_TRIPLES_CHUNK = 4_096
+
+###########################
+# Écriture
+
+def _term_kind(term) -> int:
+    if isinstance(term, Literal):
+        return _LITERAL
+    if isinstance(term, BNode):
+        return _BLANK_NODE
+    return _IRI
+
+def _term_key(term) -> tuple[int, str, str, str]:
+    # ordre de la table des termes, qui permet d'y retrouver un terme par dichotomie
+    if isinstance(term, Literal):
+        return (_LITERAL, str(term), str(term.datatype or ''), term.language or '')
+    return (_term_kind(term), str(term), '', '')
+
+class CompiledGraphWriter:
+    ''' Collects triples, block by block, and writes them in the compiled graph format: a table of
+    the terms, sorted so that a term can be looked up by binary search, and the triples as integer
+    term ids, sorted three times (SPO, POS, OSP) so that any triple pattern is a contiguous range
+    of one of them. Every array is a .npy file which CompiledStore memory-maps.
+    '''
+
+    def __init__(self, namespaces: Optional[dict] = None) -> None:
+        self.namespaces = {prefix: str(namespace) for prefix, namespace in (namespaces or {}).items()}
+        self.term_ids: dict = {}
+        self._blocks: list[np.ndarray] = []
+
+    def _term_id(self, term) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.term_ids)
+        return term_id
+
+    def add(self, triples: Iterable) -> None:
+        ''' Adds triples, e.g. a block of the ABox or a whole graph.
+        '''
+        term_id = self._term_id
+        ids = [(term_id(s), term_id(p), term_id(o)) for s, p, o in triples]
+        if ids:
+            self._blocks.append(np.array(ids, dtype = np.int64))
+
+    def save(self, directory: str, stamp: Optional[list[int]] = None) -> str:
+        ''' Writes the compiled graph, one .npy file per array.
+        Args:
+            directory (str) : The directory of the compiled graph.
+            stamp (list[int] | None) : The size and modification time of the source file, if any.
+        Returns:
+            str : The directory of the compiled graph.
+        '''
+        # les types des littéraux sont aussi des termes
+        for term in list(self.term_ids):
+            if isinstance(term, Literal) and term.datatype is not None:
+                self._term_id(term.datatype)
+        terms = list(self.term_ids)
+        order = sorted(range(len(terms)), key = lambda i: _term_key(terms[i]))
+        new_ids = np.empty(len(terms), dtype = np.int64)
+        new_ids[order] = np.arange(len(terms))
+        terms = [terms[i] for i in order]
+
+        values = [str(term).encode('utf-8') for term in terms]
+        languages = sorted({term.language for term in terms if isinstance(term, Literal) and term.language})
+        language_index = {language: i for i, language in enumerate(languages)}
+        arrays = {
+            'term_kinds': np.array([_term_kind(term) for term in terms], dtype = np.int8),
+            'term_offsets': np.concatenate(([0], np.cumsum([len(value) for value in values], dtype = np.int64))).astype(np.int64),
+            'term_values': np.frombuffer(b''.join(values), dtype = np.uint8),
+            'term_datatypes': np.array([new_ids[self.term_ids[term.datatype]]
+                                        if isinstance(term, Literal) and term.datatype is not None else -1
+                                        for term in terms], dtype = np.int32),
+            'term_languages': np.array([language_index[term.language]
+                                        if isinstance(term, Literal) and term.language else -1
+                                        for term in terms], dtype = np.int16),
+            'languages': np.array(languages, dtype = str),
+            'namespaces': np.array(sorted(self.namespaces.items()), dtype = str).reshape(-1, 2),
+        }
+
+        triples = new_ids[np.concatenate(self._blocks)] if self._blocks else np.zeros((0, 3), dtype = np.int64)
+        # tri dans l'ordre SPO et suppression des doublons
+        spo = np.unique(triples, axis = 0).astype(np.int32)
+        s, p, o = spo[:, 0], spo[:, 1], spo[:, 2]
+        # chaque index est rangé par colonne : (3, n), chaque ligne contiguë pour les recherches
+        arrays['spo'] = np.ascontiguousarray(spo.T)
+        arrays['pos'] = np.vstack((p, o, s))[:, np.lexsort((s, o, p))]
+        arrays['osp'] = np.vstack((o, s, p))[:, np.lexsort((p, s, o))]
+
+        os.makedirs(directory, exist_ok = True)
+        # l'en-tête est écrit en dernier : un graphe compilé à moitié écrit est vu comme périmé
+        header = np.array([_COMPILED_GRAPH_VERSION] + list(stamp or [-1, -1]), dtype = np.int64)
+        for name, array in list(arrays.items()) + [('header', header)]:
+            temporary_path = os.path.join(directory, f'.{name}.{os.getpid()}.tmp.npy')
+            np.save(temporary_path, array)
+            os.replace(temporary_path, os.path.join(directory, f'{name}.npy'))
+        return directory
+
+###########################
+# Lecture
+
+class CompiledStore(Store):
+    ''' A read-only rdflib store over a compiled graph. The arrays are memory-mapped, so opening
+    it costs a few milliseconds whatever its size; terms are decoded only when a triple pattern
+    returns them. Graph(store = CompiledStore(directory)) is then queried like any rdflib graph
+    (triples(), subjects(), SPARQL…).
+    '''
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        # vues ndarray des fichiers projetés : l'indexation d'un np.memmap coûte plusieurs
+        # microsecondes de plus, à chaque pas des recherches dichotomiques
+        arrays = {name: np.asarray(np.load(os.path.join(directory, f'{name}.npy'), mmap_mode = 'r'))
+                  for name in _COMPILED_ARRAYS if name not in ('languages', 'namespaces')}
+        self.term_kinds = arrays['term_kinds']
+        self.term_offsets = arrays['term_offsets']
+        self.term_values = arrays['term_values']
+        self.term_datatypes = arrays['term_datatypes']
+        self.term_languages = arrays['term_languages']
+        self.spo, self.pos, self.osp = arrays['spo'], arrays['pos'], arrays['osp']
+        self.languages = np.load(os.path.join(directory, 'languages.npy')).tolist()
+        self._namespaces = {prefix: URIRef(namespace)
+                            for prefix, namespace in np.load(os.path.join(directory, 'namespaces.npy')).tolist()}
+        self._terms: dict[int, object] = {}
+        self._term_ids: dict[object, Optional[int]] = {}
+
+    def _value(self, term_id: int) -> str:
+        return bytes(self.term_values[self.term_offsets[term_id]:self.term_offsets[term_id + 1]]).decode('utf-8')
+
+    def _key(self, term_id: int) -> tuple[int, str, str, str]:
+        kind = int(self.term_kinds[term_id])
+        datatype, language = int(self.term_datatypes[term_id]), int(self.term_languages[term_id])
+        return (kind, self._value(term_id),
+                self._value(datatype) if datatype >= 0 else '',
+                self.languages[language] if language >= 0 else '')
+
+    def term(self, term_id: int):
+        ''' Returns the rdflib term of an id.
+        '''
+        term = self._terms.get(term_id)
+        if term is None:
+            kind, value, datatype, language = self._key(term_id)
+            if kind == _LITERAL:
+                term = Literal(value, lang = language or None, datatype = URIRef(datatype) if datatype else None)
+            elif kind == _BLANK_NODE:
+                term = BNode(value)
+            else:
+                term = URIRef(value)
+            self._terms[term_id] = term
+        return term
+
+    def term_id(self, term) -> Optional[int]:
+        ''' Returns the id of an rdflib term, None if it is not in the graph.
+        '''
+        if term in self._term_ids:
+            return self._term_ids[term]
+        key = _term_key(term)
+        low, high = 0, len(self.term_kinds)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        term_id = low if low < len(self.term_kinds) and self._key(low) == key else None
+        self._term_ids[term] = term_id
+        return term_id
+
+    def description(self, subject) -> list[tuple]:
+        ''' Returns the triples of a subject and, recursively, of the blank nodes it refers to: the
+        concise bounded description of Graph.cbd, without reifications, read from the SPO index
+        without going through triples().
+        '''
+        subject_id = self.term_id(subject)
+        if subject_id is None:
+            return []
+        subjects, term = self.spo[0], self.term
+        triples = []
+        pending, seen = [subject_id], {subject_id}
+        while pending:
+            s = pending.pop()
+            low, high = int(np.searchsorted(subjects, s, 'left')), int(np.searchsorted(subjects, s, 'right'))
+            for p, o in self.spo[1:, low:high].T.tolist():
+                triples.append((term(s), term(p), term(o)))
+                if o not in seen and self.term_kinds[o] == _BLANK_NODE:
+                    seen.add(o)
+                    pending.append(o)
+        return triples
+
+    def __len__(self, context = None) -> int:
+        return self.spo.shape[1]
+
+    def triples(self, triple_pattern, context = None) -> Iterator:
+        ''' Yields the triples matching a (subject, predicate, object) pattern, None standing for any term.
+        '''
+        ids = []
+        for term in triple_pattern:
+            term_id = None if term is None else self.term_id(term)
+            if term is not None and term_id is None:
+                return
+            ids.append(term_id)
+        s, p, o = ids
+        # index dont les termes connus forment un préfixe, et position de s, p, o dans ses lignes
+        if p is not None and s is None:
+            index, keys, positions = self.pos, [p, o], (2, 0, 1)
+        elif o is not None and (s is None or p is None):
+            index, keys, positions = self.osp, [o, s], (1, 2, 0)
+        else:
+            index, keys, positions = self.spo, [s, p, o], (0, 1, 2)
+
+        low, high = 0, index.shape[1]
+        for row, key in zip(index, keys):
+            if key is None:
+                break
+            column = row[low:high]
+            low, high = low + int(np.searchsorted(column, key, 'left')), low + int(np.searchsorted(column, key, 'right'))
+
+        term = self.term
+        for start in range(low, high, _TRIPLES_CHUNK):
+            chunk = np.asarray(index[:, start:min(start + _TRIPLES_CHUNK, high)]).T.tolist()
+            for ids in chunk:
+                yield (term(ids[positions[0]]), term(ids[positions[1]]), term(ids[positions[2]])), iter(())
+
+    def contexts(self, triple = None) -> Iterator:
+        return iter(())
+
+    def add(self, triple, context = None, quoted = False) -> None:
+        raise ModificationException()
+
+    def addN(self, quads) -> None:
+        raise ModificationException()
+
+    def remove(self, triple, context = None) -> None:
+        raise ModificationException()
+
+    def bind(self, prefix: str, namespace, override: bool = True) -> None:
+        # préfixes gardés en mémoire seulement
+        if override or prefix not in self._namespaces:
+            self._namespaces[prefix] = URIRef(namespace)
+
+    def prefix(self, namespace) -> Optional[str]:
+        return next((prefix for prefix, uri in self._namespaces.items() if uri == namespace), None)
+
+    def namespace(self, prefix: str) -> Optional[URIRef]:
+        return self._namespaces.get(prefix)
+
+    def namespaces(self) -> Iterator:
+        yield from self._namespaces.items()
+
+###########################
+# Graphe compilé à côté de l'ABox
+
+def compiled_graph_path(ABox_file: str) -> str:
+    return os.path.splitext(ABox_file)[0] + COMPILED_GRAPH_SUFFIX
+
+def ABox_stamp(ABox_file: str) -> list[int]:
+    stat = os.stat(ABox_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def save_compiled_graph(writer: CompiledGraphWriter, ABox_file: str) -> str:
+    ''' Writes the compiled graph of an ABox next to it (ABox.ttl → ABox.compiled/), stamped with
+    the size and modification time of the ABox so that a stale one is rebuilt.
+    Args:
+        writer (CompiledGraphWriter) : The triples of the ABox.
+        ABox_file (str) : The path of the ABox, already written.
+    Returns:
+        str : The directory of the compiled graph.
+    '''
+    return writer.save(compiled_graph_path(ABox_file), ABox_stamp(ABox_file))
+
+def _compiled_graph_is_fresh(directory: str, ABox_file: str) -> bool:
+    try:
+        header = np.load(os.path.join(directory, 'header.npy')).tolist()
+    except (OSError, ValueError):
+        return False
+    return header == [_COMPILED_GRAPH_VERSION] + ABox_stamp(ABox_file)
+
+def load_compiled_graph(ABox_file: str, format: str = 'turtle') -> Graph:
+    ''' Opens the compiled graph of an ABox as a read-only rdflib graph, compiling it first
+    (from the parsed ABox) if it is missing or older than the ABox.
+    Args:
+        ABox_file (str) : The path of the ABox.
+        format (str) : The RDF format of the ABox, used only to compile it.
+    Returns:
+        Graph : A read-only graph over the memory-mapped compiled graph.
+    '''
+    directory = compiled_graph_path(ABox_file)
+    if not _compiled_graph_is_fresh(directory, ABox_file):
+        ABox_graph = load_cached_graph(ABox_file, format)
+        writer = CompiledGraphWriter(dict(ABox_graph.namespaces()))
+        writer.add(ABox_graph)
+        save_compiled_graph(writer, ABox_file)
+    return Graph(store = CompiledStore(directory), bind_namespaces = 'none')
@@ -0,0 +1,218 @@
+import math
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+EARTH_RADIUS_M = 6_371_008.8
+
+Coordinate = tuple[float, float]
+
+class Geometry(NamedTuple):
+    ''' A WKT geometry in WGS84 (longitude, latitude), split into its points, lines and polygons,
+    so that MULTI* geometries and collections are handled the same way as simple ones.
+    A polygon is a list of rings, the first one being the outer ring.
+    '''
+    points: list[Coordinate]
+    lines: list[list[Coordinate]]
+    polygons: list[list[list[Coordinate]]]
+
+_WKT_TOKEN_PATTERN = re.compile(r'[A-Za-z]+|\(|\)|,|[-+0-9.eE]+')
+
+@lru_cache(maxsize = 100_000)
+def parse_wkt(wkt: str) -> Geometry:
+    ''' Parses a WKT literal (POINT, LINESTRING, POLYGON, their MULTI* forms and GEOMETRYCOLLECTION).
+    A leading CRS IRI, as allowed by GeoSPARQL, is ignored: coordinates are read as longitude, latitude.
+    Args:
+        wkt (str) : The WKT literal.
+    Returns:
+        Geometry : The parsed geometry.
+    '''
+    text = str(wkt).strip()
+    if text.startswith('<'):
+        text = text[text.index('>') + 1:]
+    tokens = _WKT_TOKEN_PATTERN.findall(text)
+    geometry = Geometry([], [], [])
+    position = _parse_wkt_geometry(tokens, 0, geometry)
+    if position != len(tokens):
+        raise ValueError(f"Invalid WKT literal: {wkt}")
+    return geometry
+
+def _parse_wkt_geometry(tokens: list[str], position: int, geometry: Geometry) -> int:
+    kind = tokens[position].upper()
+    position += 1
+    # dimensions supplémentaires (Z, M, ZM) : seules les deux premières coordonnées sont gardées
+    if position < len(tokens) and tokens[position].upper() in ('Z', 'M', 'ZM'):
+        position += 1
+    if position < len(tokens) and tokens[position].upper() == 'EMPTY':
+        return position + 1
+
+    if kind == 'GEOMETRYCOLLECTION':
+        position += 1 # '('
+        while True:
+            position = _parse_wkt_geometry(tokens, position, geometry)
+            if tokens[position] == ')':
+                return position + 1
+            position += 1 # ','
+
+    value, position = _parse_wkt_nested(tokens, position)
+    if kind == 'POINT':
+        geometry.points.append(value[0])
+    elif kind == 'MULTIPOINT':
+        # MULTIPOINT((x y), (x y)) ou MULTIPOINT(x y, x y)
+        geometry.points.extend(item[0] if isinstance(item, list) else item for item in value)
+    elif kind == 'LINESTRING':
+        geometry.lines.append(value)
+    elif kind == 'MULTILINESTRING':
+        geometry.lines.extend(value)
+    elif kind == 'POLYGON':
+        geometry.polygons.append(value)
+    elif kind == 'MULTIPOLYGON':
+        geometry.polygons.extend(value)
+    else:
+        raise ValueError(f"Unsupported WKT geometry: {kind}")
+    return position
+
+def _parse_wkt_nested(tokens: list[str], position: int) -> tuple[list, int]:
+    # '(' … ')' : une liste de coordonnées, ou de listes imbriquées
+    items: list = []
+    position += 1
+    while True:
+        if tokens[position] == '(':
+            item, position = _parse_wkt_nested(tokens, position)
+        else:
+            numbers = []
+            while tokens[position] not in (',', ')'):
+                numbers.append(float(tokens[position]))
+                position += 1
+            item = (numbers[0], numbers[1])
+        items.append(item)
+        if tokens[position] == ')':
+            return items, position + 1
+        position += 1
+
+def vertices(geometry: Geometry) -> list[Coordinate]:
+    ''' Returns all the coordinates of a geometry.
+    '''
+    coordinates = list(geometry.points)
+    for line in geometry.lines:
+        coordinates.extend(line)
+    for polygon in geometry.polygons:
+        for ring in polygon:
+            coordinates.extend(ring)
+    return coordinates
+
+def haversine_m(a: Coordinate, b: Coordinate) -> float:
+    ''' Returns the great-circle distance between two (longitude, latitude) coordinates, in metres.
+    '''
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+
+###########################
+# Géométrie plane
+#
+# Les géométries comparées sont projetées sur un plan tangent (équirectangulaire, centré sur
+# leur latitude moyenne) : l'erreur est négligeable aux distances d'un campus ou d'une ville.
+
+def _project(geometry: Geometry, lat0: float) -> Geometry:
+    kx = math.radians(1) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+    ky = math.radians(1) * EARTH_RADIUS_M
+    def p(c: Coordinate) -> Coordinate:
+        return (c[0] * kx, c[1] * ky)
+    return Geometry([p(c) for c in geometry.points],
+                    [[p(c) for c in line] for line in geometry.lines],
+                    [[[p(c) for c in ring] for ring in polygon] for polygon in geometry.polygons])
+
+def _segments(geometry: Geometry) -> list[tuple[Coordinate, Coordinate]]:
+    segments = []
+    for line in geometry.lines:
+        segments.extend(zip(line, line[1:]))
+    for polygon in geometry.polygons:
+        for ring in polygon:
+            segments.extend(zip(ring, ring[1:]))
+    return segments
+
+def _point_segment_distance(p: Coordinate, a: Coordinate, b: Coordinate) -> float:
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length2))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+def _orientation(a: Coordinate, b: Coordinate, c: Coordinate) -> float:
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+def _segments_cross(a: Coordinate, b: Coordinate, c: Coordinate, d: Coordinate) -> bool:
+    # intersection propre (les segments se traversent)
+    d1, d2 = _orientation(c, d, a), _orientation(c, d, b)
+    d3, d4 = _orientation(a, b, c), _orientation(a, b, d)
+    return ((d1 > 0) != (d2 > 0)) and ((d3 > 0) != (d4 > 0)) and 0 not in (d1, d2, d3, d4)
+
+def _in_ring(p: Coordinate, ring: list[Coordinate]) -> bool:
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        if (y1 > p[1]) != (y2 > p[1]) and p[0] < (x2 - x1) * (p[1] - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+def _in_polygon(p: Coordinate, polygon: list[list[Coordinate]]) -> bool:
+    return bool(polygon) and _in_ring(p, polygon[0]) and not any(_in_ring(p, hole) for hole in polygon[1:])
+
+def _planar_distance(a: Geometry, b: Geometry) -> float:
+    a_vertices, b_vertices = vertices(a), vertices(b)
+    # une géométrie à l'intérieur d'un polygone de l'autre : distance nulle
+    if any(_in_polygon(p, polygon) for p in a_vertices for polygon in b.polygons) \
+            or any(_in_polygon(p, polygon) for p in b_vertices for polygon in a.polygons):
+        return 0.0
+
+    a_segments, b_segments = _segments(a), _segments(b)
+    if any(_segments_cross(*s, *t) for s in a_segments for t in b_segments):
+        return 0.0
+
+    distance = math.inf
+    for p in a.points:
+        for q in b.points:
+            distance = min(distance, math.hypot(p[0] - q[0], p[1] - q[1]))
+    for p in a_vertices:
+        for s in b_segments:
+            distance = min(distance, _point_segment_distance(p, *s))
+    for p in b_vertices:
+        for s in a_segments:
+            distance = min(distance, _point_segment_distance(p, *s))
+    return distance
+
+def distance_m(a: Geometry, b: Geometry) -> float:
+    ''' Returns the shortest distance between two geometries, in metres (0 if they intersect).
+    Two points are measured along the great circle; other geometries on a local tangent plane.
+    Args:
+        a (Geometry) : The first geometry.
+        b (Geometry) : The second geometry.
+    Returns:
+        float : The distance in metres.
+    '''
+    if len(a.points) == 1 and len(b.points) == 1 and not (a.lines or a.polygons or b.lines or b.polygons):
+        return haversine_m(a.points[0], b.points[0])
+    coordinates = vertices(a) + vertices(b)
+    if not coordinates:
+        raise ValueError("Empty geometry")
+    lat0 = sum(c[1] for c in coordinates) / len(coordinates)
+    return _planar_distance(_project(a, lat0), _project(b, lat0))
+
+def within(a: Geometry, b: Geometry) -> bool:
+    ''' Checks whether a geometry lies within the polygons of another one (GeoSPARQL sfWithin).
+    Every vertex of a must be inside a polygon of b, and no segment of a may cross the boundary of b.
+    A point is also within an identical point.
+    Args:
+        a (Geometry) : The geometry that may be within.
+        b (Geometry) : The containing geometry.
+    Returns:
+        bool : Whether a is within b.
+    '''
+    a_vertices = vertices(a)
+    if not a_vertices:
+        return False
+    if not b.polygons:
+        return not (a.lines or a.polygons) and set(a_vertices) <= set(b.points)
+    if not all(any(_in_polygon(p, polygon) for polygon in b.polygons) for p in a_vertices):
+        return False
+    b_segments = _segments(Geometry([], [], b.polygons))
+    return not any(_segments_cross(*s, *t) for s in _segments(a) for t in b_segments)
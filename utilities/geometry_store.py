@@ -0,0 +1,229 @@
+import numpy as np
+from typing import Iterable, Optional
+from rdflib import Graph
+from .geometry import parse_wkt, EARTH_RADIUS_M
+from .spatial_index import iter_feature_geometries
+
+# type de géométrie de chaque entité
+POINT = 0
+LINE = 1
+POLYGON = 2
+
+class _GrowingArray:
+    # tableau NumPy agrandi par doublement : les ajouts un à un restent en temps constant amorti
+    def __init__(self, dtype, width: Optional[int] = None) -> None:
+        shape = (16,) if width is None else (16, width)
+        self.data = np.zeros(shape, dtype = dtype)
+        self.size = 0
+
+    def extend(self, values) -> None:
+        values = np.asarray(values, dtype = self.data.dtype)
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.zeros((max(end, 2 * len(self.data)),) + self.data.shape[1:], dtype = self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+class GeometryStore:
+    ''' A columnar store of the geometries of the spatial entities, keyed by entity IRI.
+    All the coordinates (longitude, latitude) lie in a single float64 array; each geometry is a
+    range of parts (a point, a linestring, a polygon ring) and each part a range of coordinates,
+    as offsets into that array. Bounding boxes, distances and endpoint matching are then computed
+    for many entities at once with NumPy instead of re-parsing WKT strings.
+    An entity added twice keeps its last geometry.
+    '''
+
+    def __init__(self) -> None:
+        self.ids: list[str] = []
+        self.rows: dict[str, int] = {}
+        self._kinds = _GrowingArray(np.int8)
+        # géométrie i : parties [part_offsets[i], part_offsets[i + 1])
+        self._part_offsets = _GrowingArray(np.int64)
+        self._part_offsets.extend([0])
+        # partie j : coordonnées [coordinate_offsets[j], coordinate_offsets[j + 1])
+        self._coordinate_offsets = _GrowingArray(np.int64)
+        self._coordinate_offsets.extend([0])
+        self._coordinates = _GrowingArray(np.float64, 2)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, entity) -> bool:
+        return str(entity) in self.rows
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> 'GeometryStore':
+        ''' Builds a store from the geo:hasGeometry/geo:asWKT geometries of a graph.
+        '''
+        store = cls()
+        store.add_graph(graph)
+        return store
+
+    def add_graph(self, graph: Graph) -> None:
+        for entity, wkt in iter_feature_geometries(graph):
+            self.add(entity, wkt)
+
+    def add(self, entity, wkt: str) -> None:
+        ''' Adds the geometry of an entity from its WKT literal.
+        Args:
+            entity (str | URIRef) : The entity IRI.
+            wkt (str) : The WKT literal.
+        '''
+        geometry = parse_wkt(str(wkt))
+        parts = [[point] for point in geometry.points] + geometry.lines + \
+                [ring for polygon in geometry.polygons for ring in polygon]
+        kind = POLYGON if geometry.polygons else LINE if geometry.lines else POINT
+
+        n_coordinates = self._coordinates.size
+        for part in parts:
+            self._coordinates.extend(part)
+            n_coordinates += len(part)
+            self._coordinate_offsets.extend([n_coordinates])
+        self._part_offsets.extend([self._coordinate_offsets.size - 1])
+        self._kinds.extend([kind])
+        self.rows[str(entity)] = len(self.ids)
+        self.ids.append(str(entity))
+
+    ###########################
+    # Accès
+
+    @property
+    def kinds(self) -> np.ndarray:
+        return self._kinds.view()
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        return self._coordinates.view()
+
+    def row_of(self, entities: Iterable) -> np.ndarray:
+        ''' Returns the rows of the given entities, -1 for those without geometry.
+        '''
+        rows = self.rows
+        return np.fromiter((rows.get(str(entity), -1) for entity in entities), dtype = np.int64)
+
+    def _coordinate_ranges(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # première et dernière + 1 coordonnées de chaque géométrie
+        part_offsets = self._part_offsets.view()
+        coordinate_offsets = self._coordinate_offsets.view()
+        return coordinate_offsets[part_offsets[rows]], coordinate_offsets[part_offsets[rows + 1]]
+
+    def coordinates_of(self, entity) -> np.ndarray:
+        ''' Returns all the coordinates of an entity, as a (n, 2) array (empty if it has no geometry).
+        '''
+        row = self.rows.get(str(entity))
+        if row is None:
+            return np.zeros((0, 2))
+        start, end = self._coordinate_ranges(np.array([row]))
+        return self.coordinates[start[0]:end[0]]
+
+    ###########################
+    # Calculs par lots
+
+    def bounds(self, entities: Optional[Iterable] = None) -> np.ndarray:
+        ''' Returns the bounding boxes (min lon, min lat, max lon, max lat) of the given entities,
+        all of them by default, as a (n, 4) array (NaN for the entities without geometry).
+        '''
+        # les géométries se suivent dans le tableau des coordonnées : une seule réduction les couvre toutes
+        start, end = self._coordinate_ranges(np.arange(len(self.ids)))
+        non_empty = end > start
+        all_boxes = np.full((len(self.ids), 4), np.nan)
+        if non_empty.any():
+            all_boxes[non_empty, :2] = np.minimum.reduceat(self.coordinates, start[non_empty], axis = 0)
+            all_boxes[non_empty, 2:] = np.maximum.reduceat(self.coordinates, start[non_empty], axis = 0)
+        if entities is None:
+            return all_boxes
+        rows = self.row_of(entities)
+        boxes = np.full((len(rows), 4), np.nan)
+        boxes[rows >= 0] = all_boxes[rows[rows >= 0]]
+        return boxes
+
+    def _endpoints_of_rows(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        first = np.full((len(rows), 2), np.nan)
+        last = np.full((len(rows), 2), np.nan)
+        known = rows >= 0
+        start, end = self._coordinate_ranges(rows[known])
+        non_empty = end > start
+        known_first = np.full((len(start), 2), np.nan)
+        known_last = np.full((len(start), 2), np.nan)
+        known_first[non_empty] = self.coordinates[start[non_empty]]
+        known_last[non_empty] = self.coordinates[end[non_empty] - 1]
+        first[known], last[known] = known_first, known_last
+        return first, last
+
+    def endpoints(self, entities: Iterable) -> tuple[np.ndarray, np.ndarray]:
+        ''' Returns the first and last coordinates of the given entities, as two (n, 2) arrays
+        (NaN for the entities without geometry).
+        '''
+        return self._endpoints_of_rows(self.row_of(entities))
+
+    def match_endpoints(self,
+                        points: Iterable,
+                        lines: Iterable,
+                        tolerance_m: float = 0.0) -> np.ndarray:
+        ''' Checks, for each (point, line) pair, whether the point is the first or the last
+        coordinate of the line, up to a tolerance. Pairs where the point is not a point or the
+        line not a linestring never match.
+        Args:
+            points (Iterable) : The point entities.
+            lines (Iterable) : The line entities, in the same order.
+            tolerance_m (float) : The distance in metres under which two coordinates are the same.
+        Returns:
+            np.ndarray : A boolean array, one value per pair.
+        '''
+        point_rows, line_rows = self.row_of(points), self.row_of(lines)
+        valid = (point_rows >= 0) & (line_rows >= 0)
+        valid[valid] = (self.kinds[point_rows[valid]] == POINT) & (self.kinds[line_rows[valid]] == LINE)
+        coordinates, _ = self._endpoints_of_rows(point_rows)
+        first, last = self._endpoints_of_rows(line_rows)
+        if tolerance_m <= 0:
+            return valid & ((coordinates == first).all(axis = 1) | (coordinates == last).all(axis = 1))
+
+        # écart en mètres sur un plan tangent, suffisant à l'échelle d'une tolérance
+        metres_per_degree = np.radians(1) * EARTH_RADIUS_M
+        cos_lat = np.cos(np.radians(coordinates[:, 1]))
+        def close(endpoint: np.ndarray) -> np.ndarray:
+            delta = coordinates - endpoint
+            return np.hypot(delta[:, 0] * cos_lat, delta[:, 1]) * metres_per_degree <= tolerance_m
+        return valid & (close(first) | close(last))
+
+    def point_distances_m(self, entities: Iterable, reference: tuple[float, float]) -> np.ndarray:
+        ''' Returns the great-circle distances in metres from the given point entities to a
+        (longitude, latitude) coordinate (NaN for the entities which are not points).
+        '''
+        rows = self.row_of(entities)
+        is_point = rows >= 0
+        is_point[is_point] = self.kinds[rows[is_point]] == POINT
+        coordinates = np.full((len(rows), 2), np.nan)
+        start, _ = self._coordinate_ranges(rows[is_point])
+        coordinates[is_point] = self.coordinates[start]
+        lon1, lat1 = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+        lon2, lat2 = np.radians(reference[0]), np.radians(reference[1])
+        h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+
+    def lengths_m(self, entities: Iterable) -> np.ndarray:
+        ''' Returns the lengths in metres of the given entities, summed over their linestrings and
+        polygon rings along the great circle (0 for points, NaN for the entities without geometry).
+        '''
+        coordinates = np.radians(self.coordinates)
+        # longueur de chaque pas entre deux coordonnées consécutives du tableau
+        lon, lat = coordinates[:, 0], coordinates[:, 1]
+        h = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        steps = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+        # un pas entre deux parties (ou deux géométries) ne compte pas
+        part_starts = self._coordinate_offsets.view()[1:-1]
+        steps[part_starts[(part_starts > 0) & (part_starts < len(lon))] - 1] = 0.0
+        cumulated = np.concatenate(([0.0], np.cumsum(steps)))
+
+        rows = self.row_of(entities)
+        lengths = np.full(len(rows), np.nan)
+        known = rows >= 0
+        start, end = self._coordinate_ranges(rows[known])
+        # somme des pas de la première à la dernière coordonnée de chaque géométrie
+        lengths[known] = np.where(end > start, cumulated[np.maximum(end - 1, 0)] - cumulated[start], 0.0)
+        return lengths
@@ -0,0 +1,111 @@
+import os
+import pickle
+import hashlib
+import rdflib
+from typing import Union, List, Optional
+from rdflib import Graph
+from .profiling import count
+
+GRAPH_CACHE_DIR = '.graph_cache'
+_SNAPSHOT_VERSION = 1
+
+def _file_hash(content: bytes) -> str:
+    return hashlib.sha1(content).hexdigest()
+
+def _snapshot_path(paths: List[str], cache_dir: Optional[str]) -> str:
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(paths[0]), GRAPH_CACHE_DIR)
+    key = _file_hash('\n'.join(paths).encode('utf-8'))[:16]
+    name = '+'.join(os.path.basename(path) for path in paths)
+    return os.path.join(cache_dir, f'{name}.{key}.pickle')
+
+def _read_snapshot_header(snapshot_path: str) -> Optional[dict]:
+    try:
+        with open(snapshot_path, 'rb') as snapshot:
+            return pickle.load(snapshot)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+def _read_snapshot_graph(snapshot_path: str) -> Optional[Graph]:
+    try:
+        with open(snapshot_path, 'rb') as snapshot:
+            pickle.load(snapshot) # en-tête
+            return pickle.load(snapshot)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+def _write_snapshot(snapshot_path: str, header: dict, graph: Graph) -> None:
+    # écriture atomique : un cache à moitié écrit n'est jamais relu
+    temporary_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok = True)
+        with open(temporary_path, 'wb') as snapshot:
+            pickle.dump(header, snapshot, protocol = pickle.HIGHEST_PROTOCOL)
+            pickle.dump(graph, snapshot, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, snapshot_path)
+    except OSError:
+        # le cache n'est qu'une optimisation : un dossier en lecture seule ne doit rien bloquer
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def load_cached_graph(paths: Union[str, List[str]],
+                      format: str = 'turtle',
+                      cache_dir: Optional[str] = None) -> Graph:
+    ''' Loads one or several RDF files into a single graph, through a binary snapshot cache.
+    The parsed graph is pickled in a cache directory (.graph_cache next to the first file by default),
+    and reloaded from there as long as the source files are unchanged: unpickling is several times
+    faster than parsing Turtle. A snapshot is checked against the mtime and size of each file first,
+    and only if they differ against its SHA-1, so that a copied or touched but identical file does
+    not invalidate it. Each call returns a new graph, which the caller is free to modify.
+    Args:
+        paths (str | list[str]) : The file(s) to load, in parsing order.
+        format (str) : The RDF format of the files.
+        cache_dir (str | None) : The directory where snapshots are stored.
+    Returns:
+        Graph : The graph holding the triples of all the files.
+    '''
+    if isinstance(paths, str):
+        paths = [paths]
+    paths = [os.path.abspath(path) for path in paths]
+    snapshot_path = _snapshot_path(paths, cache_dir)
+
+    stats = [os.stat(path) for path in paths]
+    header = _read_snapshot_header(snapshot_path)
+    if header is not None and header.get('version') == (_SNAPSHOT_VERSION, rdflib.__version__, format) \
+            and [source['path'] for source in header['sources']] == paths:
+        up_to_date = True
+        refreshed = False
+        for source, stat in zip(header['sources'], stats):
+            if (source['mtime_ns'], source['size']) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            # date de modification différente : seul le contenu fait foi
+            with open(source['path'], 'rb') as source_file:
+                if _file_hash(source_file.read()) != source['sha1']:
+                    up_to_date = False
+                    break
+            source['mtime_ns'], source['size'] = stat.st_mtime_ns, stat.st_size
+            refreshed = True
+
+        if up_to_date:
+            graph = _read_snapshot_graph(snapshot_path)
+            if graph is not None:
+                if refreshed:
+                    _write_snapshot(snapshot_path, header, graph)
+                count('graph_cache_hits')
+                count('bytes_read', os.path.getsize(snapshot_path))
+                return graph
+
+    graph = Graph()
+    sources = []
+    for path, stat in zip(paths, stats):
+        with open(path, 'rb') as source_file:
+            content = source_file.read()
+        count('bytes_read', len(content))
+        graph.parse(data = content.decode('utf-8'), format = format)
+        sources.append({'path': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': _file_hash(content)})
+
+    count('graph_cache_misses')
+    _write_snapshot(snapshot_path,
+                    {'version': (_SNAPSHOT_VERSION, rdflib.__version__, format), 'sources': sources},
+                    graph)
+    return graph
@@ -0,0 +1,149 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import NamedTuple, Optional
+import requests
+from .profiling import count
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    validator: Optional[str]
+    fetched_at: float
+
+class OfflineCacheMiss(requests.ConnectionError):
+    ''' Raised in offline mode when a response is not in the cache.
+    It subclasses requests.ConnectionError, so callers handle it like a network failure.
+    '''
+
+def request_key(method: str, url: str, params=None, data=None) -> str:
+    ''' Returns a stable key for an HTTP request.
+    Args:
+        method (str) : The HTTP method.
+        url (str) : The URL of the request.
+        params : The query parameters.
+        data : The form data.
+    Returns:
+        str : The SHA-256 of the canonical form of the request.
+    '''
+    canonical = json.dumps([method.upper(), url, params or {}, data or {}], sort_keys = True, default = str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class HttpCache:
+    ''' Persistent HTTP response cache stored in a SQLite file.
+    Bodies are content-addressed (stored once per SHA-256, whatever the number of entries pointing
+    to them) and entries expire after ttl_s seconds. An expired entry can be revalidated by the
+    caller through its validator (e.g. a wiki revision id) and refreshed with touch().
+    In offline mode entries never expire and no request reaches the network, so that a copy of
+    the cache file is enough to replay a run.
+    '''
+
+    def __init__(self, path: str, ttl_s: Optional[float] = 7 * 24 * 3600, offline: bool = False) -> None:
+        self.path = path
+        self.ttl_s = ttl_s
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS contents (
+                hash TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                validator TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_content_hash ON entries (content_hash);
+        ''')
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT contents.body, entries.validator, entries.fetched_at '
+                'FROM entries JOIN contents ON contents.hash = entries.content_hash WHERE entries.key = ?',
+                (key,)
+            ).fetchone()
+        return CacheEntry(bytes(row[0]), row[1], row[2]) if row else None
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self.offline or self.ttl_s is None or time.time() - entry.fetched_at < self.ttl_s
+
+    def put(self, key: str, body: bytes, validator: Optional[str] = None) -> None:
+        content_hash = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            previous = self.connection.execute('SELECT content_hash FROM entries WHERE key = ?', (key,)).fetchone()
+            self.connection.execute('BEGIN')
+            self.connection.execute('INSERT OR IGNORE INTO contents (hash, body) VALUES (?, ?)', (content_hash, body))
+            self.connection.execute('INSERT OR REPLACE INTO entries (key, content_hash, validator, fetched_at) VALUES (?, ?, ?, ?)',
+                                    (key, content_hash, validator, time.time()))
+            # le contenu remplacé est supprimé s'il n'est plus référencé
+            if previous and previous[0] != content_hash:
+                self.connection.execute('DELETE FROM contents WHERE hash = ? AND NOT EXISTS '
+                                        '(SELECT 1 FROM entries WHERE content_hash = ?)', (previous[0], previous[0]))
+            self.connection.execute('COMMIT')
+
+    def touch(self, key: str) -> None:
+        ''' Marks an entry as fetched now, once it has been revalidated.
+        '''
+        with self.lock:
+            self.connection.execute('UPDATE entries SET fetched_at = ? WHERE key = ?', (time.time(), key))
+
+class CachedSession(requests.Session):
+    ''' requests.Session serving responses from an HttpCache.
+    Successful responses are stored and served again as long as they are fresh; a stale response
+    is still served if the network fails or the server answers with an error status. Requests made with use_cache = False bypass the cache,
+    for callers that cache the content themselves. Without cache, behaves like requests.Session.
+    '''
+
+    def __init__(self, cache: Optional[HttpCache] = None) -> None:
+        super().__init__()
+        self.cache = cache
+
+    def request(self, method, url, params = None, data = None, *, use_cache: bool = True, **kwargs) -> requests.Response:
+        if self.cache is None:
+            return _counted(super().request(method, url, params = params, data = data, **kwargs), kwargs)
+
+        key = request_key(method, url, params, data)
+        entry = self.cache.get(key) if use_cache else None
+        if entry is not None and self.cache.is_fresh(entry):
+            count('http_cache_hits')
+            return _cached_response(entry.body, url)
+        if self.cache.offline:
+            raise OfflineCacheMiss(f"Response not in cache (offline mode): {method} {url}")
+
+        try:
+            response = _counted(super().request(method, url, params = params, data = data, **kwargs), kwargs)
+        except requests.RequestException:
+            if entry is not None:
+                count('http_cache_hits')
+                return _cached_response(entry.body, url)
+            raise
+        if not response.ok and entry is not None:
+            # erreur du serveur (5xx, 429…) : la réponse périmée vaut mieux que l'erreur
+            count('http_cache_hits')
+            return _cached_response(entry.body, url)
+        if use_cache and response.ok:
+            self.cache.put(key, response.content)
+        return response
+
+def _counted(response: requests.Response, kwargs: dict) -> requests.Response:
+    # le corps d'une réponse en flux n'est pas lu pour être compté
+    count('http_requests')
+    if not kwargs.get('stream'):
+        count('http_bytes', len(response.content))
+    return response
+
+def _cached_response(body: bytes, url: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    response.encoding = 'utf-8'
+    response.url = url
+    response.headers['X-Cache'] = 'HIT'
+    return response
@@ -0,0 +1,98 @@
+import re
+from functools import lru_cache
+from rdflib import Namespace, Literal, URIRef
+from rdflib.namespace import XSD
+from .utilities import snake_to_camel, str_to_best_type
+
+# Les scripts d'instanciation construisent sans cesse les mêmes termes : IRIs du vocabulaire
+# (piirritev[concept], piirrite['has' + …]), noms CamelCase des clés et valeurs OSM, littéraux
+# des valeurs les plus courantes (yes, 2, …). Ces fonctions gardent en cache un seul objet par
+# terme : moins d'allocations, et un graphe rdflib qui partage ses termes au lieu de les dupliquer.
+# Les caches sont bornés, les valeurs OSM libres (noms, descriptions) n'ayant pas de limite.
+#
+# Chaque processus du peuplement parallèle a ses propres caches.
+
+_CACHE_SIZE = 65_536
+
+@lru_cache(maxsize = _CACHE_SIZE)
+def camel(snake_str: str) -> str:
+    ''' Cached snake_to_camel, for the OSM keys and values met over and over.
+    '''
+    return snake_to_camel(snake_str)
+
+@lru_cache(maxsize = _CACHE_SIZE)
+def concept_name(osm_key: str, osm_value: str) -> str:
+    ''' Returns the piirritev name of an OSM tag (amenity=bicycle_parking → AmenityBicycleParking).
+    '''
+    return camel(osm_key) + camel(osm_value)
+
+@lru_cache(maxsize = _CACHE_SIZE)
+def vocabulary_iri(namespace: Namespace, local_name: str) -> URIRef:
+    ''' Returns the IRI namespace[local_name], a single object per IRI.
+    '''
+    return namespace[local_name]
+
+@lru_cache(maxsize = _CACHE_SIZE)
+def osm_entity_iri(namespace: Namespace, osm_entity: str) -> URIRef:
+    ''' Returns the PIIRRITE IRI of an OSM entity from its OSM IRI (…/node/42 → osmnode:42).
+    A node shared by several ways is then a single object.
+    '''
+    return namespace[str(osm_entity).split('/')[-1]]
+
+def value_datatype(var) -> URIRef:
+    # bool est une sous-classe de int : il doit être testé en premier
+    if isinstance(var, bool):
+        return XSD.boolean
+    if isinstance(var, int):
+        return XSD.integer
+    if isinstance(var, float):
+        return XSD.float
+    return XSD.string
+
+###########################
+# Typage des valeurs OSM
+#
+# Les formes courantes sont reconnues par expressions régulières, sans passer par les
+# exceptions de int(), float() et ast.literal_eval. Les autres, rares, repassent par
+# str_to_best_type, dont le résultat fait foi.
+
+_INTEGER_PATTERN = re.compile(r'[+-]?[0-9]+')
+_DECIMAL_PATTERN = re.compile(r'[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+)(?:[eE][+-]?[0-9]+)?')
+# ce que int() et float() pourraient encore accepter (espaces, _, chiffres non latins…)
+_NUMBER_LIKE_PATTERN = re.compile(r'\s*[+-]?(?:[\d_.eE]+|inf|infinity|nan)\s*', re.IGNORECASE)
+# une liste, un tuple ou un dictionnaire contient forcément l'un de ces caractères
+_CONTAINER_PATTERN = re.compile(r'[,\[({]')
+
+@lru_cache(maxsize = _CACHE_SIZE)
+def typed_value(osm_value: str) -> tuple[object, URIRef]:
+    ''' Returns the best Python value of a raw OSM value and its XSD datatype, as str_to_best_type
+    and value_datatype would, the common forms being recognized by regular expressions.
+    Args:
+        osm_value (str) : The raw OSM value.
+    Returns:
+        tuple[object, URIRef] : The converted value and its datatype.
+    '''
+    lowered = osm_value.lower()
+    if lowered in ('true', 'yes'):
+        return True, XSD.boolean
+    if lowered in ('false', 'no'):
+        return False, XSD.boolean
+    if _INTEGER_PATTERN.fullmatch(osm_value):
+        return int(osm_value), XSD.integer
+    if _DECIMAL_PATTERN.fullmatch(osm_value):
+        return float(osm_value), XSD.float
+    if not _NUMBER_LIKE_PATTERN.fullmatch(osm_value) and not _CONTAINER_PATTERN.search(osm_value):
+        return osm_value, XSD.string
+    converted_value = str_to_best_type(osm_value)
+    return converted_value, value_datatype(converted_value)
+
+@lru_cache(maxsize = _CACHE_SIZE)
+def value_literal(osm_value: str) -> Literal:
+    ''' Returns the literal of an OSM value, typed from its best Python type (see typed_value).
+    Args:
+        osm_value (str) : The raw OSM value.
+    Returns:
+        Literal : The typed literal.
+    '''
+    converted_value, datatype = typed_value(osm_value)
+    return Literal(converted_value, datatype = datatype)
@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import platform
+import time
+import cProfile
+import threading
+import functools
+from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Instrumentation des scripts, désactivée par défaut : count() et stage() ne coûtent alors
+# qu'un test. Elle s'active par la variable d'environnement PIIRRITE_PROFILE ('1' pour écrire
+# les rapports dans profiles/ à la racine du dépôt, ou le dossier où les écrire) ou par
+# enable_profiling(). Chaque exécution d'un main décoré par profiled_main écrit alors un
+# rapport JSON : durée et compteurs (triplets ajoutés, requêtes HTTP, accès au cache, octets
+# lus…) de chaque étape. Les étapes nommées dans PIIRRITE_PROFILE_STAGES (séparées par des
+# virgules) sont en plus profilées par cProfile, dans un fichier .prof lisible par pstats
+# ou snakeviz ; py-spy, lui, s'attache de l'extérieur : py-spy record -- python -m <script>.
+#
+# Les compteurs sont propres à chaque processus : ceux des processus du peuplement parallèle
+# ne remontent pas dans le rapport.
+
+DEFAULT_REPORT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'profiles'))
+
+_settings: Optional[dict] = None
+_counters: Counter = Counter()
+_counters_lock = threading.Lock()
+_stages: dict[str, dict] = {}
+_local = threading.local()
+# un seul profileur peut être actif à la fois
+_active_profile: Optional[cProfile.Profile] = None
+_profile_paths: list[str] = []
+
+def _get_settings() -> dict:
+    global _settings
+    if _settings is None:
+        value = os.environ.get('PIIRRITE_PROFILE', '').strip()
+        profile_stages = os.environ.get('PIIRRITE_PROFILE_STAGES', '')
+        _settings = {
+            'enabled': value not in ('', '0'),
+            'report_dir': DEFAULT_REPORT_DIR if value in ('', '0', '1') else value,
+            'profile_stages': {name.strip() for name in profile_stages.split(',') if name.strip()},
+        }
+    return _settings
+
+def enable_profiling(report_dir: Optional[str] = None, profile_stages: Iterable[str] = ()) -> None:
+    ''' Enables the instrumentation, whatever PIIRRITE_PROFILE says.
+    Args:
+        report_dir (str | None) : The directory of the reports, profiles/ by default.
+        profile_stages (Iterable[str]) : The stages to run under cProfile.
+    '''
+    global _settings
+    _settings = {'enabled': True, 'report_dir': report_dir or DEFAULT_REPORT_DIR,
+                 'profile_stages': set(profile_stages)}
+
+def disable_profiling() -> None:
+    global _settings
+    _settings = {'enabled': False, 'report_dir': DEFAULT_REPORT_DIR, 'profile_stages': set()}
+
+def is_profiling() -> bool:
+    return _get_settings()['enabled']
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss est en kio sous Linux, en octets sous macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+def count(counter: str, n: int = 1) -> None:
+    ''' Increments a counter (triples_added, http_requests…), if profiling is enabled.
+    '''
+    if not _get_settings()['enabled']:
+        return
+    with _counters_lock:
+        _counters[counter] += n
+
+def _stage_stack() -> list[str]:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    ''' Times a stage of a script and records the counters incremented meanwhile.
+    Stages nest: a stage opened inside another one is named 'outer/inner'. A stage entered
+    several times (e.g. in a loop) adds up its calls.
+    Args:
+        name (str) : The name of the stage.
+    '''
+    global _active_profile
+    settings = _get_settings()
+    if not settings['enabled']:
+        yield
+        return
+
+    stack = _stage_stack()
+    full_name = '/'.join(stack + [name])
+    stack.append(name)
+    # les étapes sont rangées dans le rapport dans l'ordre où elles commencent
+    record = _stages.setdefault(full_name, {'calls': 0, 'elapsed_s': 0.0, 'counters': Counter()})
+    with _counters_lock:
+        counters_before = _counters.copy()
+    profile = None
+    if _active_profile is None and (full_name in settings['profile_stages'] or name in settings['profile_stages']):
+        profile = _active_profile = cProfile.Profile()
+        profile.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_s = time.perf_counter() - start
+        if profile is not None:
+            profile.disable()
+            _active_profile = None
+            _profile_paths.append(_dump_profile(profile, full_name, settings['report_dir']))
+        stack.pop()
+        with _counters_lock:
+            counters = _counters - counters_before
+        record['calls'] += 1
+        record['elapsed_s'] += elapsed_s
+        record['counters'].update(counters)
+
+def timed(name: Optional[str] = None) -> Callable:
+    ''' Decorator running a function as a stage (see stage), named after the function by default.
+    '''
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _get_settings()['enabled']:
+                return function(*args, **kwargs)
+            with stage(name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _report_stem(script: str, started_at: datetime) -> str:
+    return f'{script}_{started_at.strftime("%Y%m%d-%H%M%S")}_{os.getpid()}'
+
+def _dump_profile(profile: cProfile.Profile, full_name: str, report_dir: str) -> str:
+    os.makedirs(report_dir, exist_ok = True)
+    # <script>_<date>_<pid>[_<étape>.<sous-étape>].prof
+    script, *stage_names = full_name.split('/')
+    file_name = _report_stem(script, datetime.now())
+    if stage_names:
+        file_name += '_' + '.'.join(stage_names)
+    path = os.path.join(report_dir, file_name + '.prof')
+    profile.dump_stats(path)
+    return path
+
+def profiled_main(script: str) -> Callable:
+    ''' Decorator of the main() of a script: the whole run is a stage named after the script and,
+    if profiling is enabled, a JSON report is written once it ends, even if it failed.
+    The report holds the arguments of the run, its elapsed time, peak RSS, counters, the time and
+    counters of every stage, and the paths of the cProfile dumps.
+    Args:
+        script (str) : The name of the script (e.g. 'modelet_1.instanciation').
+    '''
+    def decorator(main: Callable) -> Callable:
+        @functools.wraps(main)
+        def wrapper(*args, **kwargs):
+            settings = _get_settings()
+            if not settings['enabled']:
+                return main(*args, **kwargs)
+
+            with _counters_lock:
+                _counters.clear()
+            _stages.clear()
+            _profile_paths.clear()
+            started_at = datetime.now()
+            status = 'ok'
+            try:
+                with stage(script):
+                    return main(*args, **kwargs)
+            except BaseException as e:
+                status = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                path = write_report(script, started_at, status,
+                                    {'args': [repr(arg) for arg in args],
+                                     'kwargs': {key: repr(value) for key, value in kwargs.items()}})
+                print(f'Rapport de profilage écrit dans {path}.')
+        return wrapper
+    return decorator
+
+def write_report(script: str, started_at: datetime, status: str = 'ok', extra: Optional[dict] = None) -> str:
+    ''' Writes the JSON report of a run, from the stages recorded so far.
+    Args:
+        script (str) : The name of the script, also the name of its root stage.
+        started_at (datetime) : The start of the run.
+        status (str) : 'ok', or the error that ended the run.
+        extra (dict | None) : Other fields of the report.
+    Returns:
+        str : The path of the report.
+    '''
+    report_dir = _get_settings()['report_dir']
+    root = _stages.get(script, {'elapsed_s': None, 'counters': Counter()})
+    report = {
+        'script': script,
+        'started_at': started_at.isoformat(timespec = 'seconds'),
+        'status': status,
+        'python': platform.python_version(),
+        'elapsed_s': root['elapsed_s'],
+        'peak_rss_mb': peak_rss_mb(),
+        'counters': dict(sorted(root['counters'].items())),
+        'stages': {name: {'calls': record['calls'],
+                          'elapsed_s': record['elapsed_s'],
+                          'counters': dict(sorted(record['counters'].items()))}
+                   for name, record in _stages.items()},
+        'profiles': list(_profile_paths),
+        **(extra or {}),
+    }
+    os.makedirs(report_dir, exist_ok = True)
+    path = os.path.join(report_dir, _report_stem(script, started_at) + '.json')
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding = 'utf-8') as file:
+        json.dump(report, file, indent = 2, ensure_ascii = False)
+    os.replace(temporary_path, path)
+    return path
@@ -0,0 +1,504 @@
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from typing import Callable, Container, Iterable, Iterator, Optional
+from rdflib import Graph, Namespace, URIRef
+from rdflib.namespace import RDF
+from .profiling import count
+
+GEO_HAS_GEOMETRY = URIRef('http://www.opengis.net/ont/geosparql#hasGeometry')
+# espaces de noms des relations spatiales (ogc:sfContains, osm2rdf:contains_nonarea…)
+# qu'osm2rdf écrit dans une section finale, après toutes les entités
+SPATIAL_RELATION_NAMESPACES = ('http://www.opengis.net/rdf#', 'https://osm2rdf.cs.uni-freiburg.de/rdf#')
+
+_PREFIX_PATTERN = re.compile(r'^(?:@prefix|PREFIX)\s+([^\s:]*):\s*<([^>]*)>\s*\.?$', re.IGNORECASE)
+_BASE_PATTERN = re.compile(r'^(?:@base|BASE)\s', re.IGNORECASE)
+# nombre de triplets en attente au-delà duquel un TripleSink écrit son lot
+WRITE_BATCH_SIZE = 5_000
+
+class _StatementReader:
+    ''' Reads a Turtle or N-Triples file one statement at a time.
+    Prefix declarations are collected on the fly, comments and blank lines are skipped.
+    The file is read in binary mode so that the reading position can be saved and restored.
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'rb')
+        self.prefixes: dict[str, str] = {}
+        # un préfixe redéclaré pour un autre espace de noms : header() ne vaut plus pour tout le fichier
+        self.rebound_prefixes = False
+        self.pending: tuple[str, str] | None = None
+
+    def close(self) -> None:
+        self.file.close()
+
+    def expand(self, token: str) -> str:
+        ''' Expands a subject token (<iri>, prefix:local or _:label) into a full IRI.
+        Args:
+            token (str) : The token to expand.
+        Returns:
+            str : The full IRI, or the token itself for blank node labels.
+        '''
+        if token.startswith('<'):
+            return token[1:token.index('>')]
+        if token.startswith('_:') or ':' not in token:
+            return token
+        prefix, local = token.split(':', 1)
+        return self.prefixes.get(prefix, prefix + ':') + local.replace('\\', '')
+
+    def header(self) -> str:
+        ''' Returns the prefix declarations met so far, in Turtle syntax.
+        '''
+        return ''.join(f'@prefix {prefix}: <{namespace}> .\n' for prefix, namespace in self.prefixes.items())
+
+    def tell(self) -> tuple[int, tuple[str, str] | None]:
+        return self.file.tell(), self.pending
+
+    def offset(self, position: tuple[int, tuple[str, str] | None]) -> int:
+        ''' Returns the byte offset of the next statement at a reading position (see tell).
+        '''
+        file_position, pending = position
+        # un énoncé lu d'avance commence juste avant la position dans le fichier
+        return file_position - len(pending[1].encode('utf-8')) if pending is not None else file_position
+
+    def seek(self, position: tuple[int, tuple[str, str] | None]) -> None:
+        self.file.seek(position[0])
+        self.pending = position[1]
+
+    def peek(self) -> tuple[str, str] | None:
+        if self.pending is None:
+            self.pending = self._read()
+        return self.pending
+
+    def read(self) -> tuple[str, str] | None:
+        ''' Returns the next statement as (subject IRI, statement text), None at the end of the file.
+        '''
+        statement = self.peek()
+        self.pending = None
+        return statement
+
+    def _read(self) -> tuple[str, str] | None:
+        lines: list[str] = []
+        for raw_line in iter(self.file.readline, b''):
+            line = raw_line.decode('utf-8')
+            stripped = line.strip()
+            if not lines:
+                if not stripped or stripped.startswith('#'):
+                    continue
+                prefix = _PREFIX_PATTERN.match(stripped)
+                if prefix:
+                    if self.prefixes.get(prefix.group(1), prefix.group(2)) != prefix.group(2):
+                        self.rebound_prefixes = True
+                    self.prefixes[prefix.group(1)] = prefix.group(2)
+                    continue
+                if _BASE_PATTERN.match(stripped):
+                    continue
+            lines.append(line)
+            # un énoncé se termine par un point, hors chaîne multiligne
+            if stripped.endswith('.') and ''.join(lines).count('"""') % 2 == 0:
+                text = ''.join(lines)
+                return self.expand(text.split(None, 1)[0]), text
+        if lines:
+            text = ''.join(lines)
+            return self.expand(text.split(None, 1)[0]), text
+        return None
+
+    def read_block(self) -> tuple[str, str] | None:
+        ''' Returns the next group of consecutive statements sharing the same subject.
+        '''
+        statement = self.read()
+        if statement is None:
+            return None
+        subject, text = statement
+        texts = [text]
+        while (following := self.peek()) is not None and following[0] == subject:
+            texts.append(self.read()[1]) # type: ignore
+        return subject, ''.join(texts)
+
+    def find_block(self, subject: str, stop_subjects: Container[str] = ()) -> str | None:
+        ''' Moves forward until the block of the given subject and returns it.
+        The search stops before the first block of one of stop_subjects, which is then the next
+        block read; if neither is found before the end of the file, the reading position is restored.
+        Args:
+            subject (str) : The IRI of the subject to look for.
+            stop_subjects (Container[str]) : The IRIs of the subjects expected after it.
+        Returns:
+            str | None : The statements of the subject, or None if it was not found.
+        '''
+        start = self.tell()
+        while True:
+            position = self.tell()
+            block = self.read_block()
+            if block is None:
+                self.seek(start)
+                return None
+            if block[0] == subject:
+                return block[1]
+            if block[0] in stop_subjects:
+                self.seek(position)
+                return None
+
+    def block_at(self, offset: int) -> tuple[str, str]:
+        ''' Returns the block starting at a given byte offset (see offset), as (subject IRI, statements).
+        '''
+        self.seek((offset, None))
+        return self.read_block() # type: ignore
+
+    def is_spatial_relation(self, text: str) -> bool:
+        ''' Tells whether a statement is a spatial relation (see SPATIAL_RELATION_NAMESPACES).
+        '''
+        tokens = text.split(None, 2)
+        return len(tokens) > 2 and self.expand(tokens[1]).startswith(SPATIAL_RELATION_NAMESPACES)
+
+def _index_spatial_relations(reader: _StatementReader) -> dict[int, list[int]]:
+    # Parcourt tout le fichier et relève la position des relations spatiales, par empreinte
+    # (hash) de leur sujet : seule cette section est indexée, pas l'ensemble des sujets.
+    # Des relations consécutives d'un même sujet ne sont relevées qu'une fois (voir block_at).
+    relations: dict[int, list[int]] = {}
+    previous_subject = None
+    while True:
+        position = reader.tell()
+        statement = reader.read()
+        if statement is None:
+            return relations
+        subject, text = statement
+        if not reader.is_spatial_relation(text):
+            previous_subject = None
+            continue
+        if subject != previous_subject:
+            relations.setdefault(hash(subject), []).append(reader.offset(position))
+        previous_subject = subject
+
+def index_subject_statements(path: str) -> tuple[dict[str, tuple[int, int] | None], str]:
+    ''' Indexes the byte range of the statement of each subject of a Turtle file, so that the
+    statement can later be copied as is (see TripleSink.copy). Only a subject described by a single
+    statement, blank nodes written inline, gets a range: the others (several statements, or
+    statements about its blank nodes, as in N-Triples) get None.
+    Args:
+        path (str) : The path of the file to index.
+    Returns:
+        tuple[dict[str, tuple[int, int] | None], str] : The (start, end) byte range of each subject
+        IRI, and the prefix declarations the statements rely on.
+    '''
+    reader = _StatementReader(path)
+    spans: dict[str, tuple[int, int] | None] = {}
+    try:
+        previous_subject = None
+        while True:
+            start = reader.offset(reader.tell())
+            statement = reader.read()
+            if statement is None:
+                break
+            subject = statement[0]
+            if subject.startswith('_:'):
+                # les triplets d'un nœud anonyme ne sont pas dans l'énoncé de son sujet
+                if previous_subject is not None:
+                    spans[previous_subject] = None
+                continue
+            spans[subject] = (start, reader.file.tell()) if subject not in spans else None
+            previous_subject = subject
+    finally:
+        reader.close()
+    if reader.rebound_prefixes:
+        return {}, ''
+    return spans, reader.header()
+
+def _type_pattern(rdf_type: URIRef, prefixes: dict[str, str]) -> re.Pattern:
+    type_forms = [re.escape(f'<{rdf_type}>')]
+    type_predicates = ['a', re.escape(f'<{RDF.type}>')]
+    for prefix, namespace in prefixes.items():
+        if str(rdf_type).startswith(namespace):
+            type_forms.append(re.escape(prefix + ':' + str(rdf_type)[len(namespace):]))
+        if namespace == str(RDF):
+            type_predicates.append(re.escape(prefix + ':type'))
+    return re.compile(r'(?:^|\s)(?:' + '|'.join(type_predicates) + r')\s+(?:' + '|'.join(type_forms) + r')(?=\s*[.;,])')
+
+def iter_osm_entities(path: str,
+                      rdf_type: URIRef,
+                      batch_size: int = 1_000) -> Iterator[tuple[URIRef, Graph]]:
+    ''' Streams the OSM entities of a given type out of an osm2rdf dump (Turtle or N-Triples),
+    without loading the whole dump in memory.
+    Triples are grouped by subject; each entity is yielded along with a graph containing its
+    triples and the triples of its geometries (geo:hasGeometry). Entities are parsed by batches,
+    so the graph of an entity is shared with the other entities of its batch.
+    The spatial relations of an entity (ogc:sfContains…) need not follow its other statements:
+    osm2rdf writes them in a final section, after all the entities. A first pass over the file
+    therefore indexes the position of the spatial relations, keyed by the hash of their subject,
+    and they are joined to the block that declares the type of their subject. Only the spatial
+    relations are joined this way: the other statements of an entity are expected to follow each other.
+    Geometries are looked up with a second reading cursor: osm2rdf writes them in the same order
+    as their entities, whether right after them or, in a sorted N-Triples file, in their own
+    section, so that cursor only moves forward. A batch is parsed before the geometries of the
+    previous one are looked up, so that a missing geometry stops the cursor at the next expected
+    one instead of sending it to the end of the file.
+    Args:
+        path (str) : The path to the osm2rdf dump.
+        rdf_type (URIRef) : The type of the entities to stream (e.g. osm:node).
+        batch_size (int) : The number of entities parsed together.
+    Returns:
+        Iterator[tuple[URIRef, Graph]] : The entities and the graph holding their triples.
+    '''
+    entities_reader = _StatementReader(path)
+    geometries_reader = _StatementReader(path)
+    relations_reader = _StatementReader(path)
+    type_pattern: re.Pattern | None = None
+    known_prefixes = -1
+    # géométries absentes de la suite du fichier, constatées quand le curseur en a atteint la fin
+    absent_geometries: set[str] = set()
+
+    def parse_batch(batch_texts: list[str], entities_order: dict[str, int]) -> tuple[list[URIRef], Graph, list[str]]:
+        batch_graph = Graph()
+        # le premier parcours a relevé tous les préfixes, dont ceux des relations spatiales
+        batch_graph.parse(data = relations_reader.header() + ''.join(batch_texts), format = 'turtle')
+        entities = [entity for entity in batch_graph.subjects(RDF.type, rdf_type, unique = True)
+                    if isinstance(entity, URIRef)]
+        # l'ordre du fichier est conservé, c'est celui que suit le curseur des géométries
+        entities.sort(key = lambda entity: entities_order.get(str(entity), 0))
+        geometries = [str(geometry) for entity in entities for geometry in batch_graph.objects(entity, GEO_HAS_GEOMETRY)]
+        return entities, batch_graph, geometries
+
+    def complete_batch(batch: tuple[list[URIRef], Graph, list[str]],
+                       following_geometries: list[str]) -> Iterator[tuple[URIRef, Graph]]:
+        # ajoute ses géométries au lot puis rend ses entités ; le curseur s'arrête à la
+        # prochaine géométrie attendue, de ce lot ou du suivant
+        entities, batch_graph, geometries = batch
+        awaited = set(geometries).union(following_geometries) - absent_geometries
+        geometries_texts = []
+        for geometry in geometries:
+            if geometry in absent_geometries:
+                continue
+            awaited.discard(geometry)
+            geometry_text = geometries_reader.find_block(geometry, awaited)
+            if geometry_text is not None:
+                geometries_texts.append(geometry_text)
+                continue
+            # find_block ne s'arrête sur aucune géométrie attendue qu'en fin de fichier :
+            # aucune n'est alors plus loin
+            following = geometries_reader.peek()
+            if following is None or following[0] not in awaited:
+                absent_geometries.update(awaited)
+                awaited.clear()
+        if geometries_texts:
+            batch_graph.parse(data = geometries_reader.header() + ''.join(geometries_texts), format = 'turtle')
+
+        for entity in entities:
+            yield entity, batch_graph
+
+    try:
+        relations = _index_spatial_relations(relations_reader)
+        batch_texts: list[str] = []
+        entities_order: dict[str, int] = {}
+        previous_batch = None
+        while (block := entities_reader.read_block()) is not None:
+            subject, text = block
+            if len(entities_reader.prefixes) != known_prefixes:
+                known_prefixes = len(entities_reader.prefixes)
+                type_pattern = _type_pattern(rdf_type, entities_reader.prefixes)
+            # seuls les blocs qui déclarent le type recherché sont parsés
+            if not type_pattern.search(text): # type: ignore
+                continue
+            # les relations spatiales du sujet lui sont jointes ; celles d'un autre sujet
+            # de même empreinte restent indexées
+            offsets = relations.pop(hash(subject), None)
+            if offsets is not None:
+                others = []
+                for offset in offsets:
+                    relation_subject, relation_text = relations_reader.block_at(offset)
+                    if relation_subject == subject:
+                        text += relation_text
+                    else:
+                        others.append(offset)
+                if others:
+                    relations[hash(subject)] = others
+            if len(entities_order) >= batch_size:
+                batch = parse_batch(batch_texts, entities_order)
+                if previous_batch is not None:
+                    yield from complete_batch(previous_batch, batch[2])
+                previous_batch = batch
+                batch_texts, entities_order = [], {}
+            entities_order[subject] = len(entities_order)
+            batch_texts.append(text)
+        batch = parse_batch(batch_texts, entities_order) if batch_texts else None
+        if previous_batch is not None:
+            yield from complete_batch(previous_batch, batch[2] if batch is not None else [])
+        if batch is not None:
+            yield from complete_batch(batch, [])
+    finally:
+        count('bytes_read', entities_reader.file.tell())
+        entities_reader.close()
+        geometries_reader.close()
+        relations_reader.close()
+
+def replace_file(temporary_path: str, path: str) -> None:
+    ''' Moves a fully written temporary file onto its target, with the permissions the target
+    would have had if written directly: those of the file it replaces, or the default ones
+    (0o666 less the umask). tempfile.mkstemp creates files readable by their owner only.
+    Args:
+        temporary_path (str) : The temporary file, in the same directory as the target.
+        path (str) : The target file.
+    '''
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        # le umask ne se lit qu'en le remplaçant
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    os.chmod(temporary_path, mode)
+    os.replace(temporary_path, path)
+
+def serialize_block(triples: Iterable[tuple],
+                    namespaces: dict[str, Namespace],
+                    format: str = 'turtle') -> str:
+    ''' Serializes a block of triples the way open_rdf_writer writes it, so that the
+    serialization can be done elsewhere (e.g. in a worker process) and the text written as is.
+    Args:
+        triples (Iterable[tuple]) : The triples of the block (a graph or any iterable of triples).
+        namespaces (dict[str, Namespace]) : The prefixes of the file (Turtle only).
+        format (str) : 'turtle' or 'nt' (N-Triples).
+    Returns:
+        str : The serialized block, with its @prefix lines in Turtle.
+    '''
+    if format == 'nt' and isinstance(triples, Graph):
+        return triples.serialize(format = 'nt')
+    # graphe tampon portant les préfixes : chaque bloc y est copié puis sérialisé ;
+    # un graphe neuf par bloc coûte moins que d'en retirer les triplets un à un
+    block_graph = Graph(bind_namespaces = 'none')
+    for prefix, namespace in namespaces.items():
+        block_graph.bind(prefix, namespace)
+    block_graph.addN((s, p, o, block_graph) for s, p, o in triples)
+    return block_graph.serialize(format = format)
+
+@contextmanager
+def open_rdf_writer(path: str,
+                    namespaces: dict[str, Namespace],
+                    format: str = 'turtle') -> Iterator[Callable[..., None]]:
+    ''' Opens an incremental RDF writer, so that a graph can be written block by block instead
+    of being held in memory until a final serialize(). A block is a graph or any iterable of triples,
+    optionally given with its serialization by serialize_block, which is then written without
+    serializing the block again.
+    The blocks are written to a temporary file in the same directory, which replaces the target
+    file only once the writer is closed without error: a failed run leaves the previous file intact.
+    Args:
+        path (str) : The path of the file to write.
+        namespaces (dict[str, Namespace]) : The prefixes to declare at the top of the file (Turtle only).
+        format (str) : 'turtle' or 'nt' (N-Triples).
+    Returns:
+        Iterator[Callable[..., None]] : A function writing a block of triples (and its serialization, if known) to the file.
+    '''
+    if format not in ('turtle', 'nt'):
+        raise ValueError(f"Unsupported RDF format: {format}")
+
+    directory, file_name = os.path.split(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir = directory, prefix = f'.{file_name}.', suffix = '.tmp')
+    # espace de noms auquel chaque préfixe est lié à ce point du fichier
+    written_prefixes: dict[str, str] = {}
+
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding = 'utf-8') as file:
+            if format == 'turtle':
+                for prefix, namespace in namespaces.items():
+                    written_prefixes[prefix] = str(namespace)
+                    file.write(f'@prefix {prefix}: <{namespace}> .\n')
+                file.write('\n')
+
+            def write_block(triples: Iterable[tuple], text: Optional[str] = None) -> None:
+                if text is None:
+                    text = serialize_block(triples, namespaces, format)
+                if format == 'nt':
+                    file.write(text)
+                    return
+                # les préfixes déjà déclarés ne sont pas répétés ; ceux générés par le
+                # sérialiseur, ou liés ailleurs à un autre espace de noms, sont déclarés
+                # au fil de l'eau, ce que Turtle autorise
+                body = []
+                for line in text.splitlines(keepends = True):
+                    if line.startswith('@prefix'):
+                        declaration = _PREFIX_PATTERN.match(line.strip())
+                        if declaration is None or written_prefixes.get(declaration.group(1)) != declaration.group(2):
+                            if declaration is not None:
+                                written_prefixes[declaration.group(1)] = declaration.group(2)
+                            file.write(line)
+                    else:
+                        body.append(line)
+                block = ''.join(body).strip('\n')
+                if block:
+                    file.write(block + '\n\n')
+
+            yield write_block
+
+        replace_file(temporary_path, path)
+        count('bytes_written', os.path.getsize(path))
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+class TripleSink:
+    ''' Commits the triples of the instanciated entities, to a graph or to an ABox file.
+    With write_block (see open_rdf_writer), the triples are kept in a list and written once
+    batch_size of them are pending, so that the serializer runs once per batch instead of once
+    per entity, without going through an intermediate graph.
+    Without it, the triples of each entity go straight into the graph: Graph.addN of the Memory
+    store adds them one by one, so this is no faster than Graph.add and is not batched.
+    '''
+
+    def __init__(self,
+                 graph: Optional[Graph] = None,
+                 write_block: Optional[Callable[[Iterable[tuple]], None]] = None,
+                 batch_size: int = WRITE_BATCH_SIZE) -> None:
+        if graph is None and write_block is None:
+            raise ValueError('A TripleSink needs a graph or a write_block.')
+        self.graph = graph
+        self.write_block = write_block
+        self.batch_size = batch_size
+        self.pending: list[tuple] = []
+        # triplets recopiés d'une ABox précédente et texte de leurs énoncés (voir copy)
+        self.copied: list[tuple] = []
+        self.copied_texts: list[str] = []
+        self.copied_header = ''
+
+    def add(self, triples: Iterable[tuple]) -> None:
+        ''' Commits the triples of an entity (or of any block): added to the graph at once, or
+        kept for the next batch written to the ABox file.
+        '''
+        if self.write_block is None:
+            if not isinstance(triples, (list, tuple)):
+                triples = list(triples)
+            self.graph.addN((s, p, o, self.graph) for s, p, o in triples) # type: ignore
+            count('triples_added', len(triples))
+            return
+        n_pending = len(self.pending)
+        self.pending.extend(triples)
+        count('triples_added', len(self.pending) - n_pending)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def copy(self, triples: Iterable[tuple], text: str, header: str = '') -> None:
+        ''' Commits the triples of an entity along with their statements in a previous file
+        (see index_subject_statements), which are written as is instead of being serialized again.
+        The text must be in the format of write_block; header holds the prefix declarations it relies on.
+        '''
+        if self.write_block is None:
+            self.add(triples)
+            return
+        n_copied = len(self.copied)
+        self.copied.extend(triples)
+        self.copied_texts.append(text)
+        self.copied_header = header
+        count('triples_copied', len(self.copied) - n_copied)
+        if len(self.copied) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        ''' Writes the pending triples, if any.
+        '''
+        if self.write_block is None:
+            return
+        if self.pending:
+            self.write_block(self.pending)
+            self.pending = []
+        if self.copied:
+            self.write_block(self.copied, self.copied_header + ''.join(self.copied_texts))
+            self.copied, self.copied_texts = [], []
@@ -0,0 +1,222 @@
+import os
+import heapq
+import numpy as np
+from typing import Union, Optional, Iterable, NamedTuple
+from rdflib import Graph, Namespace, URIRef, RDF
+from .geometry import EARTH_RADIUS_M
+from .geometry_store import GeometryStore
+
+piirrite = Namespace('http://piirrite.univ-lyon1.fr/ontology/core#')
+
+ROUTING_GRAPH_SUFFIX = '.routing'
+_ROUTING_ARRAYS = ('indptr', 'indices', 'weights', 'edge_segments', 'coordinates', 'nodes', 'segments')
+
+class Route(NamedTuple):
+    ''' A path of the routing graph: its length, the points it goes through and the segments it follows.
+    '''
+    length_m: float
+    nodes: list[URIRef]
+    segments: list[URIRef]
+
+def _haversine_m(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(h)))
+
+class RoutingGraph:
+    ''' The graph of the traversable segments, in compressed sparse row (CSR) form: the edges leaving
+    node i are indices[indptr[i]:indptr[i + 1]], with their lengths in weights and the segment they
+    follow in edge_segments. Each segment gives an edge in both directions.
+    The arrays can be saved as .npy files and memory-mapped back (see load_routing_graph).
+    '''
+
+    def __init__(self,
+                 indptr: np.ndarray,
+                 indices: np.ndarray,
+                 weights: np.ndarray,
+                 edge_segments: np.ndarray,
+                 coordinates: np.ndarray,
+                 nodes: np.ndarray,
+                 segments: np.ndarray) -> None:
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.edge_segments = edge_segments
+        # (longitude, latitude) de chaque nœud, NaN si inconnue
+        self.coordinates = coordinates
+        self.nodes = nodes
+        self.segments = segments
+        self.node_index = {str(node): i for i, node in enumerate(nodes.tolist())}
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    def _node_indices(self, nodes: Union[str, Iterable]) -> set[int]:
+        if isinstance(nodes, str):
+            nodes = [nodes]
+        return {self.node_index[str(node)] for node in nodes if str(node) in self.node_index}
+
+    def nearest_node(self, lon: float, lat: float) -> Optional[URIRef]:
+        ''' Returns the node closest to a (longitude, latitude) coordinate, e.g. to route from a
+        point of interest which is not on a segment.
+        '''
+        distances = _haversine_m(self.coordinates[:, 0], self.coordinates[:, 1], lon, lat)
+        if not len(distances) or np.isnan(distances).all():
+            return None
+        return URIRef(self.nodes[int(np.nanargmin(distances))])
+
+    def shortest_path(self,
+                      sources: Union[str, Iterable],
+                      targets: Union[str, Iterable],
+                      via: Iterable[Union[str, Iterable]] = ()) -> Optional[Route]:
+        ''' Returns the shortest path from one of the sources to one of the targets, going through
+        one node of each waypoint group in order (e.g. via=[vending_machines] for "via a coffee machine").
+        The search is a Dijkstra over (node, number of waypoint groups reached) states; with a single
+        target it becomes an A* guided by the great-circle distance to the target, which never
+        overestimates since each edge is at least as long as the straight line between its ends.
+        Args:
+            sources (str | Iterable) : The starting node(s).
+            targets (str | Iterable) : The destination node(s).
+            via (Iterable[str | Iterable]) : The waypoint groups, each one a node or a set of nodes.
+        Returns:
+            Route | None : The shortest path, None if there is none.
+        '''
+        source_indices = self._node_indices(sources)
+        target_indices = self._node_indices(targets)
+        groups = [self._node_indices(group) for group in via]
+        if not source_indices or not target_indices or any(not group for group in groups):
+            return None
+        n, n_stages = self.n_nodes, len(groups) + 1
+
+        if len(target_indices) == 1:
+            target_lon, target_lat = self.coordinates[next(iter(target_indices))]
+            straight = np.nan_to_num(_haversine_m(self.coordinates[:, 0], self.coordinates[:, 1], target_lon, target_lat))
+        else:
+            straight = np.zeros(n)
+
+        # état = étape * n + nœud, l'étape étant le nombre de groupes de passage déjà atteints
+        distances: dict[int, float] = {}
+        # prédécesseur de chaque état : (état précédent, arête suivie, -1 pour un passage d'étape)
+        previous: dict[int, tuple[int, int]] = {}
+        queue: list[tuple[float, float, int]] = []
+
+        def push(state: int, distance: float, origin: tuple[int, int] | None) -> None:
+            if distance < distances.get(state, np.inf):
+                distances[state] = distance
+                if origin is not None:
+                    previous[state] = origin
+                heapq.heappush(queue, (distance + straight[state % n], distance, state))
+
+        for source in source_indices:
+            push(source, 0.0, None)
+
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        done = set()
+        while queue:
+            _, distance, state = heapq.heappop(queue)
+            if state in done:
+                continue
+            done.add(state)
+            stage, node = divmod(state, n)
+            if stage == n_stages - 1 and node in target_indices:
+                return self._route(state, distance, previous)
+            # passage par un point du groupe attendu : on change d'étape sans bouger
+            if stage < n_stages - 1 and node in groups[stage]:
+                push(state + n, distance, (state, -1))
+            start, end = int(indptr[node]), int(indptr[node + 1])
+            for edge, neighbour, weight in zip(range(start, end), indices[start:end].tolist(), weights[start:end].tolist()):
+                push(stage * n + neighbour, distance + weight, (state, edge))
+        return None
+
+    def _route(self, state: int, length_m: float, previous: dict[int, tuple[int, int]]) -> Route:
+        nodes, segments = [int(state % self.n_nodes)], []
+        while state in previous:
+            state, edge = previous[state]
+            if edge >= 0:
+                nodes.append(int(state % self.n_nodes))
+                segments.append(int(self.edge_segments[edge]))
+        return Route(length_m,
+                     [URIRef(self.nodes[i]) for i in reversed(nodes)],
+                     [URIRef(self.segments[i]) for i in reversed(segments)])
+
+def build_routing_graph(graph: Graph, geometry_store: Optional[GeometryStore] = None) -> RoutingGraph:
+    ''' Compiles the traversable segments of an ABox and their two extremities into a routing graph.
+    Each edge is as long as its segment's linestring, and at least as long as the straight line between
+    its extremities. A segment without exactly two extremities is left out.
+    Args:
+        graph (Graph) : The ABox (modelet 2).
+        geometry_store (GeometryStore | None) : The geometries of the segments and points, read from the graph by default.
+    Returns:
+        RoutingGraph : The routing graph.
+    '''
+    if geometry_store is None:
+        geometry_store = GeometryStore.from_graph(graph)
+
+    segments, extremities = [], []
+    for segment in sorted(graph.subjects(RDF.type, piirrite.TraversableSegment)):
+        segment_extremities = sorted(set(graph.objects(segment, piirrite.hasExtremity)))
+        if len(segment_extremities) == 2:
+            segments.append(str(segment))
+            extremities.append((str(segment_extremities[0]), str(segment_extremities[1])))
+
+    nodes = sorted({node for pair in extremities for node in pair})
+    node_index = {node: i for i, node in enumerate(nodes)}
+    coordinates, _ = geometry_store.endpoints(nodes)
+    coordinates = coordinates.reshape(-1, 2)
+
+    u = np.array([node_index[a] for a, _ in extremities], dtype = np.int64)
+    v = np.array([node_index[b] for _, b in extremities], dtype = np.int64)
+    straight = np.nan_to_num(_haversine_m(coordinates[u, 0], coordinates[u, 1], coordinates[v, 0], coordinates[v, 1]))
+    lengths = np.fmax(geometry_store.lengths_m(segments), straight)
+
+    # chaque segment donne une arête dans chaque sens, rangées par nœud de départ
+    sources = np.concatenate((u, v))
+    order = np.argsort(sources, kind = 'stable')
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength = len(nodes))))).astype(np.int64)
+    return RoutingGraph(indptr,
+                        np.concatenate((v, u))[order].astype(np.int32),
+                        np.concatenate((lengths, lengths))[order],
+                        np.concatenate((np.arange(len(segments)), np.arange(len(segments))))[order].astype(np.int32),
+                        coordinates,
+                        np.array(nodes, dtype = str),
+                        np.array(segments, dtype = str))
+
+###########################
+# Persistance à côté de l'ABox
+
+def routing_graph_path(ABox_file: str) -> str:
+    return os.path.splitext(ABox_file)[0] + ROUTING_GRAPH_SUFFIX
+
+def save_routing_graph(routing_graph: RoutingGraph, ABox_file: str) -> str:
+    ''' Saves a routing graph next to its ABox (ABox.ttl → ABox.routing/), one .npy file per array.
+    Args:
+        routing_graph (RoutingGraph) : The routing graph.
+        ABox_file (str) : The path of the ABox.
+    Returns:
+        str : The directory of the routing graph.
+    '''
+    directory = routing_graph_path(ABox_file)
+    os.makedirs(directory, exist_ok = True)
+    for name in _ROUTING_ARRAYS:
+        # écriture atomique de chaque tableau
+        temporary_path = os.path.join(directory, f'.{name}.{os.getpid()}.tmp.npy')
+        np.save(temporary_path, getattr(routing_graph, name))
+        os.replace(temporary_path, os.path.join(directory, f'{name}.npy'))
+    return directory
+
+def load_routing_graph(ABox_file: str) -> RoutingGraph:
+    ''' Loads the routing graph saved next to an ABox. The arrays are memory-mapped: only the
+    parts visited by a search are read from the disk.
+    Args:
+        ABox_file (str) : The path of the ABox.
+    Returns:
+        RoutingGraph : The routing graph.
+    '''
+    directory = routing_graph_path(ABox_file)
+    return RoutingGraph(**{name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode = 'r')
+                           for name in _ROUTING_ARRAYS})
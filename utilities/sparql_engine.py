@@ -0,0 +1,137 @@
+from typing import Union, List
+from itertools import islice
+from rdflib import Graph, Literal, Namespace, Variable
+from rdflib.namespace import XSD
+from rdflib.plugins.sparql import prepareQuery, CUSTOM_EVALS
+from rdflib.plugins.sparql.evaluate import evalBGP
+from rdflib.plugins.sparql.operators import register_custom_function
+from rdflib.plugins.sparql.sparql import SPARQLError
+from .geometry import parse_wkt, distance_m, within
+from .graph_cache import load_cached_graph
+
+spatialf = Namespace('http://jena.apache.org/function/spatial#')
+geof = Namespace('http://www.opengis.net/def/function/geosparql/')
+uom = Namespace('http://www.opengis.net/def/uom/OGC/1.0/')
+
+# facteur de conversion des unités acceptées vers le mètre
+UNITS_IN_METRES = {
+    uom.metre: 1.0,
+    uom.meter: 1.0,
+    uom.kilometre: 1_000.0,
+    uom.kilometer: 1_000.0,
+    uom.centimetre: 0.01,
+    uom.centimeter: 0.01,
+}
+
+###########################
+# Fonctions GeoSPARQL
+
+def _geometry(term):
+    try:
+        return parse_wkt(str(term))
+    except (ValueError, IndexError) as e:
+        raise SPARQLError(f"Invalid WKT literal: {term}") from e
+
+def _distance(wkt1, wkt2, unit = uom.metre) -> Literal:
+    if unit not in UNITS_IN_METRES:
+        raise SPARQLError(f"Unsupported unit: {unit}")
+    return Literal(distance_m(_geometry(wkt1), _geometry(wkt2)) / UNITS_IN_METRES[unit], datatype = XSD.double)
+
+def _sf_within(wkt1, wkt2) -> Literal:
+    return Literal(within(_geometry(wkt1), _geometry(wkt2)))
+
+def _sf_contains(wkt1, wkt2) -> Literal:
+    return Literal(within(_geometry(wkt2), _geometry(wkt1)))
+
+###########################
+# Ordre des jointures
+#
+# rdflib évalue les triplets d'un BGP dans un ordre qui ne tient pas compte des variables
+# partagées : deux triplets sans variable commune (?pt a SpatialPoint, ?geom a Geometry) peuvent
+# se suivre et produire un produit cartésien. Les triplets sont donc réordonnés avant évaluation :
+# d'abord ceux liés aux variables déjà connues, puis les moins liés, puis les moins nombreux.
+
+# au-delà, le nombre de correspondances d'un triplet n'a plus d'importance pour l'ordre
+_MAX_PATTERN_COUNT = 10_000
+
+def _pattern_count(graph: Graph, triple: tuple, counts: dict) -> int:
+    pattern = tuple(None if isinstance(term, Variable) else term for term in triple)
+    if pattern not in counts:
+        counts[pattern] = sum(1 for _ in islice(graph.triples(pattern), _MAX_PATTERN_COUNT)) # type: ignore
+    return counts[pattern]
+
+def _order_triples(graph: Graph, triples: list, bound: set, counts: dict) -> list:
+    remaining = list(triples)
+    bound = set(bound)
+    ordered = []
+    while remaining:
+        def cost(triple) -> tuple:
+            variables = [term for term in triple if isinstance(term, Variable)]
+            connected = not variables or any(v in bound for v in variables)
+            return (not connected, sum(v not in bound for v in variables), _pattern_count(graph, triple, counts))
+        best = min(remaining, key = cost)
+        remaining.remove(best)
+        ordered.append(best)
+        bound.update(term for term in best if isinstance(term, Variable))
+    return ordered
+
+def _evaluate_bgp(ctx, part):
+    if part.name != 'BGP' or len(part.triples) < 2:
+        raise NotImplementedError()
+    graph = ctx.graph
+    bound = frozenset(term for triple in part.triples for term in triple
+                      if isinstance(term, Variable) and ctx[term] is not None)
+    # l'ordre ne dépend que des variables déjà liées : il est calculé une fois par graphe et par cas
+    plans = part.setdefault('_plans', {}).setdefault((id(graph), len(graph)), {})
+    if bound not in plans:
+        plans[bound] = _order_triples(graph, part.triples, bound, plans.setdefault('counts', {}))
+    return evalBGP(ctx, plans[bound])
+
+def register_sparql_extensions() -> None:
+    ''' Extends the rdflib SPARQL engine for the competency questions: registers the GeoSPARQL functions
+    spatialf:distance and geof:distance (with a uom: unit), geof:sfWithin and geof:sfContains, and
+    orders the triples of each basic graph pattern so as to join them through their shared variables.
+    '''
+    register_custom_function(spatialf.distance, _distance, override = True)
+    register_custom_function(geof.distance, _distance, override = True)
+    register_custom_function(geof.sfWithin, _sf_within, override = True)
+    register_custom_function(geof.sfContains, _sf_contains, override = True)
+    CUSTOM_EVALS['piirrite_bgp'] = _evaluate_bgp
+
+###########################
+# Exécution des requêtes
+
+def _to_python(term):
+    # littéraux convertis en types Python (int, float, str, bool…), IRIs gardées telles quelles
+    return term.toPython() if isinstance(term, Literal) else term
+
+def run_sparql_query_in_graph(graph: Graph,
+                              query_path: str) -> Union[bool, List[dict]]:
+    ''' Runs a SPARQL query file against a graph already in memory.
+    Args:
+        graph (Graph) : The graph to query.
+        query_path (str) : The path to the SPARQL query file.
+    Returns:
+        bool | list[dict] : The answer of an ASK query, or the rows of a SELECT query as
+            {variable: value} dicts, literals being converted to Python values.
+    '''
+    register_sparql_extensions()
+    with open(query_path, 'r', encoding = 'utf-8') as f:
+        query = prepareQuery(f.read())
+    result = graph.query(query)
+    if result.type == 'ASK':
+        return bool(result.askAnswer)
+    variables = [str(variable) for variable in result.vars or []]
+    return [{variable: _to_python(value) for variable, value in zip(variables, row)} for row in result] # type: ignore
+
+def run_sparql_queries(data_paths: Union[str, List[str]],
+                       query_paths: List[str]) -> dict:
+    ''' Loads the data once (through the graph cache) and runs several SPARQL query files against it.
+    Args:
+        data_paths (str | list[str]) : The RDF file(s) to query.
+        query_paths (list[str]) : The paths to the SPARQL query files.
+    Returns:
+        dict : The result of each query (see run_sparql_query_in_graph), by query path.
+    '''
+    graph = load_cached_graph(data_paths)
+    return {query_path: run_sparql_query_in_graph(graph, query_path) for query_path in query_paths}
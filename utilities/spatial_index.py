@@ -0,0 +1,285 @@
+import os
+import math
+import heapq
+import numpy as np
+from typing import Union, Optional, Iterable, Iterator
+from rdflib import Graph, Namespace, URIRef
+from .geometry import Geometry, parse_wkt, vertices, distance_m, within, EARTH_RADIUS_M
+from .compiled_graph import load_compiled_graph
+
+geo = Namespace('http://www.opengis.net/ont/geosparql#')
+
+SPATIAL_INDEX_SUFFIX = '.spatial.npz'
+_SPATIAL_INDEX_VERSION = 2
+# nombre d'enfants par nœud de l'arbre
+_NODE_CAPACITY = 16
+# résolution de la courbe de Hilbert : grille de 2^16 × 2^16 cellules sur l'emprise des géométries
+_HILBERT_ORDER = 16
+# mètres par degré de latitude
+_METRES_PER_DEGREE = math.radians(1) * EARTH_RADIUS_M
+
+###########################
+# Construction
+
+def _bounding_box(geometry: Geometry) -> tuple[float, float, float, float]:
+    coordinates = vertices(geometry)
+    lons = [c[0] for c in coordinates]
+    lats = [c[1] for c in coordinates]
+    return (min(lons), min(lats), max(lons), max(lats))
+
+def _hilbert_keys(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    # rang de chaque cellule (x, y) le long de la courbe de Hilbert, calculé pour toutes à la fois
+    x, y = x.copy(), y.copy()
+    keys = np.zeros(len(x), dtype = np.int64)
+    n = 1 << _HILBERT_ORDER
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # rotation du quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return keys
+
+def _pack_levels(boxes: np.ndarray) -> list[np.ndarray]:
+    # niveaux de l'arbre, des géométries (niveau 0) à la racine : les enfants du nœud i
+    # sont les éléments [i * _NODE_CAPACITY, (i + 1) * _NODE_CAPACITY) du niveau inférieur
+    levels = [boxes]
+    while len(levels[-1]) > _NODE_CAPACITY:
+        children = levels[-1]
+        n_nodes = -(-len(children) // _NODE_CAPACITY)
+        padded = np.full((n_nodes * _NODE_CAPACITY, 4), np.nan)
+        padded[:len(children)] = children
+        groups = padded.reshape(n_nodes, _NODE_CAPACITY, 4)
+        levels.append(np.column_stack((np.nanmin(groups[:, :, 0], axis = 1), np.nanmin(groups[:, :, 1], axis = 1),
+                                       np.nanmax(groups[:, :, 2], axis = 1), np.nanmax(groups[:, :, 3], axis = 1))))
+    return levels
+
+def iter_feature_geometries(graph: Union[Graph, Iterable[tuple]]) -> Iterator[tuple[str, str]]:
+    ''' Yields the (feature IRI, WKT literal) pairs of a graph, or of a list of triples, read from
+    their geo:hasGeometry/geo:asWKT paths.
+    '''
+    if isinstance(graph, Graph):
+        for feature, geometry in graph.subject_objects(geo.hasGeometry):
+            for wkt in graph.objects(geometry, geo.asWKT):
+                yield str(feature), str(wkt)
+        return
+    triples = list(graph)
+    wkts: dict = {}
+    for s, p, o in triples:
+        if p == geo.asWKT:
+            wkts.setdefault(s, []).append(o)
+    for s, p, o in triples:
+        if p == geo.hasGeometry:
+            for wkt in wkts.get(o, ()):
+                yield str(s), str(wkt)
+
+class SpatialIndex:
+    ''' An R-tree over the geometries of the spatial features of an ABox (SpatialPoint, SpatialSegment…).
+    The tree is packed once for all: the geometries are sorted along a Hilbert curve and grouped
+    16 by 16 into nodes, themselves grouped 16 by 16 up to the root, so that a query only visits
+    the few branches whose bounding box may hold an answer instead of every geometry.
+    The exact tests use the same distance and containment as the in-process SPARQL engine.
+    '''
+
+    def __init__(self, entries: Iterable[tuple[str, str]]) -> None:
+        entries = list(entries)
+        boxes = np.array([_bounding_box(parse_wkt(wkt)) for _, wkt in entries], dtype = float).reshape(-1, 4)
+        order = np.arange(len(entries))
+        if len(entries) > 1:
+            # position des centres sur la grille de la courbe de Hilbert
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            low, high = centers.min(axis = 0), centers.max(axis = 0)
+            span = np.where(high > low, high - low, 1.0)
+            cells = ((centers - low) / span * ((1 << _HILBERT_ORDER) - 1)).astype(np.int64)
+            order = np.argsort(_hilbert_keys(cells[:, 0], cells[:, 1]), kind = 'stable')
+        self.features = [entries[i][0] for i in order]
+        self.wkts = [entries[i][1] for i in order]
+        self.levels = _pack_levels(boxes[order])
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    @classmethod
+    def _from_arrays(cls, features: list[str], wkts: list[str], levels: list[np.ndarray]) -> 'SpatialIndex':
+        index = cls.__new__(cls)
+        index.features, index.wkts, index.levels = features, wkts, levels
+        return index
+
+    def _search_box(self, box: tuple[float, float, float, float]) -> list[int]:
+        # positions des géométries dont l'emprise croise la boîte, en descendant depuis la racine
+        if not self.features:
+            return []
+        min_lon, min_lat, max_lon, max_lat = box
+        found = []
+        stack = [(len(self.levels) - 1, 0, len(self.levels[-1]))]
+        while stack:
+            level, start, end = stack.pop()
+            boxes = self.levels[level][start:end]
+            hits = start + np.flatnonzero((boxes[:, 0] <= max_lon) & (boxes[:, 2] >= min_lon) &
+                                          (boxes[:, 1] <= max_lat) & (boxes[:, 3] >= min_lat))
+            if level == 0:
+                found.extend(hits.tolist())
+                continue
+            n_children = len(self.levels[level - 1])
+            for node in hits.tolist():
+                stack.append((level - 1, node * _NODE_CAPACITY, min((node + 1) * _NODE_CAPACITY, n_children)))
+        return found
+
+    def nearest(self,
+                geometry: Union[str, Geometry],
+                k: int = 1,
+                max_distance_m: float = math.inf) -> list[tuple[URIRef, float]]:
+        ''' Returns the k features nearest to a geometry, by increasing distance.
+        The branches are visited best first, by the distance to their bounding box: the search
+        stops as soon as no branch left can be closer than the k features found.
+        Args:
+            geometry (str | Geometry) : The reference geometry, as a WKT literal or parsed.
+            k (int) : The number of features to return.
+            max_distance_m (float) : The distance in metres beyond which features are ignored.
+        Returns:
+            list[tuple[URIRef, float]] : The (feature, distance in metres) pairs.
+        '''
+        reference = parse_wkt(geometry) if isinstance(geometry, str) else geometry
+        reference_box = _bounding_box(reference)
+        if not self.features or k <= 0:
+            return []
+
+        def box_distance(box) -> float:
+            # minorant de la distance à une emprise, au cosinus de la latitude la plus éloignée de l'équateur
+            dlon = max(box[0] - reference_box[2], reference_box[0] - box[2], 0.0)
+            dlat = max(box[1] - reference_box[3], reference_box[1] - box[3], 0.0)
+            cos_lat = math.cos(math.radians(min(90.0, max(abs(box[1]), abs(box[3]), abs(reference_box[1]), abs(reference_box[3])))))
+            return _METRES_PER_DEGREE * math.hypot(dlon * cos_lat, dlat)
+
+        top = len(self.levels) - 1
+        # (distance, niveau, position) : une géométrie (niveau -1) est mesurée exactement
+        queue = [(box_distance(box), top, position) for position, box in enumerate(self.levels[top].tolist())]
+        heapq.heapify(queue)
+        found = []
+        while queue and len(found) < k:
+            distance, level, position = heapq.heappop(queue)
+            if distance > max_distance_m:
+                break
+            if level < 0:
+                found.append((URIRef(self.features[position]), distance))
+            elif level == 0:
+                heapq.heappush(queue, (distance_m(parse_wkt(self.wkts[position]), reference), -1, position))
+            else:
+                start = position * _NODE_CAPACITY
+                children = self.levels[level - 1][start:start + _NODE_CAPACITY].tolist()
+                for offset, box in enumerate(children):
+                    heapq.heappush(queue, (box_distance(box), level - 1, start + offset))
+        return found
+
+    def within_radius(self,
+                      geometry: Union[str, Geometry],
+                      radius_m: float) -> list[tuple[URIRef, float]]:
+        ''' Returns the features lying within a given distance of a geometry, by increasing distance.
+        Args:
+            geometry (str | Geometry) : The reference geometry, as a WKT literal or parsed.
+            radius_m (float) : The distance in metres.
+        Returns:
+            list[tuple[URIRef, float]] : The (feature, distance in metres) pairs.
+        '''
+        reference = parse_wkt(geometry) if isinstance(geometry, str) else geometry
+        min_lon, min_lat, max_lon, max_lat = _bounding_box(reference)
+        dlat = radius_m / _METRES_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(90.0, max(abs(min_lat), abs(max_lat)) + dlat)))
+        dlon = 360.0 if cos_lat <= 0 else dlat / cos_lat
+        found = []
+        for position in self._search_box((min_lon - dlon, min_lat - dlat, max_lon + dlon, max_lat + dlat)):
+            distance = distance_m(parse_wkt(self.wkts[position]), reference)
+            if distance <= radius_m:
+                found.append((URIRef(self.features[position]), distance))
+        return sorted(found, key = lambda item: item[1])
+
+    def within_polygon(self, geometry: Union[str, Geometry]) -> list[URIRef]:
+        ''' Returns the features lying within the polygons of a geometry (GeoSPARQL sfWithin).
+        Args:
+            geometry (str | Geometry) : The containing geometry, as a WKT literal or parsed.
+        Returns:
+            list[URIRef] : The features within the geometry.
+        '''
+        container = parse_wkt(geometry) if isinstance(geometry, str) else geometry
+        return [URIRef(self.features[position]) for position in sorted(self._search_box(_bounding_box(container)))
+                if within(parse_wkt(self.wkts[position]), container)]
+
+###########################
+# Persistance à côté de l'ABox
+
+def spatial_index_path(ABox_file: str) -> str:
+    return os.path.splitext(ABox_file)[0] + SPATIAL_INDEX_SUFFIX
+
+def _ABox_stamp(ABox_file: str) -> list[int]:
+    stat = os.stat(ABox_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _encode_strings(strings: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    # chaînes concaténées en UTF-8 et positions de leurs limites, comme les termes du graphe compilé
+    values = [string.encode('utf-8') for string in strings]
+    offsets = np.concatenate(([0], np.cumsum([len(value) for value in values], dtype = np.int64))).astype(np.int64)
+    return np.frombuffer(b''.join(values), dtype = np.uint8), offsets
+
+def _decode_strings(buffer: np.ndarray, offsets: np.ndarray) -> list[str]:
+    data = buffer.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+
+def save_spatial_index(index: SpatialIndex, ABox_file: str) -> None:
+    ''' Saves a spatial index next to the ABox it was built from (ABox.ttl → ABox.spatial.npz).
+    The index records the size and modification time of the ABox, so that a stale index is rebuilt.
+    Args:
+        index (SpatialIndex) : The spatial index.
+        ABox_file (str) : The path of the ABox.
+    '''
+    index_path = spatial_index_path(ABox_file)
+    # écriture atomique, comme pour les autres caches
+    temporary_path = f'{index_path}.{os.getpid()}.tmp.npz'
+    features, feature_offsets = _encode_strings(index.features)
+    wkts, wkt_offsets = _encode_strings(index.wkts)
+    try:
+        np.savez(temporary_path,
+                 version = np.array(_SPATIAL_INDEX_VERSION),
+                 stamp = np.array(_ABox_stamp(ABox_file), dtype = np.int64),
+                 features = features,
+                 feature_offsets = feature_offsets,
+                 wkts = wkts,
+                 wkt_offsets = wkt_offsets,
+                 **{f'level_{i}': level for i, level in enumerate(index.levels)})
+        os.replace(temporary_path, index_path)
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+def _read_spatial_index(index_path: str, stamp: list[int]) -> Optional[SpatialIndex]:
+    try:
+        with np.load(index_path, allow_pickle = False) as arrays:
+            if int(arrays['version']) != _SPATIAL_INDEX_VERSION or arrays['stamp'].tolist() != stamp:
+                return None
+            n_levels = sum(1 for name in arrays.files if name.startswith('level_'))
+            return SpatialIndex._from_arrays(_decode_strings(arrays['features'], arrays['feature_offsets']),
+                                             _decode_strings(arrays['wkts'], arrays['wkt_offsets']),
+                                             [arrays[f'level_{i}'] for i in range(n_levels)])
+    except (OSError, ValueError, KeyError):
+        return None
+
+def load_spatial_index(ABox_file: str, format: str = 'turtle') -> SpatialIndex:
+    ''' Loads the spatial index of an ABox. The index is built on the first call, from the compiled graph
+    of the ABox, and saved next to it; it is rebuilt when it is older than the ABox.
+    Args:
+        ABox_file (str) : The path of the ABox.
+        format (str) : The RDF format of the ABox, used only if it has no compiled graph.
+    Returns:
+        SpatialIndex : The spatial index of the ABox.
+    '''
+    index = _read_spatial_index(spatial_index_path(ABox_file), _ABox_stamp(ABox_file))
+    if index is None:
+        index = SpatialIndex(iter_feature_geometries(load_compiled_graph(ABox_file, format)))
+        save_spatial_index(index, ABox_file)
+    return index
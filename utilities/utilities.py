@@ -6,7 +6,9 @@ import shutil
 import inspect
 import subprocess
 import numpy as np
-from typing import Union, Optional, List
+from collections import deque
+from functools import lru_cache
+from typing import Union, Optional, List, Iterable, Iterator, Callable
 from pathlib import Path
 from datetime import datetime
 
@@ -92,6 +94,21 @@ def is_number(var) -> bool:
     except ValueError:
         return False
 
+# Regex pour couleur hex: # suivi de 3 ou 6 caractères hex
+HEX_COLOR_PATTERN = re.compile(r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$')
+
+STR_COLORS = frozenset([
+    'red', 'blue', 'green', 'yellow', 'orange', 'purple', 'pink', 'brown', 
+    'black', 'white', 'gray', 'cyan', 'magenta', 'lime', 'navy', 'teal', 
+    'olive', 'maroon', 'aqua', 'silver', 'gold', 'beige', 'tan', 'khaki', 
+    'ivory', 'coral', 'salmon', 'peach', 'lavender', 'plum', 'violet', 'indigo', 
+    'turquoise', 'mint', 'emerald', 'jade', 'forest', 'sage', 'chartreuse', 'crimson', 
+    'scarlet', 'burgundy', 'ruby', 'rose', 'fuchsia', 'mauve', 'periwinkle', 'azure', 
+    'cobalt', 'sapphire', 'amber', 'bronze', 'copper', 'cream', 'pearl', 'slate'
+])
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 def is_hex_color(var) -> bool:
     '''
     Checks wether the passed variable is an hexadecimal color
@@ -103,10 +120,8 @@ def is_hex_color(var) -> bool:
 
     if not isinstance(var, str):
         return False
-    
-    # Regex pour couleur hex: # suivi de 3 ou 6 caractères hex
-    pattern = r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$'
-    return bool(re.match(pattern, var))
+
+    return bool(HEX_COLOR_PATTERN.match(var))
 
 def is_str_color(var) -> bool:
     '''
@@ -120,17 +135,7 @@ def is_str_color(var) -> bool:
     if not isinstance(var, str):
         return False
 
-    possible_colors:list[str] = [
-        'red', 'blue', 'green', 'yellow', 'orange', 'purple', 'pink', 'brown', 
-        'black', 'white', 'gray', 'cyan', 'magenta', 'lime', 'navy', 'teal', 
-        'olive', 'maroon', 'aqua', 'silver', 'gold', 'beige', 'tan', 'khaki', 
-        'ivory', 'coral', 'salmon', 'peach', 'lavender', 'plum', 'violet', 'indigo', 
-        'turquoise', 'mint', 'emerald', 'jade', 'forest', 'sage', 'chartreuse', 'crimson', 
-        'scarlet', 'burgundy', 'ruby', 'rose', 'fuchsia', 'mauve', 'periwinkle', 'azure', 
-        'cobalt', 'sapphire', 'amber', 'bronze', 'copper', 'cream', 'pearl', 'slate'
-    ]
-
-    return var in possible_colors
+    return var in STR_COLORS
 
 def is_color(var) -> bool:
     '''
@@ -143,9 +148,49 @@ def is_color(var) -> bool:
 
     return is_hex_color(var) or is_str_color(var)
 
+DATE_FORMATS = (
+    '%Y-%m-%d',      # 2024-12-31
+    '%d/%m/%Y',      # 31/12/2024
+    '%d-%m-%Y',      # 31-12-2024
+    '%Y/%m/%d',      # 2024/12/31
+    '%d.%m.%Y',      # 31.12.2024
+    '%m/%d/%Y',      # 12/31/2024
+)
+
+# ce que chaque directive de strptime peut accepter (un peu plus large que strptime lui-même)
+_DATE_DIRECTIVE_PATTERNS = {
+    'Y': r'\d{4}', 'y': r'\d{2}', 'm': r'\d{1,2}', 'd': r' ?\d{1,2}', 'j': r'\d{1,3}',
+    'H': r'\d{1,2}', 'I': r'\d{1,2}', 'M': r'\d{1,2}', 'S': r'\d{1,2}',
+    'b': r'.+?', 'B': r'.+?', 'a': r'.+?', 'A': r'.+?', '%': '%',
+}
+
+def _date_format_pattern(format: str) -> str | None:
+    # expression régulière d'un format de date, None s'il a une directive inconnue
+    pattern = ''
+    for i, part in enumerate(format.split('%')):
+        if i > 0:
+            if not part or part[0] not in _DATE_DIRECTIVE_PATTERNS:
+                return None
+            pattern += _DATE_DIRECTIVE_PATTERNS[part[0]]
+            part = part[1:]
+        pattern += re.sub(r'\\\s+', r'\\s+', re.escape(part))
+    return pattern
+
+@lru_cache(maxsize = 64)
+def _date_patterns(formats: tuple[str, ...]) -> tuple[re.Pattern, list[tuple[str, re.Pattern | None]]]:
+    # une expression par format, et leur union qui écarte d'un coup les valeurs qui ne sont pas des dates
+    patterns = [(format, _date_format_pattern(format)) for format in formats]
+    if any(pattern is None for _, pattern in patterns):
+        combined = re.compile(r'.*', re.DOTALL)
+    else:
+        combined = re.compile('|'.join(f'(?:{pattern})' for _, pattern in patterns), re.IGNORECASE)
+    return combined, [(format, None if pattern is None else re.compile(pattern, re.IGNORECASE))
+                      for format, pattern in patterns]
+
 def is_date(var, formats=None) -> bool:
     '''
-    Checks wether the passed variable is a date
+    Checks wether the passed variable is a date.
+    Only the formats whose pattern matches the variable are tried with strptime.
     
     :param var: the variable to test
     :param formats: list of accepted formats (optional)
@@ -156,17 +201,13 @@ def is_date(var, formats=None) -> bool:
     if not isinstance(var, str):
         return False
     
-    if formats is None:
-        formats = [
-            '%Y-%m-%d',      # 2024-12-31
-            '%d/%m/%Y',      # 31/12/2024
-            '%d-%m-%Y',      # 31-12-2024
-            '%Y/%m/%d',      # 2024/12/31
-            '%d.%m.%Y',      # 31.12.2024
-            '%m/%d/%Y',      # 12/31/2024
-        ]
-    
-    for fmt in formats:
+    combined, patterns = _date_patterns(DATE_FORMATS if formats is None else tuple(formats))
+    if not combined.fullmatch(var):
+        return False
+
+    for fmt, pattern in patterns:
+        if pattern is not None and not pattern.fullmatch(var):
+            continue
         try:
             datetime.strptime(var, fmt)
             return True
@@ -175,6 +216,21 @@ def is_date(var, formats=None) -> bool:
     
     return False
 
+def are_dates(values, formats=None) -> np.ndarray:
+    '''
+    Checks which of the passed values are dates (see is_date), each distinct value once
+    
+    :param values: the values to test, e.g. a NumPy string array
+    :param formats: list of accepted formats (optional)
+    :return: A boolean array, one value per value
+    :rtype: np.ndarray
+    '''
+
+    values = np.asarray(values, dtype = str)
+    distinct, inverse = np.unique(values, return_inverse = True)
+    distinct_dates = np.array([is_date(value, formats) for value in distinct.tolist()], dtype = bool)
+    return distinct_dates[inverse].reshape(values.shape)
+
 def is_email(var) -> bool:
     '''
     Checks wether the passed variable is an email adress
@@ -186,9 +242,8 @@ def is_email(var) -> bool:
 
     if not isinstance(var, str):
         return False
-    
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, var))
+
+    return bool(EMAIL_PATTERN.match(var))
 
 def display_progress_bar(current: int, total: int, bar_length: int = 50, message: str = 'complete') -> None:
     ''' Displays a progress bar in the console.
@@ -212,6 +267,37 @@ def display_progress_bar(current: int, total: int, bar_length: int = 50, message
     if current == total:
         print()
 
+def display_progress(current: int, total: int | None, message: str = 'complete') -> None:
+    ''' Displays a progress bar in the console, or a simple counter if the total is unknown (e.g. streamed data).
+    Args:
+        current (int) : The current progress value.
+        total (int | None) : The total value for completion, if known.
+        message (str) : A message to display alongside the progression.
+    '''
+    if total is not None:
+        display_progress_bar(current, total, message = message)
+    else:
+        print(f'\r{current} {message}', end='\r')
+
+def imap_bounded(pool, func: Callable, iterable: Iterable, max_pending: int) -> Iterator:
+    ''' Like Pool.imap, but never submits more than max_pending tasks ahead of the consumer,
+    so that a lazily produced iterable is not read faster than it is processed.
+    Args:
+        pool (multiprocessing.pool.Pool) : The pool running the tasks.
+        func (Callable) : The function to apply to each item.
+        iterable (Iterable) : The items to process.
+        max_pending (int) : The maximum number of tasks submitted but not yet consumed.
+    Returns:
+        Iterator : The results, in the order of the items.
+    '''
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
 def get_current_path() -> str:
     ''' Returns the absolute path to the directory of the script that called this function.
     Returns:
@@ -301,9 +387,9 @@ def run_sparql_query(data_path: str,
         '--data', data_path,
         '--query', query_path
     ]
+    # liste d'arguments sans shell : avec shell=True, seul 'sparql' serait passé à la commande
     result = subprocess.run(
         cmd,
-        shell=True,
         capture_output=True,
         text=True
     )